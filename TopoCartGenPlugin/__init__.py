@@ -1,5 +1,4 @@
-from qgis.core import QgsApplication
-from .plugin import TopoCartGenPlugin
-
 def classFactory(iface):
-    return TopoCartGenPlugin(iface)
\ No newline at end of file
+    # Импорт откладывается, чтобы ядро и вспомогательные модули загружались без QGIS
+    from .plugin import TopoCartGenPlugin
+    return TopoCartGenPlugin(iface)
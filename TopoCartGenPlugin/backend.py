@@ -0,0 +1,75 @@
+"""Выбор ядра упрощения при импорте плагина.
+
+Предпочитается скомпилированный TopoCartGenCore; если его сборки нет для текущей
+платформы (например, Linux без собранного модуля), используется эталонное ядро
+на NumPy с тем же API. Переменная окружения TOPOCARTGEN_BACKEND=native|numpy
+позволяет выбрать ядро явно.
+"""
+import importlib
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+NATIVE = 'native'
+NUMPY = 'numpy'
+
+
+def _load_native():
+    plugin_dir = os.path.dirname(__file__)
+    if plugin_dir not in sys.path:
+        sys.path.append(plugin_dir)
+    return importlib.import_module('TopoCartGenCore')
+
+
+def _load_numpy():
+    return importlib.import_module('.numpy_core', __package__)
+
+
+_LOADERS = {
+    NATIVE: _load_native,
+    NUMPY: _load_numpy,
+}
+
+
+def load_core(name=None):
+    # Возвращает (имя ядра, модуль); без имени перебирает ядра от самого быстрого
+    if name:
+        return name, _LOADERS[name]()
+    errors = []
+    for candidate in (NATIVE, NUMPY):
+        try:
+            return candidate, _LOADERS[candidate]()
+        except ImportError as error:
+            errors.append(f"{candidate}: {error}")
+    raise ImportError("No TopoCartGenCore backend available (" + "; ".join(errors) + ")")
+
+
+BACKEND_NAME, TopoCartGenCore = load_core(os.environ.get('TOPOCARTGEN_BACKEND') or None)
+
+
+def python_executable():
+    # Внутри QGIS sys.executable указывает на qgis(.exe), дочерним процессам нужен интерпретатор
+    name = 'python.exe' if os.name == 'nt' else 'python3'
+    candidates = [
+        sys.executable,
+        os.path.join(sys.exec_prefix, name),
+        os.path.join(sys.exec_prefix, 'bin', name),
+    ]
+    for candidate in candidates:
+        if os.path.basename(candidate).lower().startswith('python') and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def create_executor(workers):
+    # Пул для параллельного стягивания частей графа; ядро на Python не отпускает GIL,
+    # поэтому используются процессы, а потоки -- только если интерпретатор не найден
+    if workers < 2:
+        return None
+    executable = python_executable()
+    if executable is None:
+        return ThreadPoolExecutor(workers)
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(executable)
+    return ProcessPoolExecutor(workers, mp_context=context)
@@ -0,0 +1,199 @@
+"""Пакетное упрощение наборов данных без интерфейса QGIS.
+
+Запуск (нужен Python из поставки QGIS):
+
+    python -m TopoCartGenPlugin.batch data/ roads.gpkg --output-directory out --ratios 0.3 0.6 --jobs 4
+
+Каждый набор данных (файл; все его слои обрабатываются вместе) упрощается в
+отдельном процессе пула. Результаты пишутся сразу в файлы каталога
+<output-directory>/<имя набора>, проект QGIS и дерево слоёв не используются,
+а предупреждения по отдельным объектам сводятся в счётчики.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .backend import python_executable
+
+# .json не входит в список: так называются stats.json и сводка самого инструмента
+DATASET_EXTENSIONS = ('.gpkg', '.shp', '.geojson', '.fgb', '.gml', '.kml', '.sqlite')
+# Разделитель полей в описании подслоя провайдера OGR (QgsDataProvider.SUBLAYER_SEPARATOR)
+SUBLAYER_SEPARATOR = '!!::!!'
+
+_application = None
+
+
+def find_datasets(paths, exclude=()):
+    # Каталоги просматриваются рекурсивно, файлы берутся как есть. Каталоги exclude
+    # (каталог результатов внутри входного) пропускаются, чтобы повторный запуск не взял
+    # собственные результаты за наборы данных
+    excluded = {os.path.realpath(path) for path in exclude}
+    datasets = []
+    for path in paths:
+        if not os.path.isdir(path):
+            datasets.append(path)
+            continue
+        for directory, subdirectories, names in os.walk(path):
+            if os.path.realpath(directory) in excluded:
+                subdirectories[:] = []
+                continue
+            datasets.extend(
+                os.path.join(directory, name) for name in sorted(names)
+                if name.lower().endswith(DATASET_EXTENSIONS)
+            )
+    return datasets
+
+
+def init_worker():
+    # Один экземпляр QgsApplication на процесс, без графического интерфейса
+    global _application
+    if _application is not None:
+        return
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+    _application = QgsApplication([], False)
+    _application.initQgis()
+    # Модуль processing, который импортирует plugin.py, лежит среди встроенных расширений
+    sys.path.append(os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins'))
+
+
+def dataset_layers(path):
+    # Источники всех векторных слоёв файла: многослойные форматы раскрываются по layername
+    from qgis.core import QgsVectorLayer
+    layer = QgsVectorLayer(path, os.path.basename(path), 'ogr')
+    if not layer.isValid():
+        return []
+    sublayers = layer.dataProvider().subLayers()
+    if len(sublayers) < 2:
+        return [path]
+    return [f"{path}|layername={sublayer.split(SUBLAYER_SEPARATOR)[1]}" for sublayer in sublayers]
+
+
+def process_dataset(path, output_directory, options):
+    from qgis.core import QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback
+    from .plugin import GraphProcessorPlugin
+
+    class Feedback(QgsProcessingFeedback):
+        # Сохраняются только предупреждения уровня набора данных; сводка по объектам приходит одной строкой
+        def __init__(self):
+            super().__init__()
+            self.warnings = []
+
+        def pushWarning(self, warning):
+            self.warnings.append(warning)
+
+        def reportError(self, error, fatalError=False):
+            self.warnings.append(error)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    result = {'dataset': path, 'output_directory': os.path.join(output_directory, name)}
+    layers = dataset_layers(path)
+    if not layers:
+        result['error'] = "no vector layers"
+        return result
+
+    algorithm = GraphProcessorPlugin()
+    algorithm.initAlgorithm()
+    parameters = dict(options, INPUT=layers, OUTPUT_DIRECTORY=result['output_directory'], HEADLESS=True)
+    if parameters.pop('STATS_FILE', False):
+        parameters['STATS_FILE'] = os.path.join(result['output_directory'], 'stats.json')
+    feedback = Feedback()
+    start = time.perf_counter()
+    try:
+        result['outputs'] = algorithm.processAlgorithm(parameters, QgsProcessingContext(), feedback)
+    except QgsProcessingException as error:
+        result['error'] = str(error)
+    except Exception as error:
+        # Ошибка одного набора (ядро, провайдер, нехватка памяти) не останавливает остальные
+        result['error'] = describe_error(error)
+    result['seconds'] = time.perf_counter() - start
+    result['warnings'] = feedback.warnings
+    return result
+
+
+def describe_error(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def _run(path, output_directory, options):
+    try:
+        init_worker()
+        return process_dataset(path, output_directory, options)
+    except Exception as error:
+        return {'dataset': path, 'error': describe_error(error)}
+
+
+def run_batch(datasets, output_directory, options, jobs=1):
+    # Результаты в порядке завершения; при jobs = 1 всё выполняется в текущем процессе
+    if jobs < 2 or len(datasets) < 2:
+        for path in datasets:
+            yield _run(path, output_directory, options)
+        return
+    context = multiprocessing.get_context('spawn')
+    executable = python_executable()
+    if executable is not None:
+        context.set_executable(executable)
+    with ProcessPoolExecutor(min(jobs, len(datasets)), mp_context=context) as executor:
+        futures = {executor.submit(_run, path, output_directory, options): path for path in datasets}
+        for future in as_completed(futures):
+            # Упавший процесс пула (BrokenProcessPool) отмечается ошибкой у каждого своего набора
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {'dataset': futures[future], 'error': describe_error(error)}
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless TopoCartGen simplification of many datasets")
+    parser.add_argument('inputs', nargs='+', help="dataset files or directories")
+    parser.add_argument('--output-directory', required=True)
+    parser.add_argument('--ratios', nargs='+', type=float, default=[0.5])
+    parser.add_argument('--tolerance', type=float, default=0.0, help="maximum vertex displacement, map units")
+    parser.add_argument('--budgets', default='', help='vertex budgets per layer, "layer=vertices" comma separated')
+    parser.add_argument('--format', choices=['gpkg', 'fgb'], default='gpkg')
+    parser.add_argument('--tile-size', type=float, default=0.0)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--cache-directory', default='')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="datasets processed in parallel")
+    parser.add_argument('--core-workers', type=int, default=1, help="core worker processes per dataset")
+    parser.add_argument('--stats', action='store_true', help="write stats.json next to each result")
+    parser.add_argument('--summary', help="JSON file for the per-dataset summary")
+    args = parser.parse_args(argv)
+
+    datasets = find_datasets(args.inputs, [args.output_directory])
+    if not datasets:
+        parser.error("no datasets found")
+    options = {
+        'RATIO': args.ratios[0],
+        'LEVELS': ', '.join(f"{ratio:g}" for ratio in args.ratios),
+        'TOLERANCE': args.tolerance,
+        'VERTEX_BUDGETS': args.budgets,
+        'OUTPUT_FORMAT': ['gpkg', 'fgb'].index(args.format),
+        'TILE_SIZE': args.tile_size,
+        'BATCH_SIZE': args.batch_size,
+        'CACHE_DIRECTORY': args.cache_directory,
+        'WORKERS': args.core_workers,
+        'STATS_FILE': args.stats,
+    }
+
+    results = []
+    for result in run_batch(datasets, args.output_directory, options, args.jobs):
+        results.append(result)
+        if 'error' in result:
+            print(f"{result['dataset']}: failed ({result['error']})", file=sys.stderr)
+        else:
+            print(f"{result['dataset']}: {len(result['outputs'])} layers written in {result['seconds']:.1f} s, "
+                  f"{len(result['warnings'])} warnings", file=sys.stderr)
+    if args.summary:
+        with open(args.summary, 'w') as summary:
+            json.dump(results, summary, indent=2)
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,451 @@
+import struct
+
+import numpy as np
+
+# Типы геометрии слоя в буферах
+POINT = 0
+LINE = 1
+POLYGON = 2
+
+# Базовые коды WKB
+_WKB_POINT = 1
+_WKB_LINESTRING = 2
+_WKB_POLYGON = 3
+_WKB_MULTIPOINT = 4
+_WKB_MULTILINESTRING = 5
+_WKB_MULTIPOLYGON = 6
+
+# Флаги размерности EWKB
+_EWKB_Z = 0x80000000
+_EWKB_M = 0x40000000
+_EWKB_SRID = 0x20000000
+
+
+def _as_array(data, dtype):
+    # Буферный протокол (memoryview, array.array, bytes) читается без копирования
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return np.frombuffer(data, dtype=dtype)
+    return np.asarray(data, dtype=dtype)
+
+
+class FeatureBuffer:
+    """Плоское представление объектов одного слоя.
+
+    coords          -- (N, 2) float64, все вершины слоя подряд
+    ring_offsets    -- начало каждого кольца (части линии, точки) в coords, длина = колец + 1
+    part_offsets    -- начало каждой части в ring_offsets, длина = частей + 1
+    feature_offsets -- начало каждого объекта в part_offsets, длина = объектов + 1
+    feature_ids     -- идентификаторы объектов (int64)
+    """
+
+    __slots__ = ('layer_id', 'geometry_type', 'coords', 'ring_offsets',
+                 'part_offsets', 'feature_offsets', 'feature_ids')
+
+    def __init__(self, layer_id, geometry_type, coords, ring_offsets, part_offsets, feature_offsets, feature_ids):
+        self.layer_id = layer_id
+        self.geometry_type = geometry_type
+        self.coords = _as_array(coords, np.float64).reshape(-1, 2)
+        self.ring_offsets = _as_array(ring_offsets, np.int64)
+        self.part_offsets = _as_array(part_offsets, np.int64)
+        self.feature_offsets = _as_array(feature_offsets, np.int64)
+        self.feature_ids = _as_array(feature_ids, np.int64)
+
+    @property
+    def is_polygon(self):
+        return self.geometry_type == POLYGON
+
+    @property
+    def feature_count(self):
+        return len(self.feature_ids)
+
+    @property
+    def vertex_count(self):
+        return len(self.coords)
+
+    def feature_rings(self, index):
+        # Кольца объекта в виде срезов координат
+        first_part = self.part_offsets[self.feature_offsets[index]]
+        last_part = self.part_offsets[self.feature_offsets[index + 1]]
+        for ring in range(first_part, last_part):
+            yield self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+
+    def feature_vertex_range(self, index):
+        first_ring = self.part_offsets[self.feature_offsets[index]]
+        last_ring = self.part_offsets[self.feature_offsets[index + 1]]
+        return int(self.ring_offsets[first_ring]), int(self.ring_offsets[last_ring])
+
+    def feature_vertex_counts(self):
+        # Число вершин каждого объекта без цикла по объектам
+        vertex_starts = self.ring_offsets[self.part_offsets[self.feature_offsets]]
+        return np.diff(vertex_starts)
+
+    def ring_sizes(self):
+        return np.diff(self.ring_offsets)
+
+
+class FeatureBufferBuilder:
+    """Собирает FeatureBuffer из WKB объектов слоя."""
+
+    def __init__(self, layer_id, geometry_type):
+        self.layer_id = layer_id
+        self.geometry_type = geometry_type
+        self._coords = []
+        self._ring_sizes = []
+        self._part_sizes = []
+        self._feature_sizes = []
+        self._feature_ids = []
+
+    def __len__(self):
+        return len(self._feature_ids)
+
+    def add_wkb(self, feature_id, wkb):
+        parts = []
+        _read_geometry(memoryview(wkb), 0, parts)
+        return self.add_parts(feature_id, parts)
+
+    def add_parts(self, feature_id, parts):
+        # parts -- список частей, часть -- список колец в виде массивов (N, 2)
+        if not parts:
+            return 0
+        vertex_count = 0
+        for rings in parts:
+            for ring in rings:
+                self._coords.append(ring)
+                self._ring_sizes.append(len(ring))
+                vertex_count += len(ring)
+            self._part_sizes.append(len(rings))
+        self._feature_sizes.append(len(parts))
+        self._feature_ids.append(feature_id)
+        return vertex_count
+
+    def build(self):
+        if self._coords:
+            coords = np.concatenate(self._coords)
+        else:
+            coords = np.empty((0, 2), dtype=np.float64)
+        buffer = FeatureBuffer(
+            self.layer_id,
+            self.geometry_type,
+            coords,
+            _offsets(self._ring_sizes),
+            _offsets(self._part_sizes),
+            _offsets(self._feature_sizes),
+            np.asarray(self._feature_ids, dtype=np.int64)
+        )
+        return buffer
+
+
+def select_features(buffer, mask):
+    # Буфер только с объектами, отмеченными в mask, без цикла по объектам
+    features = np.flatnonzero(mask)
+    parts = _ranges(buffer.feature_offsets, features)
+    rings = _ranges(buffer.part_offsets, parts)
+    vertices = _ranges(buffer.ring_offsets, rings)
+    return FeatureBuffer(
+        buffer.layer_id,
+        buffer.geometry_type,
+        buffer.coords[vertices],
+        _offsets(np.diff(buffer.ring_offsets)[rings].tolist()),
+        _offsets(np.diff(buffer.part_offsets)[parts].tolist()),
+        _offsets(np.diff(buffer.feature_offsets)[features].tolist()),
+        buffer.feature_ids[features]
+    )
+
+
+def _ranges(offsets, items):
+    # Номера элементов следующего уровня (частей, колец, вершин) для выбранных items подряд
+    starts = offsets[items]
+    counts = offsets[items + 1] - starts
+    first = np.cumsum(counts) - counts
+    return np.repeat(starts - first, counts) + np.arange(counts.sum(), dtype=np.int64)
+
+
+def _offsets(sizes):
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    if sizes:
+        np.cumsum(sizes, out=offsets[1:])
+    return offsets
+
+
+def _read_header(data, offset):
+    byte_order = '<' if data[offset] == 1 else '>'
+    code, = struct.unpack_from(byte_order + 'I', data, offset + 1)
+    offset += 5
+    dims = 2
+    if code & (_EWKB_Z | _EWKB_M | _EWKB_SRID):
+        dims += bool(code & _EWKB_Z) + bool(code & _EWKB_M)
+        if code & _EWKB_SRID:
+            offset += 4
+        code &= 0xFFFF
+    else:
+        group = code // 1000
+        dims += {0: 0, 1: 1, 2: 1, 3: 2}.get(group, 0)
+        code %= 1000
+    return byte_order, code, dims, offset
+
+
+def _read_points(data, offset, byte_order, dims, count):
+    # Координаты берутся срезом без копирования, Z/M отбрасываются
+    values = np.frombuffer(data, dtype=byte_order + 'f8', count=count * dims, offset=offset)
+    return values.reshape(count, dims)[:, :2], offset + 8 * dims * count
+
+
+def _read_geometry(data, offset, parts):
+    byte_order, code, dims, offset = _read_header(data, offset)
+    if code == _WKB_POINT:
+        points, offset = _read_points(data, offset, byte_order, dims, 1)
+        if not np.isnan(points).any():
+            parts.append([points])
+    elif code == _WKB_LINESTRING:
+        count, = struct.unpack_from(byte_order + 'I', data, offset)
+        points, offset = _read_points(data, offset + 4, byte_order, dims, count)
+        if count:
+            parts.append([points])
+    elif code == _WKB_POLYGON:
+        ring_count, = struct.unpack_from(byte_order + 'I', data, offset)
+        offset += 4
+        rings = []
+        for _ in range(ring_count):
+            count, = struct.unpack_from(byte_order + 'I', data, offset)
+            points, offset = _read_points(data, offset + 4, byte_order, dims, count)
+            rings.append(points)
+        if rings:
+            parts.append(rings)
+    elif code in (_WKB_MULTIPOINT, _WKB_MULTILINESTRING, _WKB_MULTIPOLYGON):
+        part_count, = struct.unpack_from(byte_order + 'I', data, offset)
+        offset += 4
+        for _ in range(part_count):
+            offset = _read_geometry(data, offset, parts)
+    else:
+        raise ValueError(f"Unsupported WKB geometry type: {code}")
+    return offset
+
+
+def encode_wkb(buffer, index):
+    # Объект буфера в виде Multi* WKB (little endian)
+    chunks = []
+    first_part = buffer.feature_offsets[index]
+    last_part = buffer.feature_offsets[index + 1]
+    coords = buffer.coords
+    ring_offsets = buffer.ring_offsets
+    part_offsets = buffer.part_offsets
+
+    if buffer.geometry_type == POLYGON:
+        chunks.append(struct.pack('<BII', 1, _WKB_MULTIPOLYGON, last_part - first_part))
+        for part in range(first_part, last_part):
+            rings = range(part_offsets[part], part_offsets[part + 1])
+            chunks.append(struct.pack('<BII', 1, _WKB_POLYGON, len(rings)))
+            for ring in rings:
+                start, end = ring_offsets[ring], ring_offsets[ring + 1]
+                chunks.append(struct.pack('<I', end - start))
+                chunks.append(np.ascontiguousarray(coords[start:end], dtype='<f8').tobytes())
+    elif buffer.geometry_type == LINE:
+        chunks.append(struct.pack('<BII', 1, _WKB_MULTILINESTRING, last_part - first_part))
+        for part in range(first_part, last_part):
+            for ring in range(part_offsets[part], part_offsets[part + 1]):
+                start, end = ring_offsets[ring], ring_offsets[ring + 1]
+                chunks.append(struct.pack('<BII', 1, _WKB_LINESTRING, end - start))
+                chunks.append(np.ascontiguousarray(coords[start:end], dtype='<f8').tobytes())
+    else:
+        start = ring_offsets[part_offsets[first_part]]
+        end = ring_offsets[part_offsets[last_part]]
+        chunks.append(struct.pack('<BII', 1, _WKB_MULTIPOINT, end - start))
+        for x, y in coords[start:end].tolist():
+            chunks.append(struct.pack('<BIdd', 1, _WKB_POINT, x, y))
+    return b''.join(chunks)
+
+
+def changed_features(before, after):
+    # Маска объектов after, геометрия которых отличается от объекта before с тем же ID
+    # (число или координаты вершин). Объекты сопоставляются по feature_ids: ядро может вернуть
+    # их в другом порядке или не все; объект без пары в before (или без before) считается изменённым
+    changed = np.ones(after.feature_count, dtype=bool)
+    if before is None or not before.feature_count or not after.feature_count:
+        return changed
+    if np.array_equal(before.feature_ids, after.feature_ids):
+        matched = np.arange(after.feature_count)
+        found = np.ones(after.feature_count, dtype=bool)
+    else:
+        order = np.argsort(before.feature_ids, kind='stable')
+        positions = np.minimum(np.searchsorted(before.feature_ids[order], after.feature_ids), len(order) - 1)
+        matched = order[positions]
+        found = before.feature_ids[matched] == after.feature_ids
+
+    starts_before = before.ring_offsets[before.part_offsets[before.feature_offsets]]
+    starts_after = after.ring_offsets[after.part_offsets[after.feature_offsets]]
+    counts = np.diff(starts_before)[matched]
+    same = np.flatnonzero(found & (counts == np.diff(starts_after)))
+    changed[same] = False
+    same = same[counts[same] > 0]
+    if not len(same):
+        return changed
+    same_counts = counts[same]
+    first = np.cumsum(same_counts) - same_counts
+    relative = np.arange(same_counts.sum()) - np.repeat(first, same_counts)
+    index_before = np.repeat(starts_before[matched[same]], same_counts) + relative
+    index_after = np.repeat(starts_after[same], same_counts) + relative
+    differs = (before.coords[index_before] != after.coords[index_after]).any(axis=1)
+    changed[same] = np.add.reduceat(differs, first) > 0
+    return changed
+
+
+def _point_keys(coords):
+    # Вершина как одно комплексное число: сравнение и поиск по обеим координатам сразу
+    return coords[:, 0] + 1j * coords[:, 1]
+
+
+def conform_to_targets(buffer, neighbors, targets):
+    # Вершины объектов buffer, общие с исходными соседями (neighbors), но удалённые из их
+    # упрощённых версий в целевом слое (targets), отбрасываются. Общие границы становятся
+    # подпоследовательностью исходных -- той же, что у соседей в целевом слое, и после заморозки
+    # целевых геометрий совпадают с ними без разрывов и наложений
+    if buffer.geometry_type == POINT or not buffer.vertex_count:
+        return buffer
+    neighbor_keys = [_point_keys(b.coords) for b in neighbors if b.vertex_count]
+    if not neighbor_keys:
+        return buffer
+    neighbor_keys = np.concatenate(neighbor_keys)
+    target_keys = [_point_keys(b.coords) for b in targets if b.vertex_count]
+    target_keys = np.concatenate(target_keys) if target_keys else np.empty(0, dtype=complex)
+    # Вершины пересечений, добавленные при упрощении целевого слоя, вставляются в отрезки объектов
+    inserted = np.unique(target_keys[~np.isin(target_keys, neighbor_keys)])
+    if len(inserted):
+        buffer = _insert_vertices(buffer, np.column_stack((inserted.real, inserted.imag)))
+    keys = _point_keys(buffer.coords)
+    drop = np.isin(keys, neighbor_keys) & ~np.isin(keys, target_keys)
+    if not drop.any():
+        return buffer
+
+    min_size = 4 if buffer.is_polygon else 2
+    ring_offsets = buffer.ring_offsets
+    affected = set((np.searchsorted(ring_offsets, np.flatnonzero(drop), side='right') - 1).tolist())
+    indices = []
+    sizes = np.diff(ring_offsets)
+    for ring in range(len(sizes)):
+        start, end = int(ring_offsets[ring]), int(ring_offsets[ring + 1])
+        kept = np.arange(start, end)
+        if ring in affected:
+            if buffer.is_polygon:
+                # Замыкающая вершина повторяет первую оставшуюся, порядок обхода сохраняется
+                kept = kept[:-1][~drop[start:end - 1]]
+                kept = np.append(kept, kept[:1])
+            else:
+                kept = kept[~drop[start:end]]
+            if len(kept) < min_size:
+                kept = np.arange(start, end)
+        indices.append(kept)
+        sizes[ring] = len(kept)
+    return FeatureBuffer(buffer.layer_id, buffer.geometry_type, buffer.coords[np.concatenate(indices)],
+                         _offsets(sizes.tolist()), buffer.part_offsets, buffer.feature_offsets, buffer.feature_ids)
+
+
+def _insert_vertices(buffer, points):
+    # Точки, лежащие внутри отрезков колец, вставляются в эти отрезки по порядку обхода
+    coords = buffer.coords
+    starts, ends = coords[:-1], coords[1:]
+    segments = np.ones(len(starts), dtype=bool)
+    segments[buffer.ring_offsets[1:-1] - 1] = False
+    vectors = ends - starts
+    lengths = np.einsum('ij,ij->i', vectors, vectors)
+    segments &= lengths > 0
+    scale = max(1.0, float(np.abs(coords).max()))
+    positions, params, found = [], [], []
+    for point in points:
+        offsets = point - starts
+        t = np.einsum('ij,ij->i', offsets, vectors) / np.where(lengths > 0, lengths, 1.0)
+        cross = np.abs(offsets[:, 0] * vectors[:, 1] - offsets[:, 1] * vectors[:, 0])
+        hits = np.flatnonzero(segments & (t > 0) & (t < 1) & (cross <= 1e-9 * scale * np.sqrt(lengths)))
+        positions.extend(hits + 1)
+        params.extend(t[hits])
+        found.extend([point] * len(hits))
+    if not positions:
+        return buffer
+    order = np.lexsort((params, positions))
+    positions = np.asarray(positions, dtype=np.int64)[order]
+    ring_offsets = buffer.ring_offsets + np.searchsorted(positions, buffer.ring_offsets, side='left')
+    return FeatureBuffer(buffer.layer_id, buffer.geometry_type,
+                         np.insert(coords, positions, np.asarray(found)[order], axis=0),
+                         ring_offsets, buffer.part_offsets, buffer.feature_offsets, buffer.feature_ids)
+
+
+def to_point_features(buffers, point_type):
+    # Совместимость с ядром, которое принимает только списки Point:
+    # все кольца объекта передаются одной последовательностью, как раньше
+    features = []
+    for buffer in buffers:
+        for index in range(buffer.feature_count):
+            start, end = buffer.feature_vertex_range(index)
+            points = [point_type(x, y) for x, y in buffer.coords[start:end].tolist()]
+            features.append((buffer.layer_id, int(buffer.feature_ids[index]), buffer.is_polygon, points))
+    return features
+
+
+def from_point_features(features, buffers):
+    # Обратное преобразование результата ядра: одна часть и одно кольцо на объект
+    geometry_types = {buffer.layer_id: buffer.geometry_type for buffer in buffers}
+    builders = {}
+    for layer_id, feature_id, is_polygon, points in features:
+        builder = builders.get(layer_id)
+        if builder is None:
+            geometry_type = geometry_types.get(layer_id, POLYGON if is_polygon else LINE)
+            builder = builders[layer_id] = _PointListBuilder(layer_id, geometry_type)
+        coords = [(p.getX(), p.getY()) for p in points]
+        # Ядро может вернуть кольцо полигона без замыкающей вершины. Как и раньше, замыкаются
+        # только кольца из 4 и более точек: более короткие плагин заменяет исходной геометрией
+        if builder.geometry_type == POLYGON and len(coords) >= 4 and coords[0] != coords[-1]:
+            coords.append(coords[0])
+        builder.add(feature_id, coords)
+    return [builder.build() for builder in builders.values()]
+
+
+class _PointListBuilder:
+    def __init__(self, layer_id, geometry_type):
+        self.layer_id = layer_id
+        self.geometry_type = geometry_type
+        self.coords = []
+        self.sizes = []
+        self.feature_ids = []
+
+    def add(self, feature_id, coords):
+        self.coords.extend(coords)
+        self.sizes.append(len(coords))
+        self.feature_ids.append(feature_id)
+
+    def build(self):
+        count = len(self.feature_ids)
+        return FeatureBuffer(
+            self.layer_id,
+            self.geometry_type,
+            np.asarray(self.coords, dtype=np.float64).reshape(-1, 2),
+            _offsets(self.sizes),
+            np.arange(count + 1, dtype=np.int64),
+            np.arange(count + 1, dtype=np.int64),
+            np.asarray(self.feature_ids, dtype=np.int64)
+        )
+
+
+def process_buffers(core, graph, buffers, ratio, frozen=(), extent=None):
+    # Ядро с поддержкой буферов получает массивы напрямую, иначе используется старый путь через Point
+    if frozen or extent is not None:
+        if not getattr(core, 'SUPPORTS_FROZEN', False):
+            raise ValueError("TopoCartGenCore backend does not support frozen features")
+        return graph.processFeatures(buffers, ratio, frozen, extent)
+    if getattr(core, 'SUPPORTS_BUFFERS', False):
+        return graph.processFeatures(buffers, ratio)
+    simplified = graph.processFeatures(to_point_features(buffers, core.Point), ratio)
+    return from_point_features(simplified, buffers)
+
+
+def process_buffer_levels(core, graph, buffers, ratios, frozen=(), extent=None, noded=None):
+    # Несколько уровней упрощения: ядро с историей стягивания строит граф один раз,
+    # иначе граф перестраивается для каждого коэффициента.
+    # noded -- сохранённый граф после поиска пересечений (см. graph_cache)
+    if getattr(core, 'SUPPORTS_LEVELS', False):
+        if noded is not None:
+            return graph.processFeatureLevels(buffers, ratios, frozen, extent, noded)
+        return graph.processFeatureLevels(buffers, ratios, frozen, extent)
+    levels = []
+    for ratio in ratios:
+        graph.clear()
+        levels.append(process_buffers(core, graph, buffers, ratio, frozen, extent))
+    return levels
@@ -0,0 +1,120 @@
+"""Кэш графов после поиска пересечений на диске.
+
+Запись кэша -- каталог с массивами .npy, которые при чтении отображаются в память.
+Ключ -- хэш содержимого буферов (координаты и кольца всех объектов, включая
+замороженные), поэтому любое изменение исходных данных даёт новую запись.
+Когда общий размер кэша превышает предел, удаляются давно не использованные записи.
+"""
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+# Меняется при изменении формата записи или правил построения графа
+FORMAT_VERSION = 1
+
+# Массивы графа после поиска пересечений (Graph.nodedState), без которых запись неполна
+STATE_ARRAYS = ('coords', 'ring_ids', 'ring_offsets', 'ring_closed')
+
+
+def valid_state(state):
+    # Все массивы на месте и согласованы по размерам (запись могла быть удалена не до конца)
+    if any(name not in state for name in STATE_ARRAYS):
+        return False
+    coords, ring_ids = state['coords'], state['ring_ids']
+    ring_offsets, ring_closed = state['ring_offsets'], state['ring_closed']
+    if coords.ndim != 2 or coords.shape[1] != 2 or ring_ids.ndim != 1 or ring_closed.ndim != 1:
+        return False
+    if ring_offsets.shape != (len(ring_closed) + 1,) or ring_offsets[-1] != len(ring_ids):
+        return False
+    return not len(ring_ids) or 0 <= ring_ids.min() and ring_ids.max() < len(coords)
+
+
+def graph_key(backend_name, buffers, frozen=()):
+    digest = hashlib.sha256(f"{backend_name}:{FORMAT_VERSION}".encode())
+    for group, items in (('buffer', buffers), ('frozen', frozen)):
+        for buffer in items:
+            digest.update(f"{group}:{buffer.geometry_type}:{buffer.vertex_count}:{len(buffer.ring_offsets)}".encode())
+            digest.update(memoryview(np.ascontiguousarray(buffer.coords)))
+            digest.update(memoryview(np.ascontiguousarray(buffer.ring_offsets)))
+    return digest.hexdigest()
+
+
+class GraphCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        path = self.path(key)
+        if not os.path.isdir(path):
+            self.misses += 1
+            return None
+        try:
+            state = {
+                name[:-4]: np.load(os.path.join(path, name), mmap_mode='r')
+                for name in os.listdir(path) if name.endswith('.npy')
+            }
+            valid = valid_state(state)
+            if valid:
+                # Время изменения каталога служит отметкой последнего использования
+                os.utime(path)
+        except (OSError, ValueError):
+            state, valid = None, False
+        if not valid:
+            # Повреждённая запись удаляется, чтобы store() смог записать её заново
+            state = None
+            shutil.rmtree(path, ignore_errors=True)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return state
+
+    def store(self, key, state):
+        path = self.path(key)
+        if os.path.isdir(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Запись во временный каталог и переименование: прерванная запись не попадает в кэш
+        temporary = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(temporary, exist_ok=True)
+        try:
+            for name, array in state.items():
+                np.save(os.path.join(temporary, f"{name}.npy"), np.ascontiguousarray(array))
+            os.replace(temporary, path)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        self.evict(keep=key)
+
+    def entries(self):
+        # (время использования, размер, ключ) для каждой записи
+        result = []
+        for key in os.listdir(self.directory):
+            path = self.path(key)
+            if key.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            result.append((os.path.getmtime(path), size, key))
+        return result
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            # Файлы, открытые через mmap, в Windows удалить нельзя -- запись остаётся до следующего раза
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            if not os.path.isdir(self.path(key)):
+                total -= size
+        return total
@@ -0,0 +1,1642 @@
+"""Эталонная реализация TopoCartGenCore на NumPy.
+
+Повторяет API скомпилированного ядра (Point, Graph.processFeatures) и его правила
+стягивания рёбер между вершинами степени 2 с проверкой топологии. Используется,
+когда собранное ядро недоступно на платформе.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .buffers import FeatureBuffer, LINE, POLYGON
+
+SUPPORTS_BUFFERS = True
+SUPPORTS_FROZEN = True
+SUPPORTS_PARALLEL = True
+SUPPORTS_PROGRESS = True
+SUPPORTS_LEVELS = True
+SUPPORTS_NODED_CACHE = True
+SUPPORTS_TOPOLOGY = True
+SUPPORTS_MEMORY_REPORT = True
+SUPPORTS_NODING_STRATEGY = True
+SUPPORTS_STOPPING = True
+
+# Способы поиска пересечений: построчный проход по отсортированным сегментам
+# и пакетная векторная проверка пар-кандидатов (результат одинаковый)
+NODING_SWEEP = 'sweep'
+NODING_BATCHED = 'batched'
+NODING_STRATEGIES = (NODING_SWEEP, NODING_BATCHED)
+
+# Наибольшее число пар-кандидатов в одном пакете
+_PAIR_BATCH = 1 << 18
+
+# Этапы, о которых ядро сообщает через callback прогресса
+PHASE_INTERSECTIONS = 'intersections'
+PHASE_HEAP = 'heap'
+PHASE_CONTRACTION = 'contraction'
+
+# Через сколько итераций цикла проверяется отмена и сообщается прогресс
+_POLL_INTERVAL = 4096
+
+# Пиковая память ядра на вершину входных данных сверх самих буферов, байт. Замерено
+# tracemalloc на наборах benchmarks (300-650 байт), с запасом; больше всего занимает куча рёбер
+_BYTES_PER_VERTEX = 700
+
+# Уровень журнала для сообщений о каждом ребре; ниже DEBUG, по умолчанию выключен
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+logger = logging.getLogger(__name__)
+
+# Причины отказа в стягивании ребра
+REJECT_STALE = 'stale'
+REJECT_INACTIVE = 'inactive'
+REJECT_DEGREE = 'not_degree_2'
+REJECT_LOCKED = 'locked'
+REJECT_JUNCTION = 'junction'
+REJECT_COMMON_NEIGHBOR = 'common_neighbor'
+REJECT_NOT_ADJACENT = 'not_adjacent'
+REJECT_OUTSIDE = 'outside_extent'
+REJECT_RING_SIZE = 'ring_minimum'
+REJECT_TOPOLOGY = 'topology'
+REJECT_BUDGET = 'budget'
+REJECT_TOLERANCE = 'tolerance'
+
+
+class SimplificationStats:
+    """Счётчики и время этапов последнего запуска Graph.
+
+    Стягивание выполняется до наибольшего коэффициента или до пределов остановки
+    (история для всех коэффициентов), поэтому счётчики рёбер относятся ко всей
+    истории, а vertices_removed -- к последнему коэффициенту. Время стягивания
+    из нескольких процессов суммируется.
+    """
+
+    def __init__(self):
+        self.counters = {
+            'vertices': 0,
+            'edges': 0,
+            'intersections': 0,
+            'arcs': 0,
+            'shared_arcs': 0,
+            'edges_considered': 0,
+            'edges_contracted': 0,
+            'edges_rescored': 0,
+            'vertices_removed': 0,
+        }
+        self.rejected = {}
+        self.timings = {
+            'build': 0.0,
+            'noding': 0.0,
+            'arcs': 0.0,
+            'heap_init': 0.0,
+            'contraction': 0.0,
+            'topology_checks': 0.0,
+        }
+
+    def add_contraction(self, considered, contracted, rescored, rejected, topology_seconds):
+        self.counters['edges_considered'] += considered
+        self.counters['edges_contracted'] += contracted
+        self.counters['edges_rescored'] += rescored
+        for reason, count in rejected.items():
+            self.rejected[reason] = self.rejected.get(reason, 0) + count
+        self.timings['topology_checks'] += topology_seconds
+
+    def as_dict(self):
+        return {
+            'counters': dict(self.counters),
+            'rejected': dict(self.rejected),
+            'timings': dict(self.timings),
+        }
+
+
+class OperationCanceled(Exception):
+    pass
+
+
+class CancellationToken:
+    # Флаг отмены; cancel() можно вызывать из другого потока (например, из сигнала QGIS)
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def isCanceled(self):
+        return self._event.is_set()
+
+
+class Point:
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = float(x)
+        self.y = float(y)
+
+    def getX(self):
+        return self.x
+
+    def getY(self):
+        return self.y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __repr__(self):
+        return f"Point({self.x}, {self.y})"
+
+
+def _typed(values, typecode):
+    # Плотный array.array из массива NumPy: 8 байт на элемент вместо объекта Python в списке
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values, dtype=np.float64 if typecode == 'd' else np.int64).tobytes())
+    return result
+
+
+def _displacement(xs, ys, v, p, q):
+    # Расстояние от вершины v до отрезка p-q, который её заменит
+    vx, vy = xs[v], ys[v]
+    px, py = xs[p], ys[p]
+    qx, qy = xs[q], ys[q]
+    dx = qx - px
+    dy = qy - py
+    length = dx * dx + dy * dy
+    if length == 0.0:
+        return math.hypot(vx - px, vy - py)
+    t = min(1.0, max(0.0, ((vx - px) * dx + (vy - py) * dy) / length))
+    return math.hypot(vx - px - t * dx, vy - py - t * dy)
+
+
+def _displacements(coords, v, p, q):
+    # Векторный вариант _displacement для массивов вершин
+    pv = coords[v] - coords[p]
+    pq = coords[q] - coords[p]
+    length = np.einsum('ij,ij->i', pq, pq)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length > 0.0, np.einsum('ij,ij->i', pv, pq) / length, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(pv[:, 0] - t * pq[:, 0], pv[:, 1] - t * pq[:, 1])
+
+
+def _cross(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+class _VertexGrid:
+    """Равномерная сетка вершин для проверки пустоты треугольника при стягивании.
+
+    Вершины хранятся отсортированными по ячейкам (CSR): ячейки одного столбца идут
+    подряд, поэтому диапазон строк столбца -- один срез.
+    """
+
+    def __init__(self, coords):
+        if len(coords):
+            self.origin = coords.min(axis=0)
+            extent = float((coords.max(axis=0) - self.origin).max())
+        else:
+            self.origin = np.zeros(2)
+            extent = 1.0
+        self.cell = max(extent / math.sqrt(max(len(coords), 1)), 1e-12)
+        cells = np.floor((coords - self.origin) / self.cell).astype(np.int64)
+        self.columns = int(cells[:, 0].max()) + 1 if len(coords) else 1
+        self.rows = int(cells[:, 1].max()) + 1 if len(coords) else 1
+        keys = cells[:, 0] * self.rows + cells[:, 1]
+        offsets = np.zeros(self.columns * self.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.columns * self.rows), out=offsets[1:])
+        self.offsets = _typed(offsets, 'q')
+        self.order = _typed(np.argsort(keys, kind='stable'), 'q')
+        self.origin_x, self.origin_y = float(self.origin[0]), float(self.origin[1])
+
+    def query(self, xmin, ymin, xmax, ymax):
+        x0 = int((xmin - self.origin_x) // self.cell)
+        x1 = int((xmax - self.origin_x) // self.cell)
+        y0 = max(int((ymin - self.origin_y) // self.cell), 0)
+        y1 = min(int((ymax - self.origin_y) // self.cell), self.rows - 1)
+        if y0 > y1:
+            return
+        offsets = self.offsets
+        for cx in range(max(x0, 0), min(x1, self.columns - 1) + 1):
+            base = cx * self.rows
+            start = offsets[base + y0]
+            end = offsets[base + y1 + 1]
+            if start < end:
+                yield from self.order[start:end]
+
+
+def _parameter(x0, y0, x1, y1, px, py):
+    # Положение проекции точки на отрезке: 0 -- начало, 1 -- конец
+    dx = x1 - x0
+    dy = y1 - y0
+    return ((px - x0) * dx + (py - y0) * dy) / (dx * dx + dy * dy)
+
+
+def _strip_of(y, low, height, strips):
+    return np.minimum(((y - low) / height).astype(np.int64), strips - 1)
+
+
+def _intersection_batch(task):
+    """Пересечения сегментов для части записей полос.
+
+    Записи одной полосы упорядочены по xmin; кандидаты записи -- следующие за ней
+    записи полосы до upper с пересекающимся по y охватом, как в построчном проходе.
+    Пара учитывается только в полосе, где лежит больший из двух ymin, поэтому
+    каждая пара проверяется один раз. Позиции сегментов в сортировке по xmin
+    возвращаются вместе с пересечениями, чтобы восстановить порядок прохода.
+    """
+    a, b, ids, vertices, positions = task['a'], task['b'], task['ids'], task['vertices'], task['positions']
+    upper = task['upper']
+    rows_count = len(upper)
+    counts = np.maximum(upper - np.arange(1, rows_count + 1), 0)
+    total = int(counts.sum())
+    rows = np.repeat(np.arange(rows_count), counts)
+    starts = np.cumsum(counts) - counts
+    columns = rows + 1 + np.arange(total) - np.repeat(starts, counts)
+    ymin = np.minimum(a[:, 1], b[:, 1])
+    ymax = np.maximum(a[:, 1], b[:, 1])
+    overlap = (ymin[columns] <= ymax[rows]) & (ymax[columns] >= ymin[rows])
+    owner = _strip_of(np.maximum(ymin[rows], ymin[columns]), *task['strips'])
+    keep = overlap & (owner == task['strip'][rows])
+    rows, columns = rows[keep], columns[keep]
+
+    ax, ay, bx, by = a[rows, 0], a[rows, 1], b[rows, 0], b[rows, 1]
+    cx, cy, dx, dy = a[columns, 0], a[columns, 1], b[columns, 0], b[columns, 1]
+    o1 = _cross(ax, ay, bx, by, cx, cy)
+    o2 = _cross(ax, ay, bx, by, dx, dy)
+    o3 = _cross(cx, cy, dx, dy, ax, ay)
+    o4 = _cross(cx, cy, dx, dy, bx, by)
+
+    proper = np.flatnonzero((o1 * o2 < 0) & (o3 * o4 < 0))
+    s = o1[proper] / (o1[proper] - o2[proper])
+    t = o3[proper] / (o3[proper] - o4[proper])
+    result = {
+        'proper_row': positions[rows[proper]],
+        'proper_column': positions[columns[proper]],
+        'proper_i': ids[rows[proper]],
+        'proper_j': ids[columns[proper]],
+        'proper_s': s,
+        'proper_t': t,
+        'proper_x': cx[proper] + s * (dx[proper] - cx[proper]),
+        'proper_y': cy[proper] + s * (dy[proper] - cy[proper]),
+    }
+
+    # Концы одного сегмента внутри другого: (сегмент, параметр, вершина)
+    hits = []
+    for orientation, px, py, vertex in ((o1, cx, cy, vertices[columns, 0]), (o2, dx, dy, vertices[columns, 1])):
+        on = np.flatnonzero(orientation == 0)
+        param = _parameter(ax[on], ay[on], bx[on], by[on], px[on], py[on])
+        inside = (param > 0.0) & (param < 1.0)
+        hits.append((ids[rows[on[inside]]], param[inside], vertex[on[inside]]))
+    for orientation, px, py, vertex in ((o3, ax, ay, vertices[rows, 0]), (o4, bx, by, vertices[rows, 1])):
+        on = np.flatnonzero(orientation == 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            param = _parameter(cx[on], cy[on], dx[on], dy[on], px[on], py[on])
+        inside = (param > 0.0) & (param < 1.0)
+        hits.append((ids[columns[on[inside]]], param[inside], vertex[on[inside]]))
+    result['hit_segment'] = np.concatenate([hit[0] for hit in hits])
+    result['hit_param'] = np.concatenate([hit[1] for hit in hits])
+    result['hit_vertex'] = np.concatenate([hit[2] for hit in hits])
+    return result
+
+
+def _components(vertex_count, edges):
+    # Метки компонент связности: подвешивание корней и сжатие путей на массивах
+    labels = np.arange(vertex_count)
+    if not len(edges):
+        return labels
+    u, v = edges[:, 0], edges[:, 1]
+    while True:
+        label_u = labels[u]
+        label_v = labels[v]
+        lowest = np.minimum(label_u, label_v)
+        if not ((label_u != lowest) | (label_v != lowest)).any():
+            return labels
+        np.minimum.at(labels, label_u, lowest)
+        np.minimum.at(labels, label_v, lowest)
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+
+
+def _partitions(coords, edges):
+    # Компоненты с пересекающимися охватами объединяются: треугольник стягивания
+    # лежит внутри охвата своей компоненты, значит части можно обрабатывать независимо
+    labels = _components(len(coords), edges)
+    roots, labels = np.unique(labels, return_inverse=True)
+    count = len(roots)
+    mins = np.full((count, 2), np.inf)
+    maxs = np.full((count, 2), -np.inf)
+    np.minimum.at(mins, labels, coords)
+    np.maximum.at(maxs, labels, coords)
+
+    parent = list(range(count))
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    order = np.argsort(mins[:, 0], kind='stable')
+    upper = np.searchsorted(mins[order, 0], maxs[order, 0], side='right')
+    for position in range(count - 1):
+        candidates = order[position + 1:upper[position]]
+        if not len(candidates):
+            continue
+        i = order[position]
+        overlapping = candidates[(mins[candidates, 1] <= maxs[i, 1]) & (maxs[candidates, 1] >= mins[i, 1])]
+        root = find(i)
+        for j in overlapping.tolist():
+            other = find(j)
+            if other != root:
+                parent[max(root, other)] = min(root, other)
+                root = min(root, other)
+    groups = np.array([find(item) for item in range(count)], dtype=np.int64)
+    return groups[labels]
+
+
+def _gather_ranges(offsets, items):
+    # Номера элементов CSR-массива для строк items подряд и длины строк
+    starts = offsets[items]
+    counts = offsets[items + 1] - starts
+    first = np.cumsum(counts) - counts
+    return np.repeat(starts - first, counts) + np.arange(counts.sum()), counts
+
+
+def _partition_task(vertices, local, coords, degree, vertex_arc, first_neighbor, second_neighbor,
+                    arc_rings_offsets, arc_rings, ring_sizes, ring_closed, ring_group,
+                    locked, outside, edges, costs):
+    # Массивы одной задачи с локальной (монотонной) нумерацией вершин, дуг и колец
+    arcs = vertex_arc[vertices]
+    interior = arcs >= 0
+    arc_list, local_arcs = np.unique(arcs[interior], return_inverse=True)
+    task_arcs = np.full(len(vertices), -1, dtype=np.int64)
+    task_arcs[interior] = local_arcs.reshape(-1)
+    gathered, counts = _gather_ranges(arc_rings_offsets, arc_list)
+    ring_list, local_rings = np.unique(arc_rings[gathered], return_inverse=True)
+    local_offsets = np.zeros(len(arc_list) + 1, dtype=np.int64)
+    np.cumsum(counts, out=local_offsets[1:])
+
+    def remap(neighbors):
+        neighbors = neighbors[vertices]
+        return np.where(neighbors >= 0, local[np.maximum(neighbors, 0)], -1)
+
+    return {
+        'vertices': vertices,
+        'coords': coords[vertices],
+        'degree': degree[vertices],
+        'vertex_arc': task_arcs,
+        'first_neighbor': remap(first_neighbor),
+        'second_neighbor': remap(second_neighbor),
+        'arc_rings_offsets': local_offsets,
+        'arc_rings': local_rings.reshape(-1),
+        'ring_sizes': ring_sizes[ring_list],
+        'ring_minimum': np.where(ring_closed[ring_list], 3, 2),
+        'ring_group': ring_group[ring_list],
+        'locked': locked[vertices],
+        'outside': outside[vertices],
+        'edges': local[edges],
+        'costs': costs,
+        # Уровень журнала дочерних процессов не наследуется, поэтому передаётся явно
+        'trace': logger.isEnabledFor(TRACE),
+    }
+
+
+def _contract_partition(task, poll=None):
+    # Стягивание одной задачи до конца; выполняется и в дочерних процессах
+    state = _ContractionState(
+        task['coords'], task['degree'], task['vertex_arc'],
+        task['first_neighbor'], task['second_neighbor'],
+        task['arc_rings_offsets'], task['arc_rings'],
+        task['ring_sizes'], task['ring_minimum'], task['ring_group'], task['allowance'],
+        task['locked'], task['outside'], task['vertices'] if task['trace'] else None
+    )
+    heap = [(cost, u, v, 0, 0) for cost, (u, v) in zip(task['costs'].tolist(), task['edges'].tolist())]
+    heapq.heapify(heap)
+    removed, keys = state.run(heap, poll, task['limit'], task['tolerance'], task['budget_stop'])
+    vertices = task['vertices']
+    keys = np.asarray(keys, dtype=np.float64).reshape(-1, 5)
+    for column in (1, 2):
+        keys[:, column] = vertices[keys[:, column].astype(np.int64)]
+    return vertices[np.asarray(removed, dtype=np.int64)], keys, state.statistics()
+
+
+def _merge_histories(results):
+    # Слияние историй частей в порядок, который дала бы одна общая куча:
+    # событие части упорядочивается по максимуму ключей, извлечённых до него
+    if not results:
+        return np.zeros(0, dtype=np.int64)
+    removed = np.concatenate([result[0] for result in results])
+    keys = np.concatenate([result[1] for result in results])
+    order = np.lexsort((keys[:, 4], keys[:, 3], keys[:, 2], keys[:, 1], keys[:, 0]))
+    return removed[order]
+
+
+class Graph:
+    def __init__(self):
+        self._executor = None
+        self._workers = 1
+        self._progress = None
+        self._cancellation = None
+        self._noding = NODING_BATCHED
+        self._tolerance = None
+        self._budgets = {}
+        self.clear()
+
+    def setNodingStrategy(self, strategy):
+        # Способ поиска пересечений для следующего построения графа
+        if strategy not in NODING_STRATEGIES:
+            raise ValueError(f"Unknown noding strategy: {strategy}")
+        self._noding = strategy
+
+    def setStoppingCriteria(self, tolerance=None, budgets=None):
+        # Стягивание останавливается на первом достигнутом пределе: коэффициенте,
+        # наибольшем смещении вершины tolerance (единицы карты) или бюджете слоя
+        # budgets {layer_id: число вершин слоя в результате}
+        if tolerance is not None and tolerance < 0:
+            raise ValueError(f"Tolerance must not be negative: {tolerance}")
+        for layer_id, budget in (budgets or {}).items():
+            if budget < 0:
+                raise ValueError(f"Vertex budget of layer {layer_id} must not be negative: {budget}")
+        self._tolerance = tolerance
+        self._budgets = dict(budgets or {})
+        self._history = None
+
+    def setExecutor(self, executor, workers=1):
+        # Пул (concurrent.futures) для параллельного стягивания независимых частей графа
+        self._executor = executor
+        self._workers = max(1, workers)
+
+    def setProgressCallback(self, callback):
+        # callback(phase, fraction) вызывается из потока, в котором работает ядро
+        self._progress = callback
+
+    def setCancellationToken(self, token):
+        self._cancellation = token
+
+    def setLogLevel(self, level):
+        # Сообщения о каждом ребре выводятся только на уровне TRACE
+        logger.setLevel(level)
+
+    def _poll(self, phase, done, total):
+        if self._cancellation is not None and self._cancellation.isCanceled():
+            raise OperationCanceled("Simplification canceled")
+        if self._progress is not None:
+            self._progress(phase, min(1.0, done / total) if total else 1.0)
+
+    def clear(self):
+        self._buffers = []
+        self._frozen = []
+        self._extent = None
+        self._legacy = []
+        self._coords = None
+        self._ring_ids = None
+        self._ring_offsets = None
+        self._ring_closed = None
+        self._active = None
+        self._noded = False
+        self._topology = None
+        self._history = None
+        self._history_ratio = 0.0
+        self._owned_count = 0
+        self.stats = SimplificationStats()
+
+    def memoryUsage(self):
+        # Байты, занятые сейчас массивами графа, по структурам
+        topology = self._topology or {}
+        groups = {
+            'input': [array for buffer in self._buffers for array in (
+                buffer.coords, buffer.ring_offsets, buffer.part_offsets, buffer.feature_offsets, buffer.feature_ids
+            )],
+            'vertices': [self._coords],
+            'rings': [self._ring_ids, self._ring_offsets, self._ring_closed],
+            'arcs': list(topology.values()),
+            'history': [self._history, self._active],
+        }
+        report = {
+            name: int(sum(array.nbytes for array in arrays if array is not None))
+            for name, arrays in groups.items()
+        }
+        report['total'] = sum(report.values())
+        return report
+
+    @staticmethod
+    def estimateMemory(features, frozen=()):
+        # Оценка пиковой памяти до запуска (байты), чтобы подобрать размер тайлов и число процессов
+        buffers = list(features) + list(frozen)
+        vertices = sum(buffer.vertex_count for buffer in buffers)
+        input_bytes = int(sum(
+            buffer.coords.nbytes + buffer.ring_offsets.nbytes + buffer.part_offsets.nbytes +
+            buffer.feature_offsets.nbytes + buffer.feature_ids.nbytes for buffer in buffers
+        ))
+        core_bytes = vertices * _BYTES_PER_VERTEX
+        return {'vertices': vertices, 'input': input_bytes, 'core': core_bytes, 'total': input_bytes + core_bytes}
+
+    # ------------------------------------------------------------------
+    # Добавление объектов
+
+    def addFeature(self, layer_id, feature_id, is_polygon, points):
+        self._legacy.append((layer_id, feature_id, is_polygon, points))
+        self._coords = None
+
+    def addFeatures(self, buffer, frozen=False):
+        # Замороженные объекты участвуют в поиске пересечений и проверке топологии,
+        # но их вершины не удаляются и в результат они не попадают
+        self._buffers.append(buffer)
+        self._frozen.append(bool(frozen))
+        self._coords = None
+
+    def setExtent(self, xmin, ymin, xmax, ymax):
+        # Удалять можно только вершины строго внутри охвата вместе с обоими соседями
+        self._extent = (xmin, ymin, xmax, ymax)
+        self._history = None
+
+    def _flush_legacy(self):
+        # Объекты старого API собираются в буферы по слоям, порядок запоминается
+        if not self._legacy:
+            return []
+        groups = {}
+        order = []
+        for layer_id, feature_id, is_polygon, points in self._legacy:
+            geometry_type = POLYGON if is_polygon else LINE
+            key = (layer_id, geometry_type)
+            group = groups.setdefault(key, ([], [], []))
+            order.append((key, len(group[2])))
+            group[0].extend((p.getX(), p.getY()) for p in points)
+            group[1].append(len(points))
+            group[2].append(feature_id)
+        self._legacy = []
+        positions = {}
+        for (layer_id, geometry_type), (coords, sizes, feature_ids) in groups.items():
+            count = len(feature_ids)
+            offsets = np.zeros(count + 1, dtype=np.int64)
+            np.cumsum(sizes, out=offsets[1:])
+            positions[(layer_id, geometry_type)] = len(self._buffers)
+            self.addFeatures(FeatureBuffer(
+                layer_id, geometry_type,
+                np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+                offsets,
+                np.arange(count + 1, dtype=np.int64),
+                np.arange(count + 1, dtype=np.int64),
+                np.asarray(feature_ids, dtype=np.int64)
+            ))
+        return [(positions[key], index) for key, index in order]
+
+    # ------------------------------------------------------------------
+    # Построение графа
+
+    def _build(self):
+        if self._coords is not None:
+            return
+        started = time.perf_counter()
+        self._history = None
+        buffers = self._buffers
+        all_coords = np.concatenate([b.coords for b in buffers]) if buffers else np.empty((0, 2))
+        # Вершины с одинаковыми координатами получают один плотный номер
+        coords, ids = np.unique(all_coords, axis=0, return_inverse=True)
+        ids = ids.reshape(-1).astype(np.int64)
+
+        self._ring_layout()
+        ring_offsets = []
+        ring_closed = []
+        vertex_base = 0
+        for buffer in buffers:
+            ring_offsets.append(buffer.ring_offsets + vertex_base)
+            ring_closed.append(np.full(len(buffer.ring_offsets) - 1, buffer.geometry_type == POLYGON))
+            vertex_base += buffer.vertex_count
+        if ring_offsets:
+            offsets = np.concatenate([ring_offsets[0]] + [r[1:] for r in ring_offsets[1:]])
+            closed = np.concatenate(ring_closed)
+        else:
+            offsets = np.zeros(1, dtype=np.int64)
+            closed = np.zeros(0, dtype=bool)
+
+        ring_index = np.repeat(np.arange(len(closed)), np.diff(offsets))
+        # Повторяющиеся подряд вершины отбрасываются
+        keep = np.ones(len(ids), dtype=bool)
+        keep[1:] = (ids[1:] != ids[:-1]) | (ring_index[1:] != ring_index[:-1])
+        ids, ring_index = ids[keep], ring_index[keep]
+        sizes = np.bincount(ring_index, minlength=len(closed))
+        offsets = np.zeros(len(closed) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        # Замыкающая вершина кольца хранится один раз
+        nonempty = sizes > 0
+        first = ids[offsets[:-1][nonempty]]
+        last = ids[offsets[1:][nonempty] - 1]
+        loops = np.zeros(len(closed), dtype=bool)
+        loops[nonempty] = (first == last) & (sizes[nonempty] > 1)
+        closed = loops | closed
+        drop = np.ones(len(ids), dtype=bool)
+        drop[offsets[1:][loops] - 1] = False
+        ids, ring_index = ids[drop], ring_index[drop]
+        sizes = np.bincount(ring_index, minlength=len(closed))
+        offsets = np.zeros(len(closed) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        self._coords = coords
+        self._ring_ids = ids
+        self._ring_offsets = offsets
+        self._ring_closed = closed & (sizes > 2)
+        self._noded = False
+        self._topology = None
+        self.stats.counters['vertices'] = len(coords)
+        self.stats.timings['build'] += time.perf_counter() - started
+        logger.debug("Graph built: %d vertices, %d rings", len(coords), len(closed))
+
+    def _ring_layout(self):
+        # Номер первого кольца каждого буфера и флаги заморозки колец
+        self._ring_base = []
+        ring_frozen = []
+        ring_total = 0
+        for buffer, frozen in zip(self._buffers, self._frozen):
+            self._ring_base.append(ring_total)
+            ring_count = len(buffer.ring_offsets) - 1
+            ring_frozen.append(np.full(ring_count, frozen))
+            ring_total += ring_count
+        self._ring_frozen = np.concatenate(ring_frozen) if ring_frozen else np.zeros(0, dtype=bool)
+        return ring_total
+
+    def nodedState(self):
+        # Граф после поиска пересечений в виде массивов (для кэша на диске)
+        self.findAndAddIntersections()
+        return {
+            'coords': self._coords,
+            'ring_ids': self._ring_ids,
+            'ring_offsets': self._ring_offsets,
+            'ring_closed': self._ring_closed,
+        }
+
+    def setNodedState(self, state):
+        # Сохранённый граф подставляется вместо построения и поиска пересечений;
+        # массивы могут быть отображены в память только для чтения
+        ring_total = self._ring_layout()
+        if len(state['ring_closed']) != ring_total or len(state['ring_offsets']) != ring_total + 1:
+            raise ValueError("Noded graph does not match the added features")
+        self._coords = np.asarray(state['coords'], dtype=np.float64).reshape(-1, 2)
+        self._ring_ids = np.asarray(state['ring_ids'], dtype=np.int64)
+        self._ring_offsets = np.asarray(state['ring_offsets'], dtype=np.int64)
+        self._ring_closed = np.asarray(state['ring_closed'], dtype=bool)
+        self._noded = True
+        self._topology = None
+        self._history = None
+
+    def _edges(self):
+        # Уникальные рёбра графа (u < v) по последовательностям колец
+        ids = self._ring_ids
+        offsets = self._ring_offsets
+        sizes = np.diff(offsets)
+        ring_index = np.repeat(np.arange(len(sizes)), sizes)
+        same = ring_index[1:] == ring_index[:-1]
+        src = [ids[:-1][same]]
+        dst = [ids[1:][same]]
+        closed = self._ring_closed
+        src.append(ids[offsets[1:][closed] - 1])
+        dst.append(ids[offsets[:-1][closed]])
+        src = np.concatenate(src)
+        dst = np.concatenate(dst)
+        edges = np.stack([np.minimum(src, dst), np.maximum(src, dst)], axis=1)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        if len(edges):
+            edges = np.unique(edges, axis=0)
+        return edges.reshape(-1, 2)
+
+    def _arcs(self):
+        """Разбиение колец на общие дуги между узлами, как в TopoJSON.
+
+        Узел -- вершина степени не 2 или конец незамкнутой линии. Дуга -- цепочка
+        между узлами; общая граница нескольких объектов хранится одной дугой, а
+        кольца ссылаются на дуги (~номер -- дуга в обратном направлении). Кольцо
+        без узлов целиком становится замкнутой дугой от вершины с наименьшим номером.
+        """
+        if self._topology is not None:
+            return self._topology
+        started = time.perf_counter()
+        ids = self._ring_ids
+        offsets = self._ring_offsets
+        closed = self._ring_closed
+        vertex_count = len(self._coords)
+        sizes = np.diff(offsets)
+        ring_count = len(sizes)
+        ring_index = np.repeat(np.arange(ring_count), sizes)
+
+        edges = self._edges()
+        degree = np.bincount(edges.ravel(), minlength=vertex_count)
+        junction = degree != 2
+        open_rings = ~closed & (sizes > 0)
+        junction[ids[offsets[:-1][open_rings]]] = True
+        junction[ids[offsets[1:][open_rings] - 1]] = True
+
+        # Точки разреза в кольцах: узлы, а в кольцах без узлов -- наименьшая вершина
+        cut = junction[ids]
+        loops = closed & (np.bincount(ring_index[cut], minlength=ring_count) == 0)
+        if loops.any():
+            loop_positions = np.flatnonzero(loops[ring_index])
+            lowest = np.full(ring_count, vertex_count, dtype=np.int64)
+            np.minimum.at(lowest, ring_index[loop_positions], ids[loop_positions])
+            cut[loop_positions[ids[loop_positions] == lowest[ring_index[loop_positions]]]] = True
+        cut_positions = np.flatnonzero(cut)
+        first_cut = np.zeros(ring_count, dtype=np.int64)
+        cut_rings, first_index = np.unique(ring_index[cut_positions], return_index=True)
+        first_cut[cut_rings] = cut_positions[first_index] - offsets[cut_rings]
+
+        # Замкнутые кольца поворачиваются к первой точке разреза и дополняются ею же
+        shift = np.where(closed, first_cut, 0)
+        walk_sizes = sizes + closed
+        walk_offsets = np.zeros(ring_count + 1, dtype=np.int64)
+        np.cumsum(walk_sizes, out=walk_offsets[1:])
+        walk_ring = np.repeat(np.arange(ring_count), walk_sizes)
+        step = np.arange(walk_offsets[-1]) - walk_offsets[walk_ring]
+        positions = offsets[walk_ring] + (shift[walk_ring] + step) % np.maximum(sizes[walk_ring], 1)
+        walk = ids[positions]
+
+        # Участки колец между соседними точками разреза
+        walk_cuts = np.flatnonzero(cut[positions])
+        same = walk_ring[walk_cuts[:-1]] == walk_ring[walk_cuts[1:]]
+        starts = walk_cuts[:-1][same]
+        ends = walk_cuts[1:][same]
+        segment_ring = walk_ring[starts]
+
+        # Участок задаётся первым ребром; одинаковые участки разных колец -- одна дуга
+        forward = walk[starts] * vertex_count + walk[starts + 1]
+        backward = walk[ends] * vertex_count + walk[ends - 1]
+        reverse = backward < forward
+        keys, representative, segment_arc = np.unique(
+            np.where(reverse, backward, forward), return_index=True, return_inverse=True
+        )
+        segment_arc = segment_arc.reshape(-1)
+        arc_count = len(keys)
+
+        # Вершины дуги хранятся один раз, в направлении меньшего ключа
+        lengths = ends[representative] - starts[representative] + 1
+        arc_offsets = np.zeros(arc_count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=arc_offsets[1:])
+        arc_index = np.repeat(np.arange(arc_count), lengths)
+        step = np.arange(arc_offsets[-1]) - arc_offsets[arc_index]
+        flipped = reverse[representative][arc_index]
+        arc_vertices = walk[np.where(flipped, ends[representative][arc_index] - step,
+                                     starts[representative][arc_index] + step)]
+
+        # Номер дуги у внутренних вершин; узлы дуге не принадлежат
+        vertex_arc = np.full(vertex_count, -1, dtype=np.int64)
+        inner = np.ones(len(arc_vertices), dtype=bool)
+        inner[arc_offsets[:-1]] = False
+        inner[arc_offsets[1:] - 1] = False
+        vertex_arc[arc_vertices[inner]] = arc_index[inner]
+        loop_starts = arc_vertices[arc_offsets[:-1]]
+        loop_arcs = ~junction[loop_starts]
+        vertex_arc[loop_starts[loop_arcs]] = np.flatnonzero(loop_arcs)
+
+        # Кольца каждой дуги с повторениями: удаление вершины дуги уменьшает каждое из них
+        order = np.argsort(segment_arc, kind='stable')
+        arc_rings = segment_ring[order]
+        references = np.bincount(segment_arc, minlength=arc_count)
+        arc_rings_offsets = np.zeros(arc_count + 1, dtype=np.int64)
+        np.cumsum(references, out=arc_rings_offsets[1:])
+        ring_arc_offsets = np.zeros(ring_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(segment_ring, minlength=ring_count), out=ring_arc_offsets[1:])
+
+        self._topology = {
+            'edges': edges,
+            'degree': degree,
+            'vertex_arc': vertex_arc,
+            'arc_vertices': arc_vertices,
+            'arc_offsets': arc_offsets,
+            'arc_rings': arc_rings,
+            'arc_rings_offsets': arc_rings_offsets,
+            'ring_arcs': np.where(reverse, ~segment_arc, segment_arc),
+            'ring_arc_offsets': ring_arc_offsets,
+        }
+        self.stats.counters['arcs'] = arc_count
+        self.stats.counters['shared_arcs'] = int(np.count_nonzero(references > 1))
+        self.stats.timings['arcs'] += time.perf_counter() - started
+        logger.debug("Arcs: %d arcs for %d ring vertices, %d shared", arc_count, len(ids),
+                     self.stats.counters['shared_arcs'])
+        return self._topology
+
+    def topology(self):
+        """Общие дуги после упрощения и ссылки колец на них.
+
+        Словарь: coords и arc_offsets -- вершины дуг, ring_arcs и ring_arc_offsets --
+        номера дуг каждого кольца (~номер -- дуга в обратном направлении), ring_base --
+        номер первого кольца каждого добавленного буфера.
+        """
+        self.findAndAddIntersections()
+        arcs = self._arcs()
+        arc_vertices = arcs['arc_vertices']
+        arc_offsets = arcs['arc_offsets']
+        arc_count = len(arc_offsets) - 1
+        keep = np.ones(len(arc_vertices), dtype=bool) if self._active is None else self._active[arc_vertices]
+        arc_index = np.repeat(np.arange(arc_count), np.diff(arc_offsets))
+        kept_ids = arc_vertices[keep]
+        kept_sizes = np.bincount(arc_index[keep], minlength=arc_count)
+        kept_offsets = np.zeros(arc_count + 1, dtype=np.int64)
+        np.cumsum(kept_sizes, out=kept_offsets[1:])
+
+        # Замкнутая дуга без удалённой начальной вершины снова замыкается первой оставшейся
+        starts = arc_vertices[arc_offsets[:-1]]
+        reclose = (starts == arc_vertices[arc_offsets[1:] - 1]) & ~keep[arc_offsets[:-1]] & (kept_sizes > 0)
+        kept_ids = np.insert(kept_ids, kept_offsets[1:][reclose], kept_ids[kept_offsets[:-1][reclose]])
+        np.cumsum(kept_sizes + reclose, out=kept_offsets[1:])
+        return {
+            'coords': self._coords[kept_ids],
+            'arc_offsets': kept_offsets,
+            'ring_arcs': arcs['ring_arcs'],
+            'ring_arc_offsets': arcs['ring_arc_offsets'],
+            'ring_base': list(self._ring_base),
+        }
+
+    # ------------------------------------------------------------------
+    # Поиск пересечений
+
+    def findAndAddIntersections(self):
+        self._build()
+        if self._noded:
+            return 0
+        self._noded = True
+        self._topology = None
+        started = time.perf_counter()
+        count = self._find_intersections()
+        self.stats.counters['intersections'] += count
+        self.stats.timings['noding'] += time.perf_counter() - started
+        logger.debug("Noding: %d intersection vertices added in %.3f s", count, self.stats.timings['noding'])
+        return count
+
+    def _find_intersections(self):
+        edges = self._edges()
+        if len(edges) < 2:
+            return 0
+        coords = self._coords
+        a = coords[edges[:, 0]]
+        b = coords[edges[:, 1]]
+        mins = np.minimum(a, b)
+        maxs = np.maximum(a, b)
+
+        # Сегменты сортируются по xmin, кандидаты каждого сегмента ищутся бинарным поиском
+        order = np.argsort(mins[:, 0], kind='stable')
+        sorted_xmin = mins[order, 0]
+        upper = np.searchsorted(sorted_xmin, maxs[order, 0], side='right')
+
+        splits = {}
+        new_points = {}
+        if self._noding == NODING_BATCHED:
+            self._batched_intersections(edges, a, b, order, upper, splits, new_points)
+        else:
+            self._sweep_intersections(edges, a, b, mins, maxs, order, upper, splits, new_points)
+        if not splits:
+            return 0
+        self._apply_splits(edges, splits, new_points)
+        return len(new_points)
+
+    def _sweep_intersections(self, edges, a, b, mins, maxs, order, upper, splits, new_points):
+        segment_count = len(order)
+        self._poll(PHASE_INTERSECTIONS, 0, segment_count)
+        for position in range(segment_count - 1):
+            if position % _POLL_INTERVAL == 0:
+                self._poll(PHASE_INTERSECTIONS, position, segment_count)
+            candidates = order[position + 1:upper[position]]
+            if not len(candidates):
+                continue
+            i = order[position]
+            candidates = candidates[
+                (mins[candidates, 1] <= maxs[i, 1]) & (maxs[candidates, 1] >= mins[i, 1])
+            ]
+            if len(candidates):
+                self._intersect_segment(i, candidates, edges, a, b, splits, new_points)
+
+        self._poll(PHASE_INTERSECTIONS, segment_count, segment_count)
+
+    def _batched_intersections(self, edges, a, b, order, upper, splits, new_points):
+        # Плоскость делится на горизонтальные полосы, сегмент попадает во все полосы своего охвата.
+        # Записи полос делятся на пакеты примерно по _PAIR_BATCH пар-кандидатов;
+        # пакеты независимы и при наличии пула проверяются параллельно
+        segment_count = len(order)
+        ymin = np.minimum(a[order, 1], b[order, 1])
+        ymax = np.maximum(a[order, 1], b[order, 1])
+        strips = max(1, int(math.sqrt(segment_count) / 2))
+        low = float(ymin.min())
+        height = (float(ymax.max()) - low) / strips or 1.0
+        strip_parameters = (low, height, strips)
+        first_strip = _strip_of(ymin, *strip_parameters)
+        spans = _strip_of(ymax, *strip_parameters) - first_strip + 1
+        positions = np.repeat(np.arange(segment_count), spans)
+        entry_strip = first_strip[positions] + np.arange(len(positions)) - np.repeat(np.cumsum(spans) - spans, spans)
+        entry_order = np.argsort(entry_strip, kind='stable')
+        positions, entry_strip = positions[entry_order], entry_strip[entry_order]
+        # Кандидаты записи -- записи той же полосы с позицией сортировки до upper
+        keys = entry_strip * segment_count + positions
+        entry_upper = np.searchsorted(keys, entry_strip * segment_count + upper[positions])
+
+        entry_count = len(positions)
+        counts = np.maximum(entry_upper - np.arange(1, entry_count + 1), 0)
+        cumulative = np.cumsum(counts)
+        total = int(cumulative[-1])
+        bounds = np.searchsorted(cumulative, np.arange(_PAIR_BATCH, total, _PAIR_BATCH), side='right')
+        bounds = np.unique(np.concatenate([[0], bounds, [entry_count]]))
+        tasks = []
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            window = slice(first, max(int(entry_upper[first:last].max()), last))
+            segments = order[positions[window]]
+            tasks.append({
+                'a': a[segments], 'b': b[segments], 'ids': segments, 'vertices': edges[segments],
+                'positions': positions[window], 'strip': entry_strip[window], 'strips': strip_parameters,
+                'upper': entry_upper[first:last] - first,
+            })
+        done = [int(cumulative[last - 1]) for last in bounds[1:].tolist()]
+        self._poll(PHASE_INTERSECTIONS, 0, total)
+        if self._executor is None or self._workers < 2 or len(tasks) < 2:
+            results = []
+            for task, pairs in zip(tasks, done):
+                results.append(_intersection_batch(task))
+                self._poll(PHASE_INTERSECTIONS, pairs, total)
+        else:
+            results = self._wait_all(tasks, _intersection_batch, PHASE_INTERSECTIONS, np.diff([0] + done), total)
+        merged = {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+        # Номера новым вершинам выдаются в порядке построчного прохода по сортировке
+        proper = np.lexsort((merged['proper_column'], merged['proper_row']))
+        coordinates = zip(merged['proper_x'][proper].tolist(), merged['proper_y'][proper].tolist())
+        for i, j, s_j, t_i, point in zip(merged['proper_i'][proper].tolist(), merged['proper_j'][proper].tolist(),
+                                         merged['proper_s'][proper].tolist(), merged['proper_t'][proper].tolist(),
+                                         coordinates):
+            vertex = new_points.setdefault(point, len(self._coords) + len(new_points))
+            splits.setdefault(i, []).append((t_i, vertex))
+            splits.setdefault(j, []).append((s_j, vertex))
+        for segment, param, vertex in zip(merged['hit_segment'].tolist(), merged['hit_param'].tolist(),
+                                          merged['hit_vertex'].tolist()):
+            splits.setdefault(segment, []).append((param, vertex))
+        self._poll(PHASE_INTERSECTIONS, total, total)
+
+    def _intersect_segment(self, i, candidates, edges, a, b, splits, new_points):
+        ax, ay = a[i]
+        bx, by = b[i]
+        cx, cy = a[candidates, 0], a[candidates, 1]
+        dx, dy = b[candidates, 0], b[candidates, 1]
+        o1 = _cross(ax, ay, bx, by, cx, cy)
+        o2 = _cross(ax, ay, bx, by, dx, dy)
+        o3 = _cross(cx, cy, dx, dy, ax, ay)
+        o4 = _cross(cx, cy, dx, dy, bx, by)
+
+        # Собственные пересечения внутренних точек сегментов
+        proper = np.flatnonzero((o1 * o2 < 0) & (o3 * o4 < 0))
+        if len(proper):
+            s = o1[proper] / (o1[proper] - o2[proper])
+            t = o3[proper] / (o3[proper] - o4[proper])
+            xs = cx[proper] + s * (dx[proper] - cx[proper])
+            ys = cy[proper] + s * (dy[proper] - cy[proper])
+            for j, s_j, t_i, x, y in zip(candidates[proper].tolist(), s.tolist(), t.tolist(),
+                                         xs.tolist(), ys.tolist()):
+                vertex = new_points.setdefault((x, y), len(self._coords) + len(new_points))
+                splits.setdefault(i, []).append((t_i, vertex))
+                splits.setdefault(j, []).append((s_j, vertex))
+
+        # Концы одного сегмента, лежащие внутри другого (Т-образные примыкания и наложения)
+        self._split_on_endpoints(i, o1, edges[candidates, 0], cx, cy, a, b, splits)
+        self._split_on_endpoints(i, o2, edges[candidates, 1], dx, dy, a, b, splits)
+        self._split_on_endpoints_reverse(i, candidates, o3, edges[i, 0], a, b, splits)
+        self._split_on_endpoints_reverse(i, candidates, o4, edges[i, 1], a, b, splits)
+
+    def _split_on_endpoints(self, i, orientation, vertices, px, py, a, b, splits):
+        # Вершины кандидатов на отрезке i
+        ax, ay = a[i]
+        bx, by = b[i]
+        t = _parameter(ax, ay, bx, by, px, py)
+        hits = (orientation == 0) & (t > 0.0) & (t < 1.0)
+        for vertex, param in zip(vertices[hits].tolist(), t[hits].tolist()):
+            splits.setdefault(i, []).append((param, vertex))
+
+    def _split_on_endpoints_reverse(self, i, candidates, orientation, vertex, a, b, splits):
+        # Вершина отрезка i на отрезках кандидатов
+        px, py = self._coords[vertex]
+        cx, cy = a[candidates, 0], a[candidates, 1]
+        dx, dy = b[candidates, 0], b[candidates, 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = _parameter(cx, cy, dx, dy, px, py)
+        hits = (orientation == 0) & (t > 0.0) & (t < 1.0)
+        for j, param in zip(candidates[hits].tolist(), t[hits].tolist()):
+            splits.setdefault(j, []).append((param, vertex))
+
+    def _apply_splits(self, edges, splits, new_points):
+        # Новые вершины вставляются во все кольца, проходящие через разбитые рёбра
+        if new_points:
+            extra = np.array(list(new_points.keys()), dtype=np.float64).reshape(-1, 2)
+            self._coords = np.concatenate([self._coords, extra])
+        vertex_count = len(self._coords)
+        # Цепочки вставляемых вершин по ключу ребра (u < v), в порядке от u к v
+        chain_keys = []
+        chains = []
+        for segment, points in splits.items():
+            u, v = int(edges[segment, 0]), int(edges[segment, 1])
+            chain_keys.append(u * vertex_count + v)
+            chains.append([vertex for _, vertex in sorted(set(points))])
+        chain_keys = np.asarray(chain_keys, dtype=np.int64)
+        chain_order = np.argsort(chain_keys)
+        chain_keys = chain_keys[chain_order]
+        chain_sizes = np.asarray([len(chains[index]) for index in chain_order.tolist()], dtype=np.int64)
+        chain_offsets = np.zeros(len(chain_keys) + 1, dtype=np.int64)
+        np.cumsum(chain_sizes, out=chain_offsets[1:])
+        chain_vertices = np.fromiter(
+            (vertex for index in chain_order.tolist() for vertex in chains[index]), dtype=np.int64,
+            count=int(chain_offsets[-1])
+        )
+
+        ids = self._ring_ids
+        offsets = self._ring_offsets
+        closed = self._ring_closed
+        sizes = np.diff(offsets)
+        ring_index = np.repeat(np.arange(len(sizes)), sizes)
+
+        # Следующая вершина в кольце (для последней вершины незамкнутого кольца -1)
+        following = np.empty_like(ids)
+        following[:-1] = ids[1:]
+        nonempty = sizes > 0
+        following[offsets[1:][nonempty] - 1] = -1
+        loops = closed & nonempty
+        following[offsets[1:][loops] - 1] = ids[offsets[:-1][loops]]
+        valid = following >= 0
+        pair_keys = np.minimum(ids, following) * vertex_count + np.maximum(ids, following)
+
+        # После каждой вершины вставляется цепочка её ребра к следующей вершине
+        match = np.minimum(np.searchsorted(chain_keys, pair_keys), len(chain_keys) - 1)
+        hit = valid & (chain_keys[match] == pair_keys)
+        lengths = np.where(hit, chain_sizes[match], 0)
+        out_offsets = np.cumsum(lengths + 1) - (lengths + 1)
+        result = np.empty(len(ids) + int(lengths.sum()), dtype=np.int64)
+        result[out_offsets] = ids
+        positions = np.flatnonzero(hit)
+        counts = lengths[positions]
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        forward = np.repeat(ids[positions] < following[positions], counts)
+        source = np.repeat(chain_offsets[match[positions]], counts) + \
+            np.where(forward, step, np.repeat(counts, counts) - 1 - step)
+        result[np.repeat(out_offsets[positions] + 1, counts) + step] = chain_vertices[source]
+
+        self._ring_ids = result
+        self._ring_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ring_index, weights=lengths + 1, minlength=len(sizes)).astype(np.int64),
+                  out=self._ring_offsets[1:])
+
+    # ------------------------------------------------------------------
+    # Стягивание рёбер
+
+    def simplify(self, ratio):
+        # История стягивания строится один раз; любой коэффициент -- это её префикс
+        self.findAndAddIntersections()
+        self._prepare_history(ratio)
+        self._active = np.ones(len(self._coords), dtype=bool)
+        target = max(0, min(int(ratio * self._owned_count), len(self._history)))
+        self.stats.counters['vertices_removed'] = target
+        if target <= 0:
+            return 0
+        self._active[self._history[:target]] = False
+        return target
+
+    def _prepare_history(self, ratio):
+        # История строится до коэффициента ratio; для большего коэффициента -- заново
+        if self._history is not None and ratio <= self._history_ratio:
+            return
+        self._history, self._owned_count = self._contract(ratio)
+        # Короткая история закончилась раньше предела удалений и годится для любого коэффициента
+        complete = len(self._history) < int(ratio * self._owned_count)
+        self._history_ratio = 1.0 if complete else ratio
+
+    def _contract(self, ratio=1.0):
+        # Порядок удаления вершин до предела ratio и число вершин незамороженных объектов
+        self._poll(PHASE_HEAP, 0, 1)
+        started = time.perf_counter()
+        coords = self._coords
+        vertex_count = len(coords)
+        ring_ids = self._ring_ids
+        ring_sizes = np.diff(self._ring_offsets)
+        ring_index = np.repeat(np.arange(len(ring_sizes)), ring_sizes)
+
+        # Стягивать можно только рёбра внутри одной дуги; узлы остаются на месте
+        arcs = self._arcs()
+        edges = arcs['edges']
+        degree = arcs['degree']
+        vertex_arc = arcs['vertex_arc']
+        self.stats.counters['edges'] = len(edges)
+
+        # Закреплённые вершины: принадлежат замороженным объектам или лежат вне охвата
+        frozen_rings = self._ring_frozen[ring_index]
+        owned = np.bincount(ring_ids[~frozen_rings], minlength=vertex_count) > 0
+        locked = np.bincount(ring_ids[frozen_rings], minlength=vertex_count) > 0
+        outside = np.zeros(vertex_count, dtype=bool)
+        if self._extent is not None:
+            xmin, ymin, xmax, ymax = self._extent
+            x, y = coords[:, 0], coords[:, 1]
+            outside = (x <= xmin) | (x >= xmax) | (y <= ymin) | (y >= ymax)
+            # Коэффициент относится к вершинам, которые можно удалить: объект, выходящий за охват
+            # (тайл), упрощается внутри охвата так же, как при обработке целиком
+            owned &= ~outside
+        locked |= outside
+
+        # Соседи вершин степени 2 в виде двух массивов
+        both = np.concatenate([edges, edges[:, ::-1]])
+        both = both[np.argsort(both[:, 0], kind='stable')]
+        adjacency_offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(both[:, 0], minlength=vertex_count), out=adjacency_offsets[1:])
+        two = np.flatnonzero(degree == 2)
+        first_neighbor = np.full(vertex_count, -1, dtype=np.int64)
+        second_neighbor = np.full(vertex_count, -1, dtype=np.int64)
+        first_neighbor[two] = both[adjacency_offsets[two], 1]
+        second_neighbor[two] = both[adjacency_offsets[two] + 1, 1]
+
+        # Начальные стоимости считаются сразу для всех вершин степени 2
+        vertex_cost = np.full(vertex_count, np.inf)
+        vertex_cost[two] = _displacements(coords, two, first_neighbor[two], second_neighbor[two])
+        candidate = (vertex_arc[edges[:, 0]] >= 0) & (vertex_arc[edges[:, 0]] == vertex_arc[edges[:, 1]]) & \
+            ~locked[edges[:, 0]] & ~locked[edges[:, 1]]
+        candidate_edges = edges[candidate]
+        costs = np.minimum(vertex_cost[candidate_edges[:, 0]], vertex_cost[candidate_edges[:, 1]])
+        # Рёбра дороже допуска не попадают в кучу; ребро, подешевевшее после стягивания
+        # соседнего, добавляется заново (см. _ContractionState.run)
+        if self._tolerance is not None:
+            cheap = costs <= self._tolerance
+            candidate_edges, costs = candidate_edges[cheap], costs[cheap]
+
+        # Бюджеты слоёв: сколько вершин ещё можно удалить из каждого слоя с бюджетом.
+        # Размер кольца считается с замыкающей вершиной, как в результате
+        ring_group = np.full(len(ring_sizes), -1, dtype=np.int64)
+        groups = {}
+        for buffer, ring_base, frozen in zip(self._buffers, self._ring_base, self._frozen):
+            if not frozen and buffer.layer_id in self._budgets:
+                group = groups.setdefault(buffer.layer_id, len(groups))
+                ring_group[ring_base:ring_base + len(buffer.ring_offsets) - 1] = group
+        budgeted = ring_group >= 0
+        group_sizes = np.bincount(ring_group[budgeted], weights=(ring_sizes + self._ring_closed)[budgeted],
+                                  minlength=len(groups))
+        budgets = np.array([self._budgets[layer_id] for layer_id in groups], dtype=np.float64)
+        allowance = np.maximum(group_sizes - budgets, 0).astype(np.int64)
+        # Если бюджет есть у всех слоёв, стягивание заканчивается вместе с последним бюджетом
+        budget_stop = bool(groups) and bool(np.all(budgeted | self._ring_frozen))
+
+        owned_count = int(np.count_nonzero(owned))
+        # Ни одна задача не даёт в префикс истории больше удалений, чем нужно коэффициенту ratio
+        limit = int(ratio * owned_count)
+        if not len(candidate_edges) or limit <= 0:
+            self.stats.timings['heap_init'] += time.perf_counter() - started
+            self._poll(PHASE_HEAP, 1, 1)
+            return np.zeros(0, dtype=np.int64), owned_count
+
+        # Независимые части графа раскладываются по задачам; внутри задачи общая куча
+        task_of_vertex = self._task_assignment(coords, edges)
+        vertex_order = np.argsort(task_of_vertex, kind='stable')
+        vertex_bounds = np.searchsorted(task_of_vertex[vertex_order], np.arange(task_of_vertex.max() + 2))
+        local = np.empty(vertex_count, dtype=np.int64)
+        local[vertex_order] = np.arange(vertex_count) - np.repeat(vertex_bounds[:-1], np.diff(vertex_bounds))
+        edge_task = task_of_vertex[candidate_edges[:, 0]]
+        edge_order = np.argsort(edge_task, kind='stable')
+        edge_bounds = np.searchsorted(edge_task[edge_order], np.arange(task_of_vertex.max() + 2))
+
+        tasks = []
+        for task in range(len(vertex_bounds) - 1):
+            task_edges = edge_order[edge_bounds[task]:edge_bounds[task + 1]]
+            if not len(task_edges):
+                continue
+            tasks.append(_partition_task(
+                vertex_order[vertex_bounds[task]:vertex_bounds[task + 1]], local,
+                coords, degree, vertex_arc, first_neighbor, second_neighbor,
+                arcs['arc_rings_offsets'], arcs['arc_rings'], ring_sizes, self._ring_closed, ring_group,
+                locked, outside, candidate_edges[task_edges], costs[task_edges]
+            ))
+            tasks[-1].update(allowance=allowance, limit=limit, tolerance=self._tolerance, budget_stop=budget_stop)
+        self.stats.timings['heap_init'] += time.perf_counter() - started
+        logger.debug("Heap initialized: %d candidate edges in %d tasks", len(candidate_edges), len(tasks))
+        self._poll(PHASE_HEAP, 1, 1)
+
+        started = time.perf_counter()
+        results = self._run_tasks(tasks)
+        for _, _, task_stats in results:
+            self.stats.add_contraction(**task_stats)
+        self.stats.timings['contraction'] += time.perf_counter() - started
+        logger.debug("Contraction: %d edges contracted, rejected %s",
+                     self.stats.counters['edges_contracted'], self.stats.rejected)
+        return _merge_histories(results), owned_count
+
+    def _run_tasks(self, tasks):
+        # Оценка сверху для прогресса: удалить можно не больше вершин, чем у рёбер-кандидатов
+        sizes = [len(np.unique(task['edges'])) for task in tasks]
+        total = sum(sizes)
+        self._poll(PHASE_CONTRACTION, 0, total)
+        if self._executor is None or len(tasks) < 2:
+            results = []
+            done = 0
+            for task, size in zip(tasks, sizes):
+                results.append(_contract_partition(
+                    task, lambda removed, done=done: self._poll(PHASE_CONTRACTION, done + removed, total)
+                ))
+                done += size
+            self._poll(PHASE_CONTRACTION, total, total)
+            return results
+
+        return self._wait_all(tasks, _contract_partition, PHASE_CONTRACTION, sizes, total)
+
+    def _wait_all(self, tasks, function, phase, sizes, total):
+        # Задачи в пуле; отмена и прогресс проверяются по мере их завершения. Результаты в порядке задач
+        futures = {self._executor.submit(function, task): index for index, task in enumerate(tasks)}
+        results = [None] * len(tasks)
+        done = 0
+        pending = set(futures)
+        try:
+            while pending:
+                finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[futures[future]] = future.result()
+                    done += sizes[futures[future]]
+                self._poll(phase, done, total)
+        finally:
+            for future in pending:
+                future.cancel()
+        return results
+
+    def _task_assignment(self, coords, edges):
+        # Части графа распределяются по задачам жадно, начиная с крупных.
+        # Бюджеты слоёв общие для всего графа, поэтому с ними стягивание идёт одной задачей
+        if self._executor is None or self._workers < 2 or self._budgets:
+            return np.zeros(len(coords), dtype=np.int64)
+        partition = _partitions(coords, edges)
+        sizes = np.bincount(partition)
+        task_count = self._workers * 4
+        loads = [(0, task) for task in range(task_count)]
+        partition_task = np.zeros(len(sizes), dtype=np.int64)
+        for part in np.argsort(-sizes, kind='stable').tolist():
+            load, task = heapq.heappop(loads)
+            partition_task[part] = task
+            heapq.heappush(loads, (load + int(sizes[part]), task))
+        return partition_task[partition]
+
+    # ------------------------------------------------------------------
+    # Результат
+
+    def _result_buffers(self):
+        active = self._active
+        ids = self._ring_ids
+        offsets = self._ring_offsets
+        closed = self._ring_closed
+        keep = active[ids]
+        ring_count = len(offsets) - 1
+        ring_index = np.repeat(np.arange(ring_count), np.diff(offsets))
+        kept_ids = ids[keep]
+        kept_sizes = np.bincount(ring_index[keep], minlength=ring_count)
+        kept_offsets = np.zeros(ring_count + 1, dtype=np.int64)
+        np.cumsum(kept_sizes, out=kept_offsets[1:])
+
+        # Полигоны и замкнутые линии снова замыкаются первой вершиной
+        reclose = closed & (kept_sizes > 0)
+        positions = kept_offsets[1:][reclose]
+        out_ids = np.insert(kept_ids, positions, kept_ids[kept_offsets[:-1][reclose]])
+        out_sizes = kept_sizes + reclose
+        out_offsets = np.zeros(ring_count + 1, dtype=np.int64)
+        np.cumsum(out_sizes, out=out_offsets[1:])
+        out_coords = self._coords[out_ids]
+
+        results = []
+        for buffer, ring_base, frozen in zip(self._buffers, self._ring_base, self._frozen):
+            if frozen:
+                continue
+            ring_total = len(buffer.ring_offsets) - 1
+            ring_slice = out_offsets[ring_base:ring_base + ring_total + 1]
+            results.append(FeatureBuffer(
+                buffer.layer_id,
+                buffer.geometry_type,
+                out_coords[ring_slice[0]:ring_slice[-1]],
+                ring_slice - ring_slice[0],
+                buffer.part_offsets,
+                buffer.feature_offsets,
+                buffer.feature_ids
+            ))
+        return results
+
+    def _load(self, features, frozen, extent, noded=None):
+        self.clear()
+        features = list(features)
+        legacy = bool(features) and not isinstance(features[0], FeatureBuffer)
+        order = None
+        if legacy:
+            for layer_id, feature_id, is_polygon, points in features:
+                self.addFeature(layer_id, feature_id, is_polygon, points)
+            order = self._flush_legacy()
+        else:
+            for buffer in features:
+                self.addFeatures(buffer)
+        for buffer in frozen:
+            self.addFeatures(buffer, frozen=True)
+        if extent is not None:
+            self.setExtent(*extent)
+        if noded is not None:
+            self.setNodedState(noded)
+        self._build()
+        self.findAndAddIntersections()
+        return legacy, order
+
+    def processFeatureLevels(self, features, ratios, frozen=(), extent=None, noded=None):
+        # Несколько уровней из одной сборки графа: по списку буферов на каждый коэффициент
+        self._load(features, frozen, extent, noded)
+        if ratios:
+            self._prepare_history(max(ratios))
+        levels = []
+        for ratio in ratios:
+            self.simplify(ratio)
+            levels.append(self._result_buffers())
+        return levels
+
+    def processFeatures(self, features, ratio, frozen=(), extent=None, noded=None):
+        legacy, order = self._load(features, frozen, extent, noded)
+        self.simplify(ratio)
+        buffers = self._result_buffers()
+        if not legacy:
+            return buffers
+
+        simplified = []
+        for buffer_index, feature_index in order:
+            buffer = buffers[buffer_index]
+            start, end = buffer.feature_vertex_range(feature_index)
+            points = [Point(x, y) for x, y in buffer.coords[start:end].tolist()]
+            simplified.append((buffer.layer_id, int(buffer.feature_ids[feature_index]), buffer.is_polygon, points))
+        return simplified
+
+
+class _ContractionState:
+    """Состояние цикла стягивания в массивах array.array.
+
+    Поэлементный доступ к ним быстрее, чем к NumPy, а памяти они занимают столько же:
+    по 8 байт на координату и номер вместо объектов Python в списках.
+    """
+
+    def __init__(self, coords, degree, vertex_arc, first_neighbor, second_neighbor,
+                 arc_rings_offsets, arc_rings, ring_sizes, ring_minimum, ring_group, allowance,
+                 locked, outside, trace_ids=None):
+        self.xs = _typed(coords[:, 0], 'd')
+        self.ys = _typed(coords[:, 1], 'd')
+        self.degree = _typed(degree, 'q')
+        self.vertex_arc = _typed(vertex_arc, 'q')
+        self.first = _typed(first_neighbor, 'q')
+        self.second = _typed(second_neighbor, 'q')
+        self.arc_rings_offsets = _typed(arc_rings_offsets, 'q')
+        self.arc_rings = _typed(arc_rings, 'q')
+        self.ring_sizes = _typed(ring_sizes, 'q')
+        self.ring_minimum = _typed(ring_minimum, 'q')
+        # Слой с бюджетом (номер группы) для каждого кольца и остаток бюджета по группам
+        self.ring_group = _typed(ring_group, 'q')
+        self.allowance = _typed(allowance, 'q')
+        self.open_groups = int(np.count_nonzero(allowance))
+        self.locked = bytearray(locked.tobytes())
+        self.outside = bytearray(outside.tobytes())
+        self.active = bytearray(b'\x01') * len(degree)
+        self.version = array('q', bytes(8 * len(degree)))
+        # Стоимость вершины меняется только вместе с её версией (сменой соседей), поэтому кэшируется
+        self.costs = array('d', bytes(8 * len(degree)))
+        self.cost_version = array('q', [-1]) * len(degree)
+        # Номера вершин графа для сообщений TRACE; None -- журнал рёбер выключен
+        self.trace_ids = trace_ids
+        self.considered = 0
+        self.contracted = 0
+        self.rescored = 0
+        self.rejected = {}
+        self.topology_seconds = 0.0
+        self.grid = _VertexGrid(coords)
+        # Удалённые вершины под каждым отрезком {(меньший конец, больший конец): [вершины]};
+        # ведётся только при заданном допуске, иначе None
+        self.hidden = None
+
+    def other(self, vertex, neighbor):
+        first = self.first[vertex]
+        return self.second[vertex] if first == neighbor else first
+
+    def cost(self, vertex):
+        # Приоритет в куче: смещение вершины относительно отрезка между её соседями
+        if self.degree[vertex] != 2:
+            return math.inf
+        if self.cost_version[vertex] == self.version[vertex]:
+            return self.costs[vertex]
+        cost = _displacement(self.xs, self.ys, vertex, self.first[vertex], self.second[vertex])
+        self.costs[vertex] = cost
+        self.cost_version[vertex] = self.version[vertex]
+        return cost
+
+    def error(self, vertex):
+        # Накопленная ошибка для проверки допуска: отрезок p-q заменит и вершины,
+        # удалённые раньше под p-vertex и vertex-q. На порядок стягивания не влияет
+        cost = self.cost(vertex)
+        xs, ys = self.xs, self.ys
+        p, q = self.first[vertex], self.second[vertex]
+        px, py = xs[p], ys[p]
+        dx, dy = xs[q] - px, ys[q] - py
+        length = dx * dx + dy * dy
+        for neighbor in (p, q):
+            for other in self.hidden.get((vertex, neighbor) if vertex < neighbor else (neighbor, vertex), ()):
+                ox, oy = xs[other] - px, ys[other] - py
+                t = min(1.0, max(0.0, (ox * dx + oy * dy) / length)) if length else 0.0
+                distance = math.hypot(ox - t * dx, oy - t * dy)
+                if distance > cost:
+                    cost = distance
+        return cost
+
+    def rejection(self, u, v):
+        # Причина, по которой ребро нельзя стянуть, или None
+        if not (self.active[u] and self.active[v]):
+            return REJECT_INACTIVE
+        if self.degree[u] != 2 or self.degree[v] != 2:
+            return REJECT_DEGREE
+        if self.locked[u] or self.locked[v]:
+            return REJECT_LOCKED
+        if self.vertex_arc[u] < 0 or self.vertex_arc[u] != self.vertex_arc[v]:
+            return REJECT_JUNCTION
+        # Общий сосед: стягивание схлопнуло бы треугольник
+        if self.other(u, v) == self.other(v, u):
+            return REJECT_COMMON_NEIGHBOR
+        if v not in (self.first[u], self.second[u]):
+            return REJECT_NOT_ADJACENT
+        return None
+
+    def reject(self, u, v, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        if self.trace_ids is not None:
+            logger.log(TRACE, "Edge %d-%d rejected: %s", self.trace_ids[u], self.trace_ids[v], reason)
+
+    def statistics(self):
+        return {
+            'considered': self.considered,
+            'contracted': self.contracted,
+            'rescored': self.rescored,
+            'rejected': self.rejected,
+            'topology_seconds': self.topology_seconds,
+        }
+
+    def rings_allow(self, vertex):
+        arc = self.vertex_arc[vertex]
+        rings = self.arc_rings
+        for k in range(self.arc_rings_offsets[arc], self.arc_rings_offsets[arc + 1]):
+            ring = rings[k]
+            if self.ring_sizes[ring] - 1 < self.ring_minimum[ring]:
+                return False
+        return True
+
+    def budget_allows(self, vertex):
+        # Вершина общей дуги уменьшает остаток бюджета на каждое кольцо слоя, проходящее
+        # по дуге, поэтому остатка должно хватить на все эти кольца сразу
+        arc = self.vertex_arc[vertex]
+        rings = self.arc_rings
+        needed = {}
+        for k in range(self.arc_rings_offsets[arc], self.arc_rings_offsets[arc + 1]):
+            group = self.ring_group[rings[k]]
+            if group >= 0:
+                needed[group] = needed.get(group, 0) + 1
+        for group, count in needed.items():
+            if self.allowance[group] < count:
+                return False
+        return True
+
+    def triangle_empty(self, vertex, p, q):
+        # Внутри треугольника p-vertex-q не должно оставаться других вершин
+        xs = self.xs
+        ys = self.ys
+        ax, ay = xs[p], ys[p]
+        bx, by = xs[vertex], ys[vertex]
+        cx, cy = xs[q], ys[q]
+        xmin, xmax = min(ax, bx, cx), max(ax, bx, cx)
+        ymin, ymax = min(ay, by, cy), max(ay, by, cy)
+        active = self.active
+        for other in self.grid.query(xmin, ymin, xmax, ymax):
+            if other == vertex or other == p or other == q or not active[other]:
+                continue
+            x, y = xs[other], ys[other]
+            if x < xmin or x > xmax or y < ymin or y > ymax:
+                continue
+            d1 = _cross(ax, ay, bx, by, x, y)
+            d2 = _cross(bx, by, cx, cy, x, y)
+            d3 = _cross(cx, cy, ax, ay, x, y)
+            if not ((d1 < 0 or d2 < 0 or d3 < 0) and (d1 > 0 or d2 > 0 or d3 > 0)):
+                return False
+        return True
+
+    def remove(self, vertex, keep):
+        # Вершина vertex удаляется, её соседи соединяются напрямую
+        p = self.other(vertex, keep)
+        for neighbor, replacement in ((p, keep), (keep, p)):
+            if self.degree[neighbor] == 2:
+                if self.first[neighbor] == vertex:
+                    self.first[neighbor] = replacement
+                else:
+                    self.second[neighbor] = replacement
+                self.version[neighbor] += 1
+        self.active[vertex] = 0
+        if self.hidden is not None:
+            hidden = self.hidden
+            merged = hidden.pop((vertex, p) if vertex < p else (p, vertex), [])
+            merged += hidden.pop((vertex, keep) if vertex < keep else (keep, vertex), ())
+            merged.append(vertex)
+            hidden[(p, keep) if p < keep else (keep, p)] = merged
+        arc = self.vertex_arc[vertex]
+        rings = self.arc_rings
+        for k in range(self.arc_rings_offsets[arc], self.arc_rings_offsets[arc + 1]):
+            ring = rings[k]
+            self.ring_sizes[ring] -= 1
+            group = self.ring_group[ring]
+            if group >= 0:
+                self.allowance[group] -= 1
+                if self.allowance[group] == 0:
+                    self.open_groups -= 1
+        return p
+
+    def edge_entry(self, u, v):
+        # Запись кучи для ребра u-v с текущими стоимостью и версиями; None -- ребра больше нет
+        if u > v:
+            u, v = v, u
+        if self.vertex_arc[u] < 0 or self.vertex_arc[u] != self.vertex_arc[v]:
+            return None
+        if self.locked[u] or self.locked[v] or not (self.active[u] and self.active[v]):
+            return None
+        if v != self.first[u] and v != self.second[u]:
+            return None
+        return (min(self.cost(u), self.cost(v)), u, v, self.version[u], self.version[v])
+
+    def run(self, heap, poll=None, limit=None, tolerance=None, budget_stop=False):
+        # Стягивание до предела удалений limit, исчерпания бюджетов или кучи; для каждого удаления
+        # запоминается наибольший из извлечённых к этому моменту ключей -- по нему части
+        # сливаются в общий порядок. Допуск tolerance только отсеивает рёбра и не меняет
+        # порядок: рёбра дороже допуска в кучу не добавляются, а вершина с накопленной ошибкой
+        # больше допуска не удаляется
+        removed = []
+        keys = []
+        latest = None
+        version = self.version
+        perf_counter = time.perf_counter
+        heappush = heapq.heappush
+        if tolerance is not None:
+            self.hidden = {}
+        tolerance = math.inf if tolerance is None else tolerance
+        pops = 0
+        while heap:
+            pops += 1
+            if poll is not None and pops % _POLL_INTERVAL == 0:
+                poll(len(removed))
+            entry = heapq.heappop(heap)
+            if latest is None or entry > latest:
+                latest = entry
+            cost, u, v, version_u, version_v = entry
+            if version[u] != version_u or version[v] != version_v:
+                # Ленивое удаление: устаревшая запись отбрасывается, свежая для ребра
+                # уже добавлена при стягивании соседнего
+                self.reject(u, v, REJECT_STALE)
+                continue
+            self.considered += 1
+            reason = self.rejection(u, v)
+            if reason is not None:
+                self.reject(u, v, reason)
+                continue
+            cost_u = self.cost(u)
+            cost_v = self.cost(v)
+            vertex, keep = (u, v) if cost_u <= cost_v else (v, u)
+            p = self.other(vertex, keep)
+            if self.outside[p]:
+                self.reject(u, v, REJECT_OUTSIDE)
+                continue
+            if not self.rings_allow(vertex):
+                self.reject(u, v, REJECT_RING_SIZE)
+                continue
+            if self.allowance and not self.budget_allows(vertex):
+                self.reject(u, v, REJECT_BUDGET)
+                continue
+            if self.hidden is not None and self.error(vertex) > tolerance:
+                self.reject(u, v, REJECT_TOLERANCE)
+                continue
+            started = perf_counter()
+            empty = self.triangle_empty(vertex, p, keep)
+            self.topology_seconds += perf_counter() - started
+            if not empty:
+                self.reject(u, v, REJECT_TOPOLOGY)
+                continue
+            self.remove(vertex, keep)
+            removed.append(vertex)
+            keys.append(latest)
+            self.contracted += 1
+            if self.trace_ids is not None:
+                logger.log(TRACE, "Edge %d-%d contracted, vertex %d removed at cost %g",
+                           self.trace_ids[u], self.trace_ids[v], self.trace_ids[vertex], cost)
+            if len(removed) == limit or budget_stop and not self.open_groups:
+                break
+
+            # Новое ребро p-keep и рёбра по обе стороны получают свежие записи с новыми версиями
+            edges = [(p, keep)]
+            if self.degree[p] == 2:
+                edges.append((self.other(p, keep), p))
+            if self.degree[keep] == 2:
+                edges.append((keep, self.other(keep, p)))
+            for index, (a, b) in enumerate(edges):
+                entry = self.edge_entry(a, b)
+                if entry is not None and entry[0] <= tolerance:
+                    if index:
+                        self.rescored += 1
+                    heappush(heap, entry)
+        return removed, keys
@@ -1,21 +1,30 @@
+import json
 import os
-import sys
 from qgis.core import (
     QgsProcessingAlgorithm,
+    QgsProcessingException,
     QgsProcessingParameterMultipleLayers,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterString,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterExtent,
+    QgsProcessingContext,
+    QgsExpression,
     QgsProcessing,
     QgsFeatureRequest,
     QgsGeometry,
     QgsFeature,
-    QgsPointXY,
+    QgsFeatureSink,
+    QgsRectangle,
     QgsProcessingProvider,
     QgsApplication,
     QgsWkbTypes,
     QgsFields,
     QgsField,
-    QgsVectorLayer,
-    QgsProject,
     QgsProcessingUtils
 )
 from qgis.PyQt.QtCore import QCoreApplication, QVariant
@@ -23,8 +32,13 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
 import processing  # Импортируем модуль processing
 
-sys.path.append(os.path.dirname(__file__))
-import TopoCartGenCore
+from .backend import BACKEND_NAME, TopoCartGenCore, create_executor
+from .graph_cache import GraphCache, graph_key
+from .tiles import TileGrid, TileStitcher
+from .validation import FAILED, FIXED, find_new_intersections, validate_geometries
+from .buffers import (
+    FeatureBufferBuilder, changed_features, conform_to_targets, encode_wkb, process_buffer_levels, POINT, LINE, POLYGON
+)
 
 class TopoCartGenPlugin:
     def __init__(self, iface):
@@ -86,51 +100,229 @@ class PluginProcessingProvider(QgsProcessingProvider):
     def loadAlgorithms(self):
         self.addAlgorithm(GraphProcessorPlugin())
 
-class GraphProcessorPlugin(QgsProcessingAlgorithm):
-    INPUT = 'INPUT'
-    RATIO = 'RATIO'
+class BatchedSink:
+    # Пакетная запись объектов в выходной слой вместо вызова addFeatures на каждый объект
+    def __init__(self, sink, destination, output_name, batch_size, feedback):
+        self.sink = sink
+        self.destination = destination
+        self.output_name = output_name
+        self.batch_size = batch_size
+        self.feedback = feedback
+        self.batch = []
+        self.batch_points = 0
+        self.added_count = 0
+        self.points_count = 0
 
-    def initAlgorithm(self, config=None):
-        self.addParameter(
-            QgsProcessingParameterMultipleLayers(
-                self.INPUT,
-                'Input layers',
-                layerType=QgsProcessing.TypeVectorAnyGeometry
-            )
-        )
-        self.addParameter(
-            QgsProcessingParameterNumber(
-                self.RATIO,
-                'Simplification ratio (0-1)',
-                QgsProcessingParameterNumber.Double,
-                0.5,
-                False,
-                0.0,
-                1.0
-            )
-        )
+    def add(self, feature, points_count):
+        self.batch.append(feature)
+        self.batch_points += points_count
+        if len(self.batch) >= self.batch_size:
+            self.flush()
 
-    def processAlgorithm(self, parameters, context, feedback):
-        input_layers = self.parameterAsLayerList(parameters, self.INPUT, context)
-        ratio = self.parameterAsDouble(parameters, self.RATIO, context)
-        feedback.pushInfo(f"Simplification ratio: {ratio}")
+    def flush(self):
+        if not self.batch:
+            return
+        if self.sink.addFeatures(self.batch, QgsFeatureSink.FastInsert):
+            self.added_count += len(self.batch)
+            self.points_count += self.batch_points
+        else:
+            self.feedback.pushWarning(f"{self.output_name}: failed to write {len(self.batch)} features: {self.sink.lastError()}")
+        self.batch = []
+        self.batch_points = 0
 
-        if not input_layers:
-            feedback.pushWarning("No input layers selected!")
-            return {}
+    def close(self):
+        # Файловый слой дописывается при удалении объекта записи
+        self.flush()
+        self.sink.flushBuffer()
+        self.sink = None
 
-        # Подготовка выходных слоёв
-        output_layers = {}
-        layer_info = {}
-        original_points_total = {}  # Счётчик точек в исходных слоях
-        simplified_points_total = {}  # Счётчик точек в упрощённых слоях
-        total_original_points = 0  # Общее количество точек в исходных слоях
-        total_simplified_points = 0  # Общее количество точек в упрощённых слоях
+    def discard(self):
+        # Отменённая запись: объект записи удаляется без сброса пакета, недописанный файл стирается
+        self.batch = []
+        self.sink = None
+        if os.path.isfile(self.destination):
+            try:
+                os.remove(self.destination)
+            except OSError as error:
+                self.feedback.pushWarning(f"{self.output_name}: failed to remove partial output {self.destination}: {error}")
+
+
+class PatchSink:
+    # Запись поверх существующего упрощённого слоя: геометрии объектов заменяются
+    # по значению ключевого поля. ID объектов для сопоставления не годятся: они не сохраняются
+    # при записи и меняются при сохранении слоя в другой источник.
+    # Слой проекта нельзя менять из потока Processing, поэтому здесь замены только
+    # собираются, а применяет их apply() в основном потоке (postProcessAlgorithm)
+    def __init__(self, layer, key_field, batch_size, feedback):
+        self.layer = layer
+        self.key_field = key_field
+        self.destination = layer.id()
+        self.output_name = layer.name()
+        self.batch_size = batch_size
+        self.feedback = feedback
+        self.batch = {}
+        self.changes = {}
+        self.added_count = 0
+        self.points_count = 0
+        self.missing_count = 0
+
+    def add(self, feature, points_count):
+        self.batch[feature[self.key_field]] = (QgsGeometry(feature.geometry()), points_count)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def target_ids(self):
+        # Объекты целевого слоя читаются без геометрии и только для ключей пакета
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        values = ', '.join(QgsExpression.quotedValue(value) for value in self.batch)
+        request.setFilterExpression(f"{QgsExpression.quotedColumnRef(self.key_field)} IN ({values})")
+        request.setSubsetOfAttributes([self.key_field], self.layer.fields())
+        return {feature[self.key_field]: feature.id() for feature in self.layer.getFeatures(request)}
+
+    def flush(self):
+        if not self.batch:
+            return
+        # Чтение целевого слоя из потока допустимо: getFeatures работает по снимку источника
+        targets = self.target_ids()
+        for key, (geometry, points) in self.batch.items():
+            target_id = targets.get(key)
+            if target_id is None:
+                self.missing_count += 1
+                continue
+            self.changes[target_id] = geometry
+            self.added_count += 1
+            self.points_count += points
+        self.batch = {}
+
+    def discard(self):
+        # Отменённый запуск не меняет целевой слой
+        self.batch = {}
+        self.changes = {}
+
+    def close(self):
+        self.flush()
+        if self.missing_count:
+            self.feedback.pushWarning(f"{self.output_name}: {self.missing_count} features not found in the target layer")
+
+    def apply(self, feedback):
+        # Вызывается в основном потоке. Слой в режиме редактирования получает замены в буфер
+        # правок (их можно отменить или сохранить вместе с остальными), иначе они пишутся в источник
+        if not self.changes:
+            return
+        if self.layer.isEditable():
+            failed = sum(not self.layer.changeGeometry(target_id, geometry) for target_id, geometry in self.changes.items())
+            if failed:
+                feedback.pushWarning(f"{self.output_name}: failed to update {failed} features in the edit buffer")
+        elif not self.layer.dataProvider().changeGeometryValues(self.changes):
+            feedback.pushWarning(f"{self.output_name}: failed to update {len(self.changes)} features: {self.layer.dataProvider().lastError()}")
+        self.changes = {}
+        self.layer.triggerRepaint()
+
+
+class CoreProgress:
+    # Перевод этапов ядра (phase, fraction) в общий прогресс алгоритма в диапазоне [start, end]
+    PHASES = {
+        'intersections': ('Finding intersections', 0.0, 0.45),
+        'heap': ('Building edge heap', 0.45, 0.5),
+        'contraction': ('Contracting edges', 0.5, 1.0),
+    }
+
+    def __init__(self, feedback, start=0.0, end=100.0):
+        self.feedback = feedback
+        self.start = start
+        self.end = end
+        self.phase = None
+
+    def __call__(self, phase, fraction):
+        text, low, high = self.PHASES.get(phase, (phase, 0.0, 1.0))
+        if phase != self.phase:
+            self.phase = phase
+            self.feedback.setProgressText(text)
+        self.feedback.setProgress(self.start + (self.end - self.start) * (low + (high - low) * fraction))
 
-        for layer in input_layers:
-            source = layer.source()
-            layer_name = source.split('layername=')[-1] if 'layername=' in source else layer.name()
-            output_layer_name = f"{layer_name}_simplified"
+
+def merge_stats(total, stats):
+    # Сложение статистики ядра (вложенные словари чисел), например по тайлам
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            merge_stats(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def layer_output_name(layer):
+    source = layer.source()
+    return source.split('layername=')[-1] if 'layername=' in source else layer.name()
+
+
+class SimplificationRun:
+    # Выходные слои и счётчики точек одного запуска алгоритма.
+    # Для каждого коэффициента из ratios создаётся свой набор выходных слоёв (уровень масштаба)
+    def __init__(self, context, feedback, output_directory=None, output_extension='gpkg', batch_size=10000,
+                 executor=None, workers=1, ratios=(0.5,), cache=None, stats_file=None, check_intersections=False,
+                 headless=False, tolerance=0.0, budgets=None):
+        self.context = context
+        self.feedback = feedback
+        self.output_directory = output_directory
+        self.output_extension = output_extension
+        self.batch_size = batch_size
+        self.executor = executor
+        self.workers = workers
+        # Отмена из интерфейса QGIS передаётся в ядро через токен, который ядро опрашивает между пакетами
+        self.cancellation = None
+        if getattr(TopoCartGenCore, 'SUPPORTS_PROGRESS', False):
+            self.cancellation = TopoCartGenCore.CancellationToken()
+            feedback.canceled.connect(self.cancellation.cancel)
+            if feedback.isCanceled():
+                self.cancellation.cancel()
+        self.ratios = list(ratios)
+        # Пределы остановки стягивания: наибольшее смещение вершины и бюджеты вершин слоёв
+        self.tolerance = tolerance
+        self.budgets = budgets or {}
+        self.cache = cache
+        self.stats_file = stats_file
+        self.check_intersections = check_intersections
+        self.new_intersections = 0
+        # Без интерфейса результат только пишется в файлы, а предупреждения по объектам сводятся в счётчики
+        self.headless = headless
+        self.warning_counts = {}
+        self.stats = {}  # Суммарная статистика ядра за запуск
+        # Оценка памяти ядра: в тайловом режиме -- наибольшая по тайлам, выводится один раз в конце
+        self.tiled = False
+        self.memory_estimate = None
+        self.estimated_graphs = 0
+        self.output_layers = [{} for _ in self.ratios]
+        self.layer_info = {}
+        self.original_points_total = {}  # Счётчик точек в исходных слоях
+        # Обновляемые на месте слои по имени входного слоя и поле, связывающее их объекты
+        self.targets = {}
+        self.key_field = ''
+        # Закрытые PatchSink, замены которых применяются после алгоритма в основном потоке
+        self.patches = []
+
+    def destination(self, output_layer_name):
+        # Без каталога результат остаётся во временных слоях в памяти
+        if not self.output_directory:
+            return f"memory:{output_layer_name}"
+        os.makedirs(self.output_directory, exist_ok=True)
+        return os.path.join(self.output_directory, f"{output_layer_name}.{self.output_extension}")
+
+    def warn_feature(self, kind, message):
+        if self.headless:
+            self.warning_counts[kind] = self.warning_counts.get(kind, 0) + 1
+        else:
+            self.feedback.pushWarning(message)
+
+    def level_suffix(self, ratio):
+        # Один уровень -- прежнее имя слоя, несколько -- имя с процентом упрощения
+        return '' if len(self.ratios) == 1 else f"_{ratio * 100:g}"
+
+    def create_outputs(self, input_layers, targets=None, key_field=''):
+        # targets -- существующие упрощённые слои (по одному на входной), которые дополняются на месте
+        feedback = self.feedback
+        for position, layer in enumerate(input_layers):
+            layer_name = layer_output_name(layer)
 
             fields = layer.fields()
             wkb_type = layer.wkbType()
@@ -144,277 +336,368 @@ class GraphProcessorPlugin(QgsProcessingAlgorithm):
                 output_wkb_type = wkb_type
 
             crs = layer.sourceCrs()
-            wkb_type_str = QgsWkbTypes.displayString(output_wkb_type).lower()
-            layer_uri = f"{wkb_type_str}?crs={crs.authid()}"
-            output_layer = QgsVectorLayer(layer_uri, output_layer_name, "memory")
-            output_layer.dataProvider().addAttributes(fields.toList())
-            output_layer.updateFields()
-
-            if not output_layer.isValid():
-                feedback.pushWarning(f"Failed to create output layer for {output_layer_name}")
+            sinks = []
+            if targets:
+                target = targets[position]
+                for checked in (layer, target):
+                    if checked.fields().indexOf(key_field) < 0:
+                        raise QgsProcessingException(f"Key field {key_field} not found in layer {checked.name()}")
+                sinks.append(PatchSink(target, key_field, self.batch_size, feedback))
+                self.targets[layer_name] = target
+                self.key_field = key_field
+            for ratio in self.ratios if not targets else ():
+                output_layer_name = f"{layer_name}_simplified{self.level_suffix(ratio)}"
+                sink, destination = QgsProcessingUtils.createFeatureSink(
+                    self.destination(output_layer_name), self.context, fields, output_wkb_type, crs
+                )
+                if sink is None:
+                    feedback.pushWarning(f"Failed to create output layer for {output_layer_name}")
+                    break
+                sinks.append(BatchedSink(sink, destination, output_layer_name, self.batch_size, feedback))
+            if len(sinks) != len(self.ratios):
                 continue
 
-            context.temporaryLayerStore().addMapLayer(output_layer)
-            output_layers[layer_name] = (output_layer, output_layer_name)
-            layer_info[layer_name] = {
+            for outputs, output in zip(self.output_layers, sinks):
+                outputs[layer_name] = output
+            geometry_type = layer.geometryType()
+            is_polygon = geometry_type == QgsProcessing.TypeVectorPolygon
+            is_line = geometry_type == QgsProcessing.TypeVectorLine
+            self.layer_info[layer_name] = {
                 'fields': fields,
                 'wkb_type': output_wkb_type,
                 'crs': crs,
-                'geometry_type': layer.geometryType()
+                'geometry_type': geometry_type,
+                'buffer_type': POLYGON if is_polygon else LINE if is_line else POINT,
+                'min_points': 4 if is_polygon else 2 if is_line else 1
             }
-            original_points_total[layer_name] = 0  # Инициализация счётчика для исходных точек
-            simplified_points_total[layer_name] = 0  # Инициализация счётчика для упрощённых точек
+            self.original_points_total[layer_name] = 0  # Инициализация счётчика для исходных точек
+            feedback.pushInfo(f"Layer {layer_name}: {layer.featureCount()} features, geometry type = {QgsWkbTypes.displayString(wkb_type)}")
 
-        # Собираем данные из всех слоёв
-        total_features = 0
-        features_data = []
+    def read_layers(self, input_layers, request=None, owns=None, primary=None):
+        # Собираем данные слоёв в плоские буферы координат.
+        # Объекты, для которых owns() ложно, попадают в замороженный контекст.
+        # Объект, который читается несколько раз (в нескольких тайлах), учитывается в счётчиках
+        # и пишется без упрощения только в чтении, где primary() истинно
+        feedback = self.feedback
+        buffers = []
+        frozen_buffers = []
         original_features = {}
         original_points_count = {}
 
         for layer in input_layers:
-            source = layer.source()
-            layer_name = source.split('layername=')[-1] if 'layername=' in source else layer.name()
-            geometry_type = layer_info[layer_name]['geometry_type']
-            is_polygon = geometry_type == QgsProcessing.TypeVectorPolygon
-            is_line = geometry_type == QgsProcessing.TypeVectorLine
-            is_point = geometry_type == QgsProcessing.TypeVectorPoint
-
-            layer_feature_count = layer.featureCount()
-            total_features += layer_feature_count
-            feedback.pushInfo(f"Layer {layer_name}: {layer_feature_count} features, geometry type = {QgsWkbTypes.displayString(layer.wkbType())}")
+            layer_name = layer_output_name(layer)
+            if layer_name not in self.layer_info:
+                continue
+            layer_data = self.layer_info[layer_name]
+            builder = FeatureBufferBuilder(layer_name, layer_data['buffer_type'])
+            frozen_builder = FeatureBufferBuilder(layer_name, layer_data['buffer_type'])
+            min_points = layer_data['min_points']
 
-            for feature in layer.getFeatures():
+            for feature in layer.getFeatures(request or QgsFeatureRequest()):
+                if feedback.isCanceled():
+                    break
                 feature_id = feature.id()
                 geometry = feature.geometry()
-                points = []
 
                 if geometry.isEmpty():
-                    feedback.pushWarning(f"Layer {layer_name}, feature ID {feature_id}: empty geometry, skipping")
+                    if (owns is None or owns(layer_name, feature, geometry)) and \
+                            (primary is None or primary(layer_name, feature, geometry)):
+                        self.warn_feature('empty geometry', f"Layer {layer_name}, feature ID {feature_id}: empty geometry, skipping")
+                    continue
+
+                if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+                    geometry.convertToStraightSegment()
+
+                if owns is not None and not owns(layer_name, feature, geometry):
+                    frozen_builder.add_wkb(feature_id, geometry.asWkb().data())
                     continue
 
-                if is_polygon:
-                    if geometry.isMultipart():
-                        for part in geometry.asMultiPolygon():
-                            for ring in part:
-                                points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in ring])
-                    else:
-                        for ring in geometry.asPolygon():
-                            points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in ring])
-                elif is_line:
-                    if geometry.isMultipart():
-                        for line in geometry.asMultiPolyline():
-                            points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in line])
-                    else:
-                        points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in geometry.asPolyline()])
-                elif is_point:
-                    if geometry.isMultipart():
-                        points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in geometry.asMultiPoint()])
-                    else:
-                        points.append(TopoCartGenCore.Point(geometry.asPoint().x(), geometry.asPoint().y()))
-
-                min_points = 4 if is_polygon else 2 if is_line else 1
-                if len(points) < min_points:
-                    feedback.pushWarning(f"Layer {layer_name}, feature ID {feature_id}: insufficient points ({len(points)}), using original geometry")
-                    output_layer, _ = output_layers[layer_name]
-                    success, _ = output_layer.dataProvider().addFeatures([feature])
-                    if not success:
-                        feedback.pushWarning(f"Layer {layer_name}, feature ID {feature_id}: failed to add original feature to output layer")
-                    original_points_total[layer_name] += len(points)  # Считаем точки для исходного слоя
-                    total_original_points += len(points)  # Обновляем общее количество точек
+                # Вершины читаются из WKB целиком, без создания объекта на каждую точку
+                points_count = geometry.constGet().nCoordinates()
+                counted = primary is None or primary(layer_name, feature, geometry)
+                if counted:
+                    self.original_points_total[layer_name] += points_count  # Считаем точки для исходного слоя
+                if points_count < min_points:
+                    if not counted:
+                        continue
+                    self.warn_feature('insufficient points', f"Layer {layer_name}, feature ID {feature_id}: insufficient points ({points_count}), using original geometry")
+                    for outputs in self.output_layers:
+                        outputs[layer_name].add(feature, points_count)
                     continue
 
-                features_data.append((layer_name, feature_id, is_polygon, points))
+                builder.add_wkb(feature_id, geometry.asWkb().data())
                 original_features[(layer_name, feature_id)] = feature
-                original_points_count[(layer_name, feature_id)] = len(points)
-                original_points_total[layer_name] += len(points)  # Считаем точки для исходного слоя
-                total_original_points += len(points)  # Обновляем общее количество точек
+                original_points_count[(layer_name, feature_id)] = points_count
 
-        feedback.pushInfo(f"Total features: {total_features}, features to process: {len(features_data)}")
+            if len(builder):
+                buffers.append(builder.build())
+            if len(frozen_builder):
+                frozen_buffers.append(frozen_builder.build())
+        return buffers, frozen_buffers, original_features, original_points_count
 
-        if not features_data:
-            feedback.pushWarning("No data to process! Output layers will be empty.")
-            return {output_layer_name: output_layer.id() for _, (output_layer, output_layer_name) in output_layers.items()}
+    def read_targets(self, request, skipped_keys):
+        # Текущие (уже упрощённые) геометрии соседей из обновляемых слоёв -- замороженный контекст.
+        # skipped_keys -- значения ключа по слоям для объектов, которые сейчас упрощаются заново
+        frozen_buffers = []
+        for layer_name, target in self.targets.items():
+            builder = FeatureBufferBuilder(layer_name, self.layer_info[layer_name]['buffer_type'])
+            skipped = skipped_keys.get(layer_name, ())
+            for feature in target.getFeatures(request):
+                if self.feedback.isCanceled():
+                    break
+                geometry = feature.geometry()
+                if feature[self.key_field] in skipped or geometry.isEmpty():
+                    continue
+                if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+                    geometry.convertToStraightSegment()
+                builder.add_wkb(feature.id(), geometry.asWkb().data())
+            if len(builder):
+                frozen_buffers.append(builder.build())
+        return frozen_buffers
 
-        # Упрощение всех геометрий
-        feedback.pushInfo("Starting simplification with TopoCartGenCore.Graph")
+    def simplify(self, buffers, original_features, original_points_count, frozen=(), extent=None,
+                 progress_range=(0.0, 100.0), original_buffers=None):
+        # original_buffers -- буферы, с которыми сравнивается результат, если входные уже изменены
+        levels = self.simplify_levels(buffers, frozen, extent, progress_range)
+        if levels is not None:
+            self.write_levels(levels, original_buffers or buffers, original_features, original_points_count)
+        return levels
+
+    def simplify_levels(self, buffers, frozen=(), extent=None, progress_range=(0.0, 100.0)):
+        # Граф строится один раз, все уровни берутся из одной истории стягивания
         graph = TopoCartGenCore.Graph()
-        simplified_features = graph.processFeatures(features_data, ratio)
-        graph.clear()
-        feedback.pushInfo(f"Simplified features: {len(simplified_features)}")
+        if self.executor is not None:
+            graph.setExecutor(self.executor, self.workers)
+        if self.cancellation is not None:
+            graph.setProgressCallback(CoreProgress(self.feedback, *progress_range))
+            graph.setCancellationToken(self.cancellation)
+        if self.tolerance > 0 or self.budgets:
+            graph.setStoppingCriteria(self.tolerance or None, self.budgets)
+        if getattr(TopoCartGenCore, 'SUPPORTS_MEMORY_REPORT', False):
+            estimate = TopoCartGenCore.Graph.estimateMemory(buffers, frozen)
+            self.estimated_graphs += 1
+            if self.memory_estimate is None or estimate['total'] > self.memory_estimate['total']:
+                self.memory_estimate = estimate
+            if not self.tiled:
+                self.feedback.pushInfo(f"Estimated core memory: {estimate['total'] / 1024 ** 2:.0f} MB for {estimate['vertices']} vertices")
+        # Граф после поиска пересечений берётся из кэша, если входные данные не менялись
+        cache_key = noded = None
+        if self.cache is not None:
+            cache_key = graph_key(BACKEND_NAME, buffers, frozen)
+            noded = self.cache.load(cache_key)
+        try:
+            levels = process_buffer_levels(TopoCartGenCore, graph, buffers, self.ratios, frozen, extent, noded)
+            if cache_key is not None and noded is None:
+                self.store_graph(cache_key, graph)
+            if hasattr(graph, 'stats'):
+                merge_stats(self.stats, graph.stats.as_dict())
+        except getattr(TopoCartGenCore, 'OperationCanceled', ()):
+            return None
+        finally:
+            graph.clear()
+        return levels
+
+    def write_levels(self, levels, buffers, original_features, original_points_count):
+        # Буферы результата сопоставляются с входными по слою: ядро может вернуть не все слои.
+        # Без входных буферов (buffers = None) все объекты считаются изменёнными
+        inputs = {buffer.layer_id: buffer for buffer in buffers or ()}
+        for outputs, simplified_buffers in zip(self.output_layers, levels):
+            changed = [changed_features(inputs.get(buffer.layer_id), buffer) for buffer in simplified_buffers]
+            self.write_results(outputs, simplified_buffers, changed, original_features, original_points_count)
 
-        # Распределение упрощённых объектов по выходным слоям
-        added_features_count = {layer_name: 0 for layer_name in output_layers}
+    def store_graph(self, cache_key, graph):
+        try:
+            self.cache.store(cache_key, graph.nodedState())
+        except OSError as error:
+            self.feedback.pushWarning(f"Failed to write graph cache {self.cache.directory}: {error}")
+
+    def write_results(self, outputs, simplified_buffers, changed, original_features, original_points_count):
+        # Распределение упрощённых объектов по выходным слоям одного уровня.
+        # Проверяются только изменённые ядром объекты, пакетами в потоках
+        feedback = self.feedback
         processed_feature_ids = set()
+        # Объект с новой геометрией копируется, если исходный нужен и другим уровням
+        shared = len(self.output_layers) > 1
+        records = []  # (выходной слой, объект или ключ упрощённого объекта, число точек) в порядке буферов
+        pending = []  # (номер записи, ключ, геометрия, число точек)
 
-        for layer_id, feature_id, is_polygon, points in simplified_features:
-            processed_feature_ids.add((layer_id, feature_id))
+        for buffer, changed_mask in zip(simplified_buffers, changed):
+            layer_id = buffer.layer_id
 
-            if layer_id not in output_layers:
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: no output layer found, skipping")
+            if layer_id not in outputs:
+                feedback.pushWarning(f"Layer {layer_id}: no output layer found, skipping {buffer.feature_count} features")
                 continue
 
-            output_layer, _ = output_layers[layer_id]
-            layer_data = layer_info[layer_id]
-            fields = layer_data['fields']
+            output = outputs[layer_id]
+            layer_data = self.layer_info[layer_id]
             output_wkb_type = layer_data['wkb_type']
+            min_points = layer_data['min_points']
+            vertex_counts = buffer.feature_vertex_counts()
+            ring_sizes = buffer.ring_sizes()
 
-            original_count = original_points_count.get((layer_id, feature_id), 0)
-            is_closed = points and points[0] == points[-1]
-            min_points = 4 if is_polygon else 2
-            if len(points) < min_points:
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: insufficient points after simplification ({len(points)}), using original geometry")
-                success, _ = output_layer.dataProvider().addFeatures([original_features[(layer_id, feature_id)]])
-                if success:
-                    added_features_count[layer_id] += 1
-                else:
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                simplified_points_total[layer_id] += original_count  # Считаем точки для исходного слоя, если упрощение не удалось
-                total_simplified_points += original_count  # Обновляем общее количество упрощённых точек
-                continue
+            for index in range(buffer.feature_count):
+                feature_id = int(buffer.feature_ids[index])
+                key = (layer_id, feature_id)
+                if key not in original_features or key in processed_feature_ids:
+                    self.warn_feature('unexpected feature', f"Layer {layer_id}, feature ID {feature_id}: unexpected or repeated feature in the core result, skipping")
+                    continue
+                processed_feature_ids.add(key)
+                original_feature = original_features[key]
+                original_count = original_points_count[key]
+                points_count = int(vertex_counts[index])
 
-            if is_polygon:
-                if not is_closed and points:
-                    points.append(points[0])
-                point_list = [[QgsPointXY(p.getX(), p.getY()) for p in points]]
-                geometry = QgsGeometry.fromPolygonXY(point_list)
-            else:
-                point_list = [QgsPointXY(p.getX(), p.getY()) for p in points]
-                if output_wkb_type == QgsWkbTypes.MultiLineString:
-                    geometry = QgsGeometry.fromMultiPolylineXY([point_list])
-                else:
-                    geometry = QgsGeometry.fromPolylineXY(point_list)
-
-            if not geometry or geometry.isEmpty():
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: empty geometry after simplification, using original geometry")
-                success, _ = output_layer.dataProvider().addFeatures([original_features[(layer_id, feature_id)]])
-                if success:
-                    added_features_count[layer_id] += 1
-                else:
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                simplified_points_total[layer_id] += original_count  # Считаем точки для исходного слоя, если упрощение не удалось
-                total_simplified_points += original_count  # Обновляем общее количество упрощённых точек
-                continue
+                # Неизменённый объект пишется как есть, без копирования атрибутов
+                if not changed_mask[index]:
+                    records.append((output, original_feature, original_count))
+                    continue
 
-            if output_wkb_type == QgsWkbTypes.MultiPolygon and geometry.wkbType() not in [QgsWkbTypes.Polygon, QgsWkbTypes.MultiPolygon]:
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: geometry type does not match output layer type MultiPolygon, using original geometry")
-                success, _ = output_layer.dataProvider().addFeatures([original_features[(layer_id, feature_id)]])
-                if success:
-                    added_features_count[layer_id] += 1
-                else:
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                simplified_points_total[layer_id] += original_count  # Считаем точки для исходного слоя, если упрощение не удалось
-                total_simplified_points += original_count  # Обновляем общее количество упрощённых точек
-                continue
+                first_ring = buffer.part_offsets[buffer.feature_offsets[index]]
+                last_ring = buffer.part_offsets[buffer.feature_offsets[index + 1]]
+                if last_ring == first_ring or ring_sizes[first_ring:last_ring].min() < min_points:
+                    self.warn_feature('insufficient points after simplification', f"Layer {layer_id}, feature ID {feature_id}: insufficient points after simplification ({points_count}), using original geometry")
+                    records.append((output, original_feature, original_count))
+                    continue
 
-            if output_wkb_type == QgsWkbTypes.MultiPolygon and geometry.wkbType() == QgsWkbTypes.Polygon:
-                polygon = geometry.asPolygon()
-                multi_polygon = [polygon]
-                geometry = QgsGeometry.fromMultiPolygonXY(multi_polygon)
+                geometry = QgsGeometry()
+                geometry.fromWkb(encode_wkb(buffer, index))
 
-            if not geometry.isGeosValid():
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: invalid geometry detected, attempting to fix")
-                geometry = geometry.makeValid()
                 if not geometry or geometry.isEmpty():
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: geometry fix failed, using original geometry")
-                    success, _ = output_layer.dataProvider().addFeatures([original_features[(layer_id, feature_id)]])
-                    if success:
-                        added_features_count[layer_id] += 1
-                    else:
-                        feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                    simplified_points_total[layer_id] += original_count  # Считаем точки для исходного слоя, если упрощение не удалось
-                    total_simplified_points += original_count  # Обновляем общее количество упрощённых точек
+                    self.warn_feature('empty geometry after simplification', f"Layer {layer_id}, feature ID {feature_id}: empty geometry after simplification, using original geometry")
+                    records.append((output, original_feature, original_count))
                     continue
 
-            original_feature = original_features[(layer_id, feature_id)]
-            feat = QgsFeature(fields)
-            feat.setId(feature_id)
-            feat.setGeometry(geometry)
-            feat.setAttributes(original_feature.attributes())
+                if QgsWkbTypes.flatType(output_wkb_type) == QgsWkbTypes.MultiPolygon and geometry.wkbType() != QgsWkbTypes.MultiPolygon:
+                    self.warn_feature('geometry type mismatch', f"Layer {layer_id}, feature ID {feature_id}: geometry type does not match output layer type MultiPolygon, using original geometry")
+                    records.append((output, original_feature, original_count))
+                    continue
 
-            success, _ = output_layer.dataProvider().addFeatures([feat])
-            if success:
-                added_features_count[layer_id] += 1
-            else:
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add simplified feature to output layer, using original geometry")
-                success, _ = output_layer.dataProvider().addFeatures([original_features[(layer_id, feature_id)]])
-                if success:
-                    added_features_count[layer_id] += 1
-                else:
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                simplified_points_total[layer_id] += original_count  # Считаем точки для исходного слоя, если упрощение не удалось
-                total_simplified_points += original_count  # Обновляем общее количество упрощённых точек
+                pending.append((len(records), key, geometry, points_count))
+                records.append((output, None, original_count))
+
+        checked = validate_geometries([geometry for _, _, geometry, _ in pending], self.workers)
+        simplified_geometries = {}
+        for (position, key, _, points_count), (geometry, status) in zip(pending, checked):
+            layer_id, feature_id = key
+            output, _, original_count = records[position]
+            if status == FAILED:
+                self.warn_feature('invalid geometry not fixed', f"Layer {layer_id}, feature ID {feature_id}: invalid geometry detected, geometry fix failed, using original geometry")
+                records[position] = (output, original_features[key], original_count)
                 continue
+            if status == FIXED:
+                self.warn_feature('invalid geometry fixed', f"Layer {layer_id}, feature ID {feature_id}: invalid geometry detected, fixed")
+            simplified_geometries[key] = geometry
+            records[position] = (output, key, points_count)
 
-            simplified_points_total[layer_id] += len(points)  # Считаем точки для упрощённого слоя
-            total_simplified_points += len(points)  # Обновляем общее количество упрощённых точек
-
-        for (layer_id, feature_id), feature in original_features.items():
-            if (layer_id, feature_id) not in processed_feature_ids:
-                feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: feature not simplified, using original geometry")
-                output_layer, _ = output_layers[layer_id]
-                fields = layer_info[layer_id]['fields']
-                feat = QgsFeature(fields)
-                feat.setId(feature_id)
-                feat.setGeometry(feature.geometry())
-                feat.setAttributes(feature.attributes())
-                success, _ = output_layer.dataProvider().addFeatures([feat])
-                if success:
-                    added_features_count[layer_id] += 1
-                else:
-                    feedback.pushWarning(f"Layer {layer_id}, feature ID {feature_id}: failed to add original feature to output layer")
-                # Подсчёт точек для неупрощённых объектов
-                geometry = feature.geometry()
-                points = []
-                if geometry.wkbType() in [QgsWkbTypes.LineString, QgsWkbTypes.MultiLineString]:
-                    if geometry.isMultipart():
-                        for line in geometry.asMultiPolyline():
-                            points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in line])
-                    else:
-                        points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in geometry.asPolyline()])
-                elif geometry.wkbType() in [QgsWkbTypes.Polygon, QgsWkbTypes.MultiPolygon]:
-                    if geometry.isMultipart():
-                        for part in geometry.asMultiPolygon():
-                            for ring in part:
-                                points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in ring])
-                    else:
-                        for ring in geometry.asPolygon():
-                            points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in ring])
-                elif geometry.wkbType() in [QgsWkbTypes.Point, QgsWkbTypes.MultiPoint]:
-                    if geometry.isMultipart():
-                        points.extend([TopoCartGenCore.Point(p.x(), p.y()) for p in geometry.asMultiPoint()])
-                    else:
-                        points.append(TopoCartGenCore.Point(geometry.asPoint().x(), geometry.asPoint().y()))
-                original_points_total[layer_id] += len(points)
-                simplified_points_total[layer_id] += len(points)
-                total_original_points += len(points)
-                total_simplified_points += len(points)
+        # Исходные геометрии ещё не заменены, поэтому сравнение идёт с ними
+        if self.check_intersections and simplified_geometries:
+            self.check_new_intersections(simplified_geometries, original_features)
+
+        for output, feature, points_count in records:
+            if isinstance(feature, tuple):
+                # Геометрия заменяется в исходном объекте, атрибуты остаются на месте
+                simplified_feature = QgsFeature(original_features[feature]) if shared else original_features[feature]
+                simplified_feature.setGeometry(simplified_geometries[feature])
+                feature = simplified_feature
+            output.add(feature, points_count)
+
+        for key, feature in original_features.items():
+            if key not in processed_feature_ids:
+                layer_id, feature_id = key
+                self.warn_feature('not simplified', f"Layer {layer_id}, feature ID {feature_id}: feature not simplified, using original geometry")
+                outputs[layer_id].add(feature, original_points_count[key])
 
+    def check_new_intersections(self, simplified_geometries, original_features):
+        # Поиск новых пересечений изменённых объектов с соседями того же запуска
+        originals = {key: original_features[key].geometry() for key in simplified_geometries}
+        unchanged = {
+            key: feature.geometry() for key, feature in original_features.items()
+            if key not in simplified_geometries and feature.hasGeometry()
+        }
+        pairs = find_new_intersections(simplified_geometries, originals, unchanged)
+        for (layer_id, feature_id), (other_layer_id, other_feature_id) in pairs:
+            self.warn_feature('new intersection', f"Layer {layer_id}, feature ID {feature_id}: simplified geometry intersects layer {other_layer_id}, feature ID {other_feature_id}")
+        self.new_intersections += len(pairs)
+
+    def discard(self):
+        for outputs in self.output_layers:
+            for output in outputs.values():
+                output.discard()
+
+    def finish(self):
         results = {}
-        for layer_name, (output_layer, output_layer_name) in output_layers.items():
-            output_layer.updateExtents()
-            feature_count = output_layer.featureCount()
-            feedback.pushInfo(f"Layer {layer_name}: {added_features_count[layer_name]} features written, actual count = {feature_count}")
+        if self.tiled and self.memory_estimate is not None:
+            estimate = self.memory_estimate
+            self.feedback.pushInfo(f"Estimated core memory: {estimate['total'] / 1024 ** 2:.0f} MB for {estimate['vertices']} vertices "
+                                   f"in the largest of {self.estimated_graphs} tiles")
+        for ratio, outputs in zip(self.ratios, self.output_layers):
+            self.finish_level(ratio, outputs, results)
+        if self.cache is not None:
+            self.feedback.pushInfo(f"Graph cache {self.cache.directory}: {self.cache.hits} hits, {self.cache.misses} misses")
+        if self.warning_counts:
+            self.feedback.pushWarning("Feature warnings: " + ', '.join(f"{kind} = {count}" for kind, count in sorted(self.warning_counts.items())))
+            self.stats['warnings'] = dict(self.warning_counts)
+        self.report_stats()
+        if self.check_intersections:
+            self.feedback.pushInfo(f"Intersection check: {self.new_intersections} new intersections between simplified features")
+        return results
 
-            if output_layer.isValid():
+    def report_stats(self):
+        feedback = self.feedback
+        if not self.stats:
+            return
+        counters = self.stats.get('counters', {})
+        timings = self.stats.get('timings', {})
+        rejected = ', '.join(f"{reason} = {count}" for reason, count in sorted(self.stats.get('rejected', {}).items()))
+        feedback.pushInfo(f"Core statistics: {counters.get('edges_considered', 0)} edges considered, "
+                          f"{counters.get('edges_contracted', 0)} contracted, rejected: {rejected or 'none'}")
+        feedback.pushInfo("Core timings: " + ', '.join(f"{stage} = {seconds:.3f} s" for stage, seconds in timings.items()))
+        if self.stats_file:
+            try:
+                with open(self.stats_file, 'w') as stats_file:
+                    json.dump(self.stats, stats_file, indent=2)
+            except OSError as error:
+                feedback.pushWarning(f"Failed to write statistics to {self.stats_file}: {error}")
+
+    def finish_level(self, ratio, outputs, results):
+        feedback = self.feedback
+        for layer_name, output in outputs.items():
+            output.close()
+            output_layer_name = output.output_name
+            if isinstance(output, PatchSink):
+                feedback.pushInfo(f"Layer {layer_name}: {output.added_count} features to update in {output_layer_name}")
+                self.patches.append(output)
+                output_layer = None
+            elif self.headless:
+                # Файл результата не открывается повторно и не добавляется в проект
+                feedback.pushInfo(f"Layer {layer_name}: {output.added_count} features written to {output.destination}")
+                output_layer = None
+            else:
+                output_layer = QgsProcessingUtils.mapLayerFromString(output.destination, self.context)
+                feature_count = output_layer.featureCount() if output_layer else 0
+                feedback.pushInfo(f"Layer {layer_name}: {output.added_count} features written, actual count = {feature_count}")
+
+            if output_layer is not None and output_layer.isValid():
+                # Слой добавляется в проект самим Processing после завершения алгоритма, в основном потоке
                 output_layer.setName(output_layer_name)
-                QgsProject.instance().addMapLayer(output_layer, True)
-                layer_tree = QgsProject.instance().layerTreeRoot()
-                layer_node = layer_tree.findLayer(output_layer.id())
-                if layer_node:
-                    layer_node.setItemVisibilityChecked(True)
+                self.context.addLayerToLoadOnCompletion(
+                    output_layer.id(),
+                    QgsProcessingContext.LayerDetails(output_layer_name, self.context.project(), output_layer_name)
+                )
 
             # Вычисление процента упрощения для каждого слоя
-            original_points = original_points_total[layer_name]
-            simplified_points = simplified_points_total[layer_name]
+            original_points = self.original_points_total[layer_name]
+            simplified_points = output.points_count
             if original_points > 0:
                 simplification_percentage = ((original_points - simplified_points) / original_points) * 100
                 feedback.pushInfo(f"Layer {layer_name}: Original points = {original_points}, Simplified points = {simplified_points}, Simplification percentage = {simplification_percentage:.2f}%")
             else:
                 feedback.pushInfo(f"Layer {layer_name}: No points to simplify")
 
-            results[output_layer_name] = output_layer.id()
+            results[output_layer_name] = output.destination
 
         # Вычисление общего процента упрощения
+        total_original_points = sum(self.original_points_total.values())
+        total_simplified_points = sum(output.points_count for output in outputs.values())
         if total_original_points > 0:
             total_simplification_percentage = ((total_original_points - total_simplified_points) / total_original_points) * 100
             feedback.pushInfo(f"Overall simplification: Original points = {total_original_points}, Simplified points = {total_simplified_points}, Total simplification percentage = {total_simplification_percentage:.2f}%")
@@ -422,7 +705,513 @@ class GraphProcessorPlugin(QgsProcessingAlgorithm):
             feedback.pushInfo("Overall simplification: No points to simplify across all layers")
 
         feedback.pushInfo(f"Processing completed with simplification ratio {ratio}")
-        return results
+
+
+class GraphProcessorPlugin(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    RATIO = 'RATIO'
+    TILE_SIZE = 'TILE_SIZE'
+    OUTPUT_DIRECTORY = 'OUTPUT_DIRECTORY'
+    OUTPUT_FORMAT = 'OUTPUT_FORMAT'
+    BATCH_SIZE = 'BATCH_SIZE'
+    WORKERS = 'WORKERS'
+    LEVELS = 'LEVELS'
+    TOLERANCE = 'TOLERANCE'
+    VERTEX_BUDGETS = 'VERTEX_BUDGETS'
+    CACHE_DIRECTORY = 'CACHE_DIRECTORY'
+    CACHE_SIZE = 'CACHE_SIZE'
+    STATS_FILE = 'STATS_FILE'
+    CHECK_INTERSECTIONS = 'CHECK_INTERSECTIONS'
+    HEADLESS = 'HEADLESS'
+    AOI_MODE = 'AOI_MODE'
+    AOI_EXTENT = 'AOI_EXTENT'
+    NEIGHBOR_BUFFER = 'NEIGHBOR_BUFFER'
+    TARGET = 'TARGET'
+    KEY_FIELD = 'KEY_FIELD'
+
+    AOI_ALL, AOI_SELECTION, AOI_EXTENT_MODE = range(3)
+    AOI_MODES = ['All features', 'Selected features only', 'Features in the area of interest extent']
+
+    OUTPUT_FORMATS = [('GeoPackage', 'gpkg'), ('FlatGeobuf', 'fgb')]
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT,
+                'Input layers',
+                layerType=QgsProcessing.TypeVectorAnyGeometry
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RATIO,
+                'Simplification ratio (0-1)',
+                QgsProcessingParameterNumber.Double,
+                0.5,
+                False,
+                0.0,
+                1.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.LEVELS,
+                'Ratios for multi-scale output, comma separated (one output layer per ratio, overrides ratio)',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TOLERANCE,
+                'Maximum vertex displacement, map units (0 = no limit)',
+                QgsProcessingParameterNumber.Double,
+                0.0,
+                True,
+                0.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.VERTEX_BUDGETS,
+                'Vertex budgets per layer, "layer=vertices" comma separated (simplification of a layer stops at its budget)',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TILE_SIZE,
+                'Tile size for streaming mode, map units (0 = process all features at once)',
+                QgsProcessingParameterNumber.Double,
+                0.0,
+                True,
+                0.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.AOI_MODE,
+                'Features to simplify',
+                self.AOI_MODES,
+                defaultValue=self.AOI_ALL
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExtent(
+                self.AOI_EXTENT,
+                'Area of interest extent',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.NEIGHBOR_BUFFER,
+                'Neighbour search buffer around the area of interest, map units',
+                QgsProcessingParameterNumber.Double,
+                0.0,
+                True,
+                0.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.TARGET,
+                'Existing simplified layers to update in place (same order as input layers)',
+                layerType=QgsProcessing.TypeVectorAnyGeometry,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.KEY_FIELD,
+                'Key field matching input and target features (required with target layers)',
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_DIRECTORY,
+                'Output directory (empty = temporary layers in memory)',
+                optional=True,
+                createByDefault=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                'Output file format',
+                [name for name, _ in self.OUTPUT_FORMATS],
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BATCH_SIZE,
+                'Features per write batch',
+                QgsProcessingParameterNumber.Integer,
+                10000,
+                False,
+                1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.CACHE_DIRECTORY,
+                'Noded graph cache directory (empty = no cache)',
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_SIZE,
+                'Noded graph cache size limit, MB',
+                QgsProcessingParameterNumber.Integer,
+                2048,
+                True,
+                1
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.CHECK_INTERSECTIONS,
+                'Check simplified features for new intersections with neighbours',
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.STATS_FILE,
+                'Core statistics (JSON)',
+                'JSON files (*.json)',
+                optional=True,
+                createByDefault=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.HEADLESS,
+                'Headless mode: write files only, summarize feature warnings',
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.WORKERS,
+                'Worker processes for independent parts of the graph (0 = all CPU cores)',
+                QgsProcessingParameterNumber.Integer,
+                1,
+                False,
+                0
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        self.patches = []
+        input_layers = self.parameterAsLayerList(parameters, self.INPUT, context)
+        ratio = self.parameterAsDouble(parameters, self.RATIO, context)
+        ratios = self.parseLevels(self.parameterAsString(parameters, self.LEVELS, context)) or [ratio]
+        tolerance = self.parameterAsDouble(parameters, self.TOLERANCE, context)
+        budgets = self.parseBudgets(self.parameterAsString(parameters, self.VERTEX_BUDGETS, context))
+        tile_size = self.parameterAsDouble(parameters, self.TILE_SIZE, context)
+        output_directory = self.parameterAsString(parameters, self.OUTPUT_DIRECTORY, context)
+        _, output_extension = self.OUTPUT_FORMATS[self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)]
+        batch_size = self.parameterAsInt(parameters, self.BATCH_SIZE, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context) or os.cpu_count() or 1
+        cache_directory = self.parameterAsString(parameters, self.CACHE_DIRECTORY, context)
+        cache_size = self.parameterAsInt(parameters, self.CACHE_SIZE, context)
+        stats_file = self.parameterAsFileOutput(parameters, self.STATS_FILE, context)
+        check_intersections = self.parameterAsBoolean(parameters, self.CHECK_INTERSECTIONS, context)
+        aoi_mode = self.parameterAsEnum(parameters, self.AOI_MODE, context)
+        neighbor_buffer = self.parameterAsDouble(parameters, self.NEIGHBOR_BUFFER, context)
+        targets = self.parameterAsLayerList(parameters, self.TARGET, context)
+        key_field = self.parameterAsString(parameters, self.KEY_FIELD, context)
+        headless = self.parameterAsBoolean(parameters, self.HEADLESS, context)
+        feedback.pushInfo(f"Simplification ratio: {', '.join(f'{r:g}' for r in ratios)}")
+
+        if not input_layers:
+            feedback.pushWarning("No input layers selected!")
+            return {}
+
+        if headless and not output_directory:
+            raise QgsProcessingException("Headless mode requires an output directory")
+        if headless and aoi_mode == self.AOI_SELECTION:
+            raise QgsProcessingException("Headless mode cannot use selected features")
+
+        aoi = None
+        if aoi_mode != self.AOI_ALL:
+            if tile_size > 0:
+                raise QgsProcessingException("Area of interest mode cannot be combined with tiled mode")
+            crs = self.sharedCrs(input_layers, "Area of interest mode")
+            aoi_extent = None
+            if aoi_mode == self.AOI_EXTENT_MODE:
+                aoi_extent = self.parameterAsExtent(parameters, self.AOI_EXTENT, context, crs)
+                if aoi_extent.isNull() or aoi_extent.isEmpty():
+                    raise QgsProcessingException("Area of interest extent is required for the extent mode")
+            aoi = (aoi_mode, aoi_extent, neighbor_buffer)
+        if targets:
+            if aoi is None:
+                raise QgsProcessingException("Updating existing layers requires selection or extent mode")
+            if len(targets) != len(input_layers):
+                raise QgsProcessingException("Provide one target layer for each input layer")
+            if not key_field:
+                raise QgsProcessingException("Updating existing layers requires a key field present in input and target layers")
+            if len(ratios) > 1:
+                raise QgsProcessingException("Updating existing layers supports a single simplification ratio")
+            if any(target.crs() != layer.sourceCrs() for target, layer in zip(targets, input_layers)):
+                raise QgsProcessingException("Target layers must use the CRS of the input layers")
+
+        if tolerance > 0 or budgets:
+            if not getattr(TopoCartGenCore, 'SUPPORTS_STOPPING', False):
+                raise QgsProcessingException(f"Tolerance and vertex budgets are not supported by the {BACKEND_NAME} backend")
+            feedback.pushInfo("Simplification stops at the first limit reached: ratio, tolerance or vertex budget")
+        if budgets:
+            # Тайл или область видят только часть слоя, а бюджет задан на весь слой
+            if tile_size > 0 or aoi is not None:
+                raise QgsProcessingException("Vertex budgets require processing all features at once")
+            layer_names = {layer_output_name(layer) for layer in input_layers}
+            unknown = sorted(set(budgets) - layer_names)
+            if unknown:
+                raise QgsProcessingException(f"Vertex budgets refer to unknown layers: {', '.join(unknown)}")
+
+        if workers > 1 and not getattr(TopoCartGenCore, 'SUPPORTS_PARALLEL', False):
+            feedback.pushWarning(f"Parallel simplification is not supported by the {BACKEND_NAME} backend, using 1 worker")
+            workers = 1
+        cache = None
+        if cache_directory:
+            if getattr(TopoCartGenCore, 'SUPPORTS_NODED_CACHE', False):
+                cache = GraphCache(cache_directory, cache_size * 1024 ** 2)
+            else:
+                feedback.pushWarning(f"Graph cache is not supported by the {BACKEND_NAME} backend")
+
+        executor = create_executor(workers)
+        try:
+            # Подготовка выходных слоёв
+            run = SimplificationRun(context, feedback, output_directory, output_extension, batch_size, executor, workers,
+                                    ratios, cache, stats_file, check_intersections, headless, tolerance, budgets)
+            run.create_outputs(input_layers, targets, key_field)
+            results = self.runSimplification(run, input_layers, tile_size, feedback, aoi)
+            self.patches = run.patches
+            return results
+        finally:
+            if executor is not None and feedback.isCanceled():
+                # Запущенные задачи ядра не видят отмену; пул не ждёт их, а ожидающие задачи снимаются
+                executor.shutdown(wait=False, cancel_futures=True)
+            elif executor is not None:
+                executor.shutdown()
+
+    def postProcessAlgorithm(self, context, feedback):
+        # Целевые слои проекта меняются здесь, в основном потоке, а не из потока processAlgorithm
+        for patch in self.patches:
+            patch.apply(feedback)
+            feedback.pushInfo(f"{patch.output_name}: {patch.added_count} features updated")
+        self.patches = []
+        return {}
+
+    @staticmethod
+    def parseLevels(text):
+        # "0.3, 0.6; 0.9" -> [0.3, 0.6, 0.9]
+        ratios = []
+        for item in text.replace(';', ',').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                value = float(item)
+            except ValueError:
+                raise QgsProcessingException(f"Invalid simplification ratio: {item}")
+            if not 0.0 <= value <= 1.0:
+                raise QgsProcessingException(f"Simplification ratio must be between 0 and 1: {item}")
+            if value not in ratios:
+                ratios.append(value)
+        return ratios
+
+    @staticmethod
+    def parseBudgets(text):
+        # "roads=50000, rivers=20000" -> {'roads': 50000, 'rivers': 20000}
+        budgets = {}
+        for item in text.replace(';', ',').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            layer_name, separator, value = item.rpartition('=')
+            layer_name = layer_name.strip()
+            try:
+                budget = int(value)
+            except ValueError:
+                budget = -1
+            if not separator or not layer_name or budget < 0:
+                raise QgsProcessingException(f"Invalid vertex budget: {item}")
+            budgets[layer_name] = budget
+        return budgets
+
+    def runSimplification(self, run, input_layers, tile_size, feedback, aoi=None):
+        if aoi is not None:
+            self.processArea(run, input_layers, *aoi, feedback)
+            return self.finishRun(run, feedback)
+
+        if tile_size > 0:
+            self.processTiles(run, input_layers, tile_size, feedback)
+            return self.finishRun(run, feedback)
+
+        buffers, _, original_features, original_points_count = run.read_layers(input_layers)
+        features_to_process = sum(buffer.feature_count for buffer in buffers)
+        feedback.pushInfo(f"Total features: {sum(layer.featureCount() for layer in input_layers)}, features to process: {features_to_process}")
+
+        if not buffers:
+            feedback.pushWarning("No data to process! Output layers will be empty.")
+            return self.finishRun(run, feedback)
+
+        # Упрощение всех геометрий
+        feedback.pushInfo(f"Starting simplification with TopoCartGenCore.Graph ({BACKEND_NAME} backend)")
+        levels = run.simplify(buffers, original_features, original_points_count, progress_range=(0.0, 90.0))
+        if levels is None:
+            return self.finishRun(run, feedback)
+        feedback.pushInfo(f"Simplified features: {sum(buffer.feature_count for buffer in levels[0])}")
+        feedback.setProgress(100.0)
+        return self.finishRun(run, feedback)
+
+    def finishRun(self, run, feedback):
+        # Отменённый запуск завершается ошибкой: выходные слои не закрываются
+        # и не добавляются в проект, частичный результат не выдаётся за готовый
+        if feedback.isCanceled():
+            run.discard()
+            raise QgsProcessingException("Simplification canceled, results are not written")
+        return run.finish()
+
+    def sharedCrs(self, input_layers, mode):
+        # Режимы с замороженными соседями требуют поддержки ядра и одной СК у всех слоёв
+        if not getattr(TopoCartGenCore, 'SUPPORTS_FROZEN', False):
+            raise QgsProcessingException(f"{mode} is not supported by the {BACKEND_NAME} backend")
+        crs = input_layers[0].sourceCrs()
+        if any(layer.sourceCrs() != crs for layer in input_layers):
+            raise QgsProcessingException(f"{mode} requires all input layers to share one CRS")
+        return crs
+
+    def processArea(self, run, input_layers, aoi_mode, aoi_extent, neighbor_buffer, feedback):
+        # Упрощаются только выбранные объекты или объекты, центр охвата которых лежит в области.
+        # Соседи в пределах буфера читаются пространственным фильтром и замораживаются:
+        # общие с ними вершины и вершины на границе области остаются на месте
+        extent = None
+        if aoi_mode == self.AOI_SELECTION:
+            selected = {layer_output_name(layer): set(layer.selectedFeatureIds()) for layer in input_layers}
+            if not any(selected.values()):
+                feedback.pushWarning("No features selected in the input layers")
+                return
+            area = QgsRectangle()
+            area.setMinimal()
+            for layer in input_layers:
+                if layer.selectedFeatureCount():
+                    area.combineExtentWith(layer.boundingBoxOfSelected())
+
+            def owns(layer_name, feature, geometry):
+                return feature.id() in selected.get(layer_name, ())
+        else:
+            area = aoi_extent
+            extent = (area.xMinimum(), area.yMinimum(), area.xMaximum(), area.yMaximum())
+
+            def owns(layer_name, feature, geometry):
+                return area.contains(geometry.boundingBox().center())
+
+        owned_keys = {}
+        if run.targets:
+            select = owns
+
+            def owns(layer_name, feature, geometry):
+                if not select(layer_name, feature, geometry):
+                    return False
+                owned_keys.setdefault(layer_name, set()).add(feature[run.key_field])
+                return True
+
+        request = QgsFeatureRequest().setFilterRect(area.buffered(neighbor_buffer))
+        buffers, frozen, original_features, original_points_count = run.read_layers(input_layers, request, owns)
+        feedback.pushInfo(f"Area of interest: {len(original_features)} features to simplify, {sum(b.feature_count for b in frozen)} neighbouring features frozen")
+        if not buffers:
+            feedback.pushWarning("No features to simplify in the area of interest")
+            return
+        original_buffers = None
+        if run.targets:
+            # В обновляемом слое соседи уже упрощены: замораживаются их текущие геометрии,
+            # а общие с ними границы упрощаемых объектов сводятся к тем же вершинам
+            targets = run.read_targets(request, owned_keys)
+            original_buffers = buffers
+            buffers = [conform_to_targets(buffer, frozen, targets) for buffer in buffers]
+            frozen = targets
+        if run.simplify(buffers, original_features, original_points_count, frozen, extent, (0.0, 90.0),
+                        original_buffers) is not None:
+            feedback.setProgress(100.0)
+
+    def processTiles(self, run, input_layers, tile_size, feedback):
+        # Потоковый режим: объекты читаются и упрощаются по тайлам. Тайл удаляет только вершины
+        # строго внутри своего прямоугольника, поэтому соседние тайлы сшиваются без разрывов топологии.
+        # Объект, охват которого задевает несколько тайлов, упрощается в каждом из них и собирается
+        # после последнего; объекты вне диапазона тайлов своего охвата замораживаются
+        self.sharedCrs(input_layers, "Tiled mode")
+
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for layer in input_layers:
+            extent.combineExtentWith(layer.extent())
+        grid = TileGrid(extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum(), tile_size)
+        stitcher = TileStitcher(grid, len(run.ratios))
+        run.tiled = True
+        feedback.pushInfo(f"Streaming mode: {grid.columns} x {grid.rows} tiles of {tile_size} map units")
+        # Объекты нескольких тайлов до сборки: ключ -> (объект, число точек)
+        spanning = {}
+
+        for tile in range(grid.count):
+            if feedback.isCanceled():
+                break
+            rect = grid.rect(tile)
+
+            def owns(layer_name, feature, geometry, tile=tile):
+                box = geometry.boundingBox()
+                return grid.covers(tile, box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum())
+
+            def primary(layer_name, feature, geometry, tile=tile):
+                box = geometry.boundingBox()
+                return grid.tile_of(box.xMinimum(), box.yMinimum()) == tile
+
+            request = QgsFeatureRequest().setFilterRect(QgsRectangle(*rect))
+            buffers, frozen, original_features, original_points_count = run.read_layers(
+                input_layers, request, owns, primary
+            )
+            if buffers:
+                levels = run.simplify_levels(
+                    buffers, frozen, rect, (100.0 * tile / grid.count, 100.0 * (tile + 1) / grid.count)
+                )
+                if levels is None:
+                    break
+                local_buffers, local_levels = stitcher.add(tile, buffers, levels)
+                local_keys = {
+                    (buffer.layer_id, int(feature_id)) for buffer in local_buffers for feature_id in buffer.feature_ids
+                }
+                for key, feature in original_features.items():
+                    if key not in local_keys:
+                        spanning.setdefault(key, (feature, original_points_count[key]))
+                run.write_levels(
+                    local_levels, local_buffers,
+                    {key: original_features[key] for key in local_keys}, original_points_count
+                )
+                feedback.pushDebugInfo(f"Tile {tile + 1}/{grid.count}: {len(original_features)} features simplified, {sum(b.feature_count for b in frozen)} frozen")
+            self.writeStitched(run, stitcher.finish(tile), spanning)
+            feedback.setProgress(100.0 * (tile + 1) / grid.count)
+
+        if not feedback.isCanceled():
+            # Объекты, которые не встретились в своём последнем тайле
+            self.writeStitched(run, stitcher.finish(), spanning)
+        if stitcher.stitched_count:
+            feedback.pushInfo(f"{stitcher.stitched_count} features spanning several tiles stitched from per-tile results")
+
+    def writeStitched(self, run, finished, spanning):
+        # Собранные объекты нескольких тайлов пишутся вместе с исходными атрибутами
+        keys, levels = finished
+        if not keys:
+            return
+        features = {}
+        points_count = {}
+        for key in keys:
+            features[key], points_count[key] = spanning.pop(key)
+        run.write_levels(levels, None, features, points_count)
 
     def name(self):
         return 'graphsimplify'
@@ -0,0 +1,243 @@
+"""Сетка тайлов потокового режима и сборка объектов, упрощённых по частям.
+
+Тайл упрощает только вершины строго внутри своего прямоугольника (остальные закреплены
+охватом ядра), поэтому изменения разных тайлов не пересекаются. Объект, охват которого
+задевает несколько тайлов, упрощается в каждом из них, а результат собирается из вершин,
+оставленных тайлом-владельцем каждой вершины.
+"""
+import math
+
+import numpy as np
+
+from .buffers import FeatureBufferBuilder, POLYGON, select_features
+
+
+class TileGrid:
+    """Тайлы со стороной tile_size, нумерация по строкам от нижнего левого угла охвата.
+
+    Вершина принадлежит полуоткрытому тайлу [x0, x0 + size) x [y0, y0 + size);
+    крайние вершины охвата относятся к последнему столбцу и строке.
+    """
+
+    def __init__(self, xmin, ymin, xmax, ymax, tile_size):
+        self.xmin = xmin
+        self.ymin = ymin
+        self.tile_size = tile_size
+        self.columns = max(1, math.ceil((xmax - xmin) / tile_size))
+        self.rows = max(1, math.ceil((ymax - ymin) / tile_size))
+
+    @property
+    def count(self):
+        return self.columns * self.rows
+
+    def cell(self, x, y):
+        column = min(max(int((x - self.xmin) // self.tile_size), 0), self.columns - 1)
+        row = min(max(int((y - self.ymin) // self.tile_size), 0), self.rows - 1)
+        return column, row
+
+    def tile_of(self, x, y):
+        column, row = self.cell(x, y)
+        return row * self.columns + column
+
+    def tile_indices(self, coords):
+        # Векторный вариант tile_of для массива вершин (N, 2)
+        columns = np.clip((coords[:, 0] - self.xmin) // self.tile_size, 0, self.columns - 1).astype(np.int64)
+        rows = np.clip((coords[:, 1] - self.ymin) // self.tile_size, 0, self.rows - 1).astype(np.int64)
+        return rows * self.columns + columns
+
+    def rect(self, tile):
+        column, row = tile % self.columns, tile // self.columns
+        x = self.xmin + column * self.tile_size
+        y = self.ymin + row * self.tile_size
+        return x, y, x + self.tile_size, y + self.tile_size
+
+    def covers(self, tile, xmin, ymin, xmax, ymax):
+        # Тайл входит в диапазон тайлов охвата объекта; последний из них -- tile_of(xmax, ymax)
+        first_column, first_row = self.cell(xmin, ymin)
+        last_column, last_row = self.cell(xmax, ymax)
+        column, row = tile % self.columns, tile // self.columns
+        return first_column <= column <= last_column and first_row <= row <= last_row
+
+
+class TileStitcher:
+    """Сборка объектов, охват которых задевает несколько тайлов.
+
+    add() отдаёт объекты одного тайла сразу, а для остальных запоминает вершины,
+    оставленные этим тайлом. finish() собирает объекты, последний тайл которых пройден.
+    """
+
+    def __init__(self, grid, level_count):
+        self.grid = grid
+        self.level_count = level_count
+        self.pending = {}  # (слой, ID объекта) -> _SpanningFeature
+        self.stitched_count = 0
+
+    def add(self, tile, buffers, levels):
+        # buffers -- входные буферы тайла, levels -- результат ядра по уровням.
+        # Возвращает входные буферы и уровни только с объектами, целиком лежащими в тайле
+        local_buffers = []
+        local_levels = [[] for _ in levels]
+        results = [{buffer.layer_id: buffer for buffer in level} for level in levels]
+        for buffer in buffers:
+            first, last = self.feature_tiles(buffer)
+            spanning = first != last
+            if not spanning.any():
+                local_buffers.append(buffer)
+                for local, result in zip(local_levels, results):
+                    if buffer.layer_id in result:
+                        local.append(result[buffer.layer_id])
+                continue
+            local_buffers.append(select_features(buffer, ~spanning))
+            local_ids = buffer.feature_ids[~spanning]
+            for level, (local, result) in enumerate(zip(local_levels, results)):
+                simplified = result.get(buffer.layer_id)
+                if simplified is None:
+                    continue
+                local.append(select_features(simplified, np.isin(simplified.feature_ids, local_ids)))
+                positions = {int(feature_id): index for index, feature_id in enumerate(simplified.feature_ids)}
+                for index in np.flatnonzero(spanning):
+                    feature = self.spanning_feature(buffer, index, int(last[index]))
+                    position = positions.get(int(buffer.feature_ids[index]))
+                    if position is not None:
+                        feature.absorb(level, tile, list(simplified.feature_rings(position)))
+        return local_buffers, local_levels
+
+    def feature_tiles(self, buffer):
+        # Первый и последний тайл охвата каждого объекта
+        starts = buffer.ring_offsets[buffer.part_offsets[buffer.feature_offsets]]
+        lower = np.minimum.reduceat(buffer.coords, starts[:-1], axis=0)
+        upper = np.maximum.reduceat(buffer.coords, starts[:-1], axis=0)
+        return self.grid.tile_indices(lower), self.grid.tile_indices(upper)
+
+    def spanning_feature(self, buffer, index, last_tile):
+        key = (buffer.layer_id, int(buffer.feature_ids[index]))
+        feature = self.pending.get(key)
+        if feature is None:
+            first_part = buffer.feature_offsets[index]
+            last_part = buffer.feature_offsets[index + 1]
+            part_sizes = np.diff(buffer.part_offsets[first_part:last_part + 1]).tolist()
+            rings = [ring.copy() for ring in buffer.feature_rings(index)]
+            feature = self.pending[key] = _SpanningFeature(
+                buffer.geometry_type, rings, part_sizes, last_tile, self.grid, self.level_count
+            )
+        return feature
+
+    def finish(self, tile=None):
+        # Объекты, последний тайл которых не позже tile (без tile -- все оставшиеся).
+        # Возвращает ключи объектов и буферы по уровням
+        keys = [key for key, feature in self.pending.items() if tile is None or feature.last_tile <= tile]
+        levels = []
+        for level in range(self.level_count):
+            builders = {}
+            for layer_id, feature_id in keys:
+                feature = self.pending[(layer_id, feature_id)]
+                builder = builders.get(layer_id)
+                if builder is None:
+                    builder = builders[layer_id] = FeatureBufferBuilder(layer_id, feature.geometry_type)
+                builder.add_parts(feature_id, feature.parts(level))
+            levels.append([builder.build() for builder in builders.values()])
+        for key in keys:
+            del self.pending[key]
+        self.stitched_count += len(keys)
+        return keys, levels
+
+
+class _SpanningFeature:
+    # Исходные кольца объекта и решения тайлов по уровням: какие вершины оставлены
+    # и какие вершины пересечений добавлены (номер исходного отрезка, положение на нём, точка)
+
+    def __init__(self, geometry_type, rings, part_sizes, last_tile, grid, level_count):
+        self.geometry_type = geometry_type
+        self.part_sizes = part_sizes
+        self.last_tile = last_tile
+        self.grid = grid
+        self.closed = [
+            geometry_type == POLYGON or len(ring) > 2 and np.array_equal(ring[0], ring[-1]) for ring in rings
+        ]
+        # Замыкающая вершина не хранится, она восстанавливается при сборке
+        self.rings = [ring[:-1] if closed else ring for ring, closed in zip(rings, self.closed)]
+        self.owners = [grid.tile_indices(ring) for ring in self.rings]
+        # Вершина тайла, который не вернул объект, остаётся на месте
+        self.kept = [[np.ones(len(ring), dtype=bool) for ring in self.rings] for _ in range(level_count)]
+        self.inserted = [[[] for _ in self.rings] for _ in range(level_count)]
+
+    def absorb(self, level, tile, rings):
+        if len(rings) != len(self.rings):
+            return
+        for index, (ring, closed, owners) in enumerate(zip(rings, self.closed, self.owners)):
+            original = self.rings[index]
+            if closed and len(ring):
+                ring = ring[:-1]
+            original_keys = _point_keys(original)
+            keys = _point_keys(ring)
+            owned = owners == tile
+            self.kept[level][index][owned] = np.isin(original_keys[owned], keys)
+            new = ~np.isin(keys, original_keys)
+            if new.any():
+                self.inserted[level][index].extend(
+                    _locate_inserted(original, ring, new, self.grid.tile_indices(ring) == tile, closed)
+                )
+
+    def parts(self, level):
+        rings = []
+        for index, (original, closed) in enumerate(zip(self.rings, self.closed)):
+            kept = np.flatnonzero(self.kept[level][index])
+            inserted = self.inserted[level][index]
+            segments = np.concatenate([kept, np.array([item[0] for item in inserted], dtype=np.int64)])
+            params = np.concatenate([np.zeros(len(kept)), np.array([item[1] for item in inserted])])
+            points = np.concatenate([original[kept], np.array([item[2] for item in inserted]).reshape(-1, 2)])
+            points = points[np.lexsort((params, segments))]
+            if len(points) > 1:
+                # Совпадающие соседние вершины (например, на границе тайлов) остаются в одном экземпляре
+                distinct = np.concatenate([[True], (points[1:] != points[:-1]).any(axis=1)])
+                points = points[distinct]
+            if closed:
+                if len(points) > 1 and np.array_equal(points[0], points[-1]):
+                    points = points[:-1]
+                points = np.concatenate([points, points[:1]])
+            if len(points) < (4 if closed else 2):
+                # Удаления разных тайлов вместе выродили кольцо -- оно остаётся исходным
+                points = np.concatenate([original, original[:1]]) if closed else original
+            rings.append(points)
+        parts = []
+        start = 0
+        for size in self.part_sizes:
+            parts.append(rings[start:start + size])
+            start += size
+        return parts
+
+
+def _point_keys(coords):
+    return coords[:, 0] + 1j * coords[:, 1]
+
+
+def _locate_inserted(original, ring, new, owned, closed):
+    # Вершины пересечений ring (маска new), принадлежащие тайлу (owned), с номером исходного
+    # отрезка и положением на нём. Отрезок ищется между соседними исходными вершинами ring
+    count = len(original)
+    order = np.argsort(_point_keys(original), kind='stable')
+    positions = np.full(len(ring), -1, dtype=np.int64)
+    known = np.flatnonzero(~new)
+    positions[known] = order[np.searchsorted(_point_keys(original)[order], _point_keys(ring[known]))]
+    previous = np.maximum.accumulate(positions)
+    following = np.where(positions >= 0, positions, count)
+    following = np.minimum.accumulate(following[::-1])[::-1]
+    segment_count = count if closed else count - 1
+    starts = original
+    ends = np.roll(original, -1, axis=0)
+    located = []
+    for index in np.flatnonzero(new & owned):
+        # Кольцо результата начинается с первой оставшейся вершины, поэтому вершина до первой
+        # исходной лежит на начальных отрезках, а после последней -- на последних и замыкающем
+        low = max(previous[index], 0)
+        high = max(min(following[index], segment_count), low + 1)
+        point = ring[index]
+        start, vector = starts[low:high], ends[low:high] - starts[low:high]
+        lengths = np.einsum('ij,ij->i', vector, vector)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(lengths > 0, np.einsum('ij,ij->i', point - start, vector) / lengths, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        distances = np.hypot(*(start + t[:, None] * vector - point).T)
+        best = int(np.argmin(distances))
+        located.append((low + best, float(t[best]), point))
+    return located
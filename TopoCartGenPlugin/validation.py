@@ -0,0 +1,84 @@
+"""Проверка упрощённых геометрий после работы ядра.
+
+Проверяются только объекты, у которых ядро изменило вершины. Проверка
+выполняется пакетами в потоках: вызовы GEOS через PyQGIS отпускают GIL.
+Необязательная перекрёстная проверка ищет через пространственный индекс новые
+пересечения изменённых объектов с соседями, которых не было до упрощения.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import QgsGeometry, QgsSpatialIndex
+
+# Результат проверки одной геометрии
+VALID = 'valid'
+FIXED = 'fixed'
+FAILED = 'failed'
+
+# Внутренности геометрий пересекаются (DE-9IM)
+INTERIORS_INTERSECT = 'T********'
+
+
+def validate_geometry(geometry):
+    # (геометрия, статус); при FAILED геометрия None
+    engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+    if engine.isValid():
+        return geometry, VALID
+    fixed = geometry.makeValid()
+    if not fixed or fixed.isEmpty():
+        return None, FAILED
+    return fixed, FIXED
+
+
+def _validate_batch(geometries):
+    return [validate_geometry(geometry) for geometry in geometries]
+
+
+def validate_geometries(geometries, workers=1, batch_size=512):
+    # Результаты в порядке входных геометрий
+    batches = [geometries[start:start + batch_size] for start in range(0, len(geometries), batch_size)]
+    if workers < 2 or len(batches) < 2:
+        return _validate_batch(geometries)
+    with ThreadPoolExecutor(workers) as executor:
+        return [result for batch in executor.map(_validate_batch, batches) for result in batch]
+
+
+def _interiors_intersect(engine, geometry):
+    # Быстрый отсев подготовленной геометрией, затем точная проверка по матрице DE-9IM
+    other = geometry.constGet()
+    return engine.intersects(other) and engine.relatePattern(other, INTERIORS_INTERSECT)
+
+
+def find_new_intersections(changed, originals, unchanged):
+    """Пары объектов, внутренности которых пересекаются после упрощения, но не до него.
+
+    changed   -- {ключ: новая геометрия} изменённых объектов
+    originals -- {ключ: исходная геометрия} тех же объектов
+    unchanged -- {ключ: геометрия} остальных объектов того же запуска
+    """
+    keys = list(changed) + list(unchanged)
+    geometries = [changed[key] for key in changed] + [unchanged[key] for key in unchanged]
+    index = QgsSpatialIndex()
+    for position, geometry in enumerate(geometries):
+        index.addFeature(position, geometry.boundingBox())
+
+    pairs = []
+    changed_count = len(changed)
+    for position in range(changed_count):
+        key = keys[position]
+        engine = QgsGeometry.createGeometryEngine(geometries[position].constGet())
+        engine.prepareGeometry()
+        original_engine = None
+        for candidate in index.intersects(geometries[position].boundingBox()):
+            # Пара изменённых объектов проверяется один раз
+            if candidate == position or candidate < changed_count and candidate < position:
+                continue
+            if not _interiors_intersect(engine, geometries[candidate]):
+                continue
+            other_key = keys[candidate]
+            if original_engine is None:
+                original_engine = QgsGeometry.createGeometryEngine(originals[key].constGet())
+                original_engine.prepareGeometry()
+            other_original = originals.get(other_key, geometries[candidate])
+            if not _interiors_intersect(original_engine, other_original):
+                pairs.append((key, other_key))
+    return pairs
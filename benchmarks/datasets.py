@@ -0,0 +1,129 @@
+"""Синтетические наборы данных для бенчмарков ядра.
+
+Каждый генератор детерминирован (seed) и возвращает список FeatureBuffer
+в том же виде, в каком их собирает плагин: дорожная сеть с множеством
+пересечений, мозаика полигонов с общими границами, длинная береговая линия
+и смешанный набор из полигонов и пересекающих их линий.
+"""
+import math
+
+import numpy as np
+
+from TopoCartGenPlugin.buffers import FeatureBuffer, LINE, POLYGON
+
+
+def _buffer(layer_id, geometry_type, rings):
+    # Один объект -- одна часть из одного кольца
+    sizes = [len(ring) for ring in rings]
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    count = len(rings)
+    return FeatureBuffer(
+        layer_id,
+        geometry_type,
+        np.concatenate(rings) if rings else np.empty((0, 2)),
+        offsets,
+        np.arange(count + 1, dtype=np.int64),
+        np.arange(count + 1, dtype=np.int64),
+        np.arange(count, dtype=np.int64)
+    )
+
+
+def _noisy_segment(rng, start, end, count, amplitude):
+    # Ломаная из count вершин между start и end (end не включается), смещения поперёк отрезка
+    t = np.arange(count) / count
+    points = np.outer(1 - t, start) + np.outer(t, end)
+    direction = np.subtract(end, start, dtype=np.float64)
+    normal = np.array([-direction[1], direction[0]]) / (np.hypot(*direction) or 1.0)
+    offsets = rng.uniform(-amplitude, amplitude, count)
+    offsets[0] = 0.0
+    return points + offsets[:, None] * normal
+
+
+def road_grid(vertices, seed=0):
+    # Горизонтальные и вертикальные дороги, которые пересекаются без общих вершин
+    rng = np.random.default_rng(seed)
+    lines = max(2, int(math.sqrt(vertices / 40)))
+    per_line = max(2, vertices // (2 * lines))
+    size = float(lines)
+    roads = []
+    for index in range(lines):
+        offset = index + 0.5 + rng.uniform(-0.2, 0.2)
+        for start, end in (((0.0, offset), (size, offset)), ((offset, 0.0), (offset, size))):
+            road = _noisy_segment(rng, start, end, per_line, 0.1)
+            roads.append(np.vstack([road, end]))
+    return [_buffer('roads', LINE, roads)]
+
+
+def _mosaic_rings(rng, columns, rows, per_edge, origin=(0.0, 0.0)):
+    # Общие границы соседних ячеек генерируются один раз и используются обоими полигонами
+    x0, y0 = origin
+    horizontal = {
+        (i, j): _noisy_segment(rng, (x0 + i, y0 + j), (x0 + i + 1, y0 + j), per_edge, 0.08 if 0 < j < rows else 0.0)
+        for i in range(columns) for j in range(rows + 1)
+    }
+    vertical = {
+        (i, j): _noisy_segment(rng, (x0 + i, y0 + j), (x0 + i, y0 + j + 1), per_edge, 0.08 if 0 < i < columns else 0.0)
+        for i in range(columns + 1) for j in range(rows)
+    }
+    rings = []
+    for i in range(columns):
+        for j in range(rows):
+            bottom = horizontal[i, j]
+            right = vertical[i + 1, j]
+            top = np.vstack([horizontal[i, j + 1][1:], [[x0 + i + 1, y0 + j + 1]]])[::-1]
+            left = np.vstack([vertical[i, j][1:], [[x0 + i, y0 + j + 1]]])[::-1]
+            rings.append(np.vstack([bottom, right, top, left, bottom[:1]]))
+    return rings
+
+
+def polygon_mosaic(vertices, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = max(1, int(math.sqrt(vertices / 80)))
+    per_edge = max(2, vertices // (4 * cells * cells))
+    return [_buffer('parcels', POLYGON, _mosaic_rings(rng, cells, cells, per_edge))]
+
+
+def coastline(vertices, seed=0, islands=20):
+    # Замкнутая извилистая береговая линия и несколько островов рядом с ней
+    rng = np.random.default_rng(seed)
+    main = max(8, vertices * 4 // 5)
+    angles = np.linspace(0.0, 2 * math.pi, main, endpoint=False)
+    radius = 100.0 + np.cumsum(rng.normal(0.0, 0.3, main))
+    radius -= np.linspace(0.0, radius[-1] - radius[0], main)
+    rings = [np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])]
+    per_island = max(8, (vertices - main) // islands)
+    for _ in range(islands):
+        angle = rng.uniform(0.0, 2 * math.pi)
+        center = (130.0 * math.cos(angle), 130.0 * math.sin(angle))
+        theta = np.linspace(0.0, 2 * math.pi, per_island, endpoint=False)
+        island_radius = 3.0 + rng.uniform(-0.3, 0.3, per_island)
+        rings.append(np.column_stack([center[0] + island_radius * np.cos(theta),
+                                      center[1] + island_radius * np.sin(theta)]))
+    rings = [np.vstack([ring, ring[:1]]) for ring in rings]
+    return [_buffer('coast', POLYGON, rings)]
+
+
+def mixed(vertices, seed=0):
+    # Полигоны мозаики и дороги поверх них: пересечения линий с границами полигонов
+    parcels = polygon_mosaic(vertices * 2 // 3, seed)[0]
+    extent = parcels.coords.max(axis=0)
+    roads = road_grid(vertices // 3, seed + 1)[0]
+    scale = extent / np.maximum(roads.coords.max(axis=0), 1e-9)
+    roads = FeatureBuffer('roads', LINE, roads.coords * scale, roads.ring_offsets,
+                          roads.part_offsets, roads.feature_offsets, roads.feature_ids)
+    return [parcels, roads]
+
+
+DATASETS = {
+    'road_grid': road_grid,
+    'polygon_mosaic': polygon_mosaic,
+    'coastline': coastline,
+    'mixed': mixed,
+}
+
+SIZES = {
+    'small': 10000,
+    'medium': 100000,
+    'large': 1000000,
+}
@@ -0,0 +1,276 @@
+"""Бенчмарк ядра упрощения на синтетических наборах данных.
+
+Запуск из корня репозитория (QGIS не нужен для замеров ядра):
+
+    python -m benchmarks.run --sizes small medium --output bench.json
+    python -m benchmarks.run --compare base.json bench.json
+
+Каждый случай (набор, размер, коэффициент, число процессов) выполняется
+в отдельном процессе, поэтому пиковое потребление памяти (peak RSS) и скорость
+относятся только к нему. Время по этапам берётся из callback прогресса ядра;
+путь через processAlgorithm замеряется, только если доступен модуль qgis.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.datasets import DATASETS, SIZES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CORE = 'core'
+ALGORITHM = 'algorithm'
+
+# Этапы ядра в порядке выполнения; build -- до первого сообщения о прогрессе, output -- после стягивания
+STAGES = ('build', 'intersections', 'heap', 'contraction', 'output')
+ALGORITHM_PHASES = {
+    'Finding intersections': 'intersections',
+    'Building edge heap': 'heap',
+    'Contracting edges': 'contraction',
+}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS -- байты
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+class StageTimer:
+    # Запоминает время первого и последнего сообщения каждого этапа
+    def __init__(self):
+        self.first = {}
+        self.last = {}
+
+    def __call__(self, phase, fraction=None):
+        now = time.perf_counter()
+        self.first.setdefault(phase, now)
+        self.last[phase] = now
+
+    def stages(self, start, end):
+        if not self.first:
+            return {'total': end - start}
+        boundaries = [start] + [self.first.get(stage) for stage in STAGES[1:-1]]
+        boundaries.append(self.last.get('contraction'))
+        boundaries.append(end)
+        result = {}
+        for stage, (begin, finish) in zip(STAGES, zip(boundaries, boundaries[1:])):
+            if begin is not None and finish is not None:
+                result[stage] = finish - begin
+        return result
+
+
+def run_core_case(dataset, size, ratio, workers):
+    from TopoCartGenPlugin.backend import BACKEND_NAME, TopoCartGenCore, create_executor
+    from TopoCartGenPlugin.buffers import process_buffers
+
+    buffers = DATASETS[dataset](SIZES[size])
+    vertices = sum(buffer.vertex_count for buffer in buffers)
+    graph = TopoCartGenCore.Graph()
+    timer = StageTimer()
+    if getattr(TopoCartGenCore, 'SUPPORTS_PROGRESS', False):
+        graph.setProgressCallback(timer)
+    executor = create_executor(workers)
+    if executor is not None:
+        graph.setExecutor(executor, workers)
+    estimated_mb = None
+    if getattr(TopoCartGenCore, 'SUPPORTS_MEMORY_REPORT', False):
+        estimated_mb = TopoCartGenCore.Graph.estimateMemory(buffers)['total'] / 1024 ** 2
+    try:
+        start = time.perf_counter()
+        simplified = process_buffers(TopoCartGenCore, graph, buffers, ratio)
+        end = time.perf_counter()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {
+        'backend': BACKEND_NAME,
+        'vertices': vertices,
+        'vertices_out': sum(buffer.vertex_count for buffer in simplified),
+        'seconds': end - start,
+        'vertices_per_second': vertices / (end - start) if end > start else None,
+        'stages': timer.stages(start, end),
+        'peak_rss_mb': peak_rss_mb(),
+        'estimated_mb': estimated_mb,
+        'graph_mb': graph.memoryUsage()['total'] / 1024 ** 2 if hasattr(graph, 'memoryUsage') else None,
+    }
+
+
+def run_algorithm_case(dataset, size, ratio, workers):
+    # Полный путь processAlgorithm на слоях в памяти (нужен QGIS с Python)
+    try:
+        from qgis.core import (
+            QgsApplication, QgsFeature, QgsGeometry, QgsProcessingContext,
+            QgsProcessingFeedback, QgsVectorLayer
+        )
+    except ImportError as error:
+        return {'skipped': f"qgis is not available: {error}"}
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    application = QgsApplication([], False)
+    application.initQgis()
+    sys.path.append(os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins'))
+    from TopoCartGenPlugin.buffers import LINE, POLYGON, encode_wkb
+    from TopoCartGenPlugin.plugin import GraphProcessorPlugin
+
+    timer = StageTimer()
+
+    class Feedback(QgsProcessingFeedback):
+        def setProgressText(self, text):
+            if text in ALGORITHM_PHASES:
+                timer(ALGORITHM_PHASES[text])
+            super().setProgressText(text)
+
+        def setProgress(self, progress):
+            if timer.first:
+                timer(list(timer.first)[-1])
+            super().setProgress(progress)
+
+    context = QgsProcessingContext()
+    layer_ids = []
+    vertices = 0
+    for buffer in DATASETS[dataset](SIZES[size]):
+        geometry_name = {POLYGON: 'MultiPolygon', LINE: 'MultiLineString'}.get(buffer.geometry_type, 'MultiPoint')
+        layer = QgsVectorLayer(f"{geometry_name}?crs=EPSG:3857", buffer.layer_id, 'memory')
+        features = []
+        for index in range(buffer.feature_count):
+            geometry = QgsGeometry()
+            geometry.fromWkb(encode_wkb(buffer, index))
+            feature = QgsFeature()
+            feature.setGeometry(geometry)
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        context.temporaryLayerStore().addMapLayer(layer)
+        layer_ids.append(layer.id())
+        vertices += buffer.vertex_count
+
+    algorithm = GraphProcessorPlugin()
+    algorithm.initAlgorithm()
+    parameters = {
+        'INPUT': layer_ids,
+        'RATIO': ratio,
+        'WORKERS': workers,
+    }
+    start = time.perf_counter()
+    algorithm.processAlgorithm(parameters, context, Feedback())
+    end = time.perf_counter()
+    application.exitQgis()
+    return {
+        'vertices': vertices,
+        'seconds': end - start,
+        'vertices_per_second': vertices / (end - start) if end > start else None,
+        'stages': timer.stages(start, end),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+CASES = {
+    CORE: run_core_case,
+    ALGORITHM: run_algorithm_case,
+}
+
+
+def run_case(path, dataset, size, ratio, workers):
+    # Свежий процесс на каждый случай: изолированный peak RSS и холодные кэши Python
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        result = executor.submit(CASES[path], dataset, size, ratio, workers).result()
+    result.update({'path': path, 'dataset': dataset, 'size': size, 'ratio': ratio, 'workers': workers})
+    return result
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend_env': os.environ.get('TOPOCARTGEN_BACKEND'),
+    }
+
+
+def case_key(result):
+    # Файлы прежнего формата хранили список ratios на случай; один коэффициент сопоставляется как ratio
+    ratio = result.get('ratio')
+    if ratio is None:
+        ratios = result.get('ratios', ())
+        ratio = ratios[0] if len(ratios) == 1 else tuple(ratios)
+    return result['path'], result['dataset'], result['size'], ratio, result['workers']
+
+
+def compare(base_path, new_path):
+    # Таблица изменения времени по совпадающим случаям двух файлов результатов
+    with open(base_path) as base_file, open(new_path) as new_file:
+        base = {case_key(result): result for result in json.load(base_file)['results']}
+        new = json.load(new_file)['results']
+    print(f"{'case':60} {'base, s':>10} {'new, s':>10} {'change':>8}")
+    for result in new:
+        key = case_key(result)
+        name = '/'.join(str(part) for part in key)
+        before = base.get(key, {}).get('seconds')
+        after = result.get('seconds')
+        if before is None or after is None:
+            print(f"{name:60} {'-':>10} {after if after is not None else '-':>10}")
+            continue
+        print(f"{name:60} {before:10.3f} {after:10.3f} {100.0 * (after - before) / before:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TopoCartGen core benchmarks")
+    parser.add_argument('--datasets', nargs='+', choices=sorted(DATASETS), default=sorted(DATASETS))
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--ratios', nargs='+', type=float, default=[0.5])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1])
+    parser.add_argument('--paths', nargs='+', choices=sorted(CASES), default=[CORE])
+    parser.add_argument('--output', help="JSON file for results (default: print to stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for path in args.paths:
+        for dataset in args.datasets:
+            for size in args.sizes:
+                for ratio in args.ratios:
+                    for workers in args.workers:
+                        result = run_case(path, dataset, size, ratio, workers)
+                        results.append(result)
+                        name = f"{path}/{dataset}/{size}/{ratio:g}/{workers}"
+                        if 'skipped' in result:
+                            print(f"{name}: skipped ({result['skipped']})", file=sys.stderr)
+                            continue
+                        print(f"{name}: {result['vertices']} vertices, {result['seconds']:.3f} s, "
+                              f"{result['vertices_per_second']:.0f} vertices/s", file=sys.stderr)
+
+    report = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Общие данные тестов: синтетические наборы из benchmarks.datasets и сравнение буферов."""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from TopoCartGenPlugin import numpy_core
+from TopoCartGenPlugin.backend import create_executor
+from benchmarks.datasets import DATASETS
+
+# Размер наборов: достаточно для пересечений, общих дуг и нескольких задач стягивания
+VERTICES = 6000
+
+
+@pytest.fixture(scope='session')
+def datasets():
+    return {name: generator(VERTICES) for name, generator in DATASETS.items()}
+
+
+@pytest.fixture(params=sorted(DATASETS))
+def dataset(request, datasets):
+    return datasets[request.param]
+
+
+@pytest.fixture(scope='session')
+def mosaic(datasets):
+    return datasets['polygon_mosaic']
+
+
+@pytest.fixture
+def core():
+    return numpy_core
+
+
+@pytest.fixture(scope='session')
+def thread_pool():
+    with ThreadPoolExecutor(4) as executor:
+        yield executor
+
+
+@pytest.fixture(scope='session')
+def process_pool():
+    executor = create_executor(4)
+    yield executor
+    executor.shutdown()
+
+
+def extent_of(buffers):
+    coords = np.concatenate([buffer.coords for buffer in buffers])
+    return (*coords.min(axis=0), *coords.max(axis=0))
+
+
+def assert_buffers_equal(expected, actual):
+    # Буферы сравниваются по слоям: структура объектов и координаты вершин
+    assert [buffer.layer_id for buffer in expected] == [buffer.layer_id for buffer in actual]
+    for left, right in zip(expected, actual):
+        np.testing.assert_array_equal(left.feature_ids, right.feature_ids)
+        np.testing.assert_array_equal(left.feature_offsets, right.feature_offsets)
+        np.testing.assert_array_equal(left.part_offsets, right.part_offsets)
+        np.testing.assert_array_equal(left.ring_offsets, right.ring_offsets)
+        np.testing.assert_array_equal(left.coords, right.coords)
+
+
+def vertex_total(buffers):
+    return sum(buffer.vertex_count for buffer in buffers)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from TopoCartGenPlugin import backend
+from TopoCartGenPlugin.buffers import process_buffers
+
+from .conftest import assert_buffers_equal
+
+
+@pytest.fixture(scope='module')
+def native():
+    try:
+        return backend.load_core(backend.NATIVE)[1]
+    except ImportError as error:
+        pytest.skip(f"native TopoCartGenCore is not available: {error}")
+
+
+@pytest.mark.parametrize('ratio', [0.3, 0.7])
+def test_native_matches_numpy(native, core, dataset, ratio):
+    expected = process_buffers(core, core.Graph(), dataset, ratio)
+    actual = process_buffers(native, native.Graph(), dataset, ratio)
+    assert_buffers_equal(expected, actual)
+
+
+def test_numpy_core_is_always_available():
+    name, module = backend.load_core(backend.NUMPY)
+    assert name == backend.NUMPY
+    assert module.SUPPORTS_BUFFERS
+
+
+def test_simplification_keeps_structure(core, dataset):
+    result = core.Graph().processFeatures(dataset, 0.5)
+    for before, after in zip(dataset, result):
+        np.testing.assert_array_equal(before.feature_ids, after.feature_ids)
+        assert len(before.ring_offsets) == len(after.ring_offsets)
+        assert after.vertex_count < before.vertex_count
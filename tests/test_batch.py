@@ -0,0 +1,29 @@
+import os
+
+from TopoCartGenPlugin.batch import describe_error, find_datasets
+
+
+def touch(root, *names):
+    for name in names:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+
+def test_find_datasets_skips_own_outputs(tmp_path):
+    root = str(tmp_path)
+    touch(root, 'roads.gpkg', 'rivers.geojson', 'summary.json', 'regions/lakes.shp',
+          'out/roads/roads_simplified.gpkg', 'out/roads/stats.json')
+    found = find_datasets([root], [os.path.join(root, 'out')])
+    assert [os.path.relpath(path, root) for path in found] == [
+        'rivers.geojson', 'roads.gpkg', os.path.join('regions', 'lakes.shp')
+    ]
+
+
+def test_find_datasets_keeps_explicit_files(tmp_path):
+    path = os.path.join(str(tmp_path), 'data.json')
+    assert find_datasets([path]) == [path]
+
+
+def test_describe_error():
+    assert describe_error(ValueError("bad ratio")) == "ValueError: bad ratio"
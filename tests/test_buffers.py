@@ -0,0 +1,162 @@
+import struct
+
+import numpy as np
+import pytest
+
+from TopoCartGenPlugin.buffers import (
+    FeatureBufferBuilder, LINE, POINT, POLYGON, changed_features, encode_wkb, from_point_features,
+    select_features, to_point_features
+)
+
+SQUARE = [(0.0, 0.0), (4.0, 0.0), (4.0, 4.0), (0.0, 4.0), (0.0, 0.0)]
+HOLE = [(1.0, 1.0), (1.0, 2.0), (2.0, 2.0), (1.0, 1.0)]
+
+
+def wkb(code, body, byte_order='<', srid=None):
+    # Заголовок WKB с произвольным кодом типа (ISO, EWKB) и порядком байтов
+    header = struct.pack(byte_order + 'BI', 1 if byte_order == '<' else 0, code)
+    if srid is not None:
+        header += struct.pack(byte_order + 'I', srid)
+    return header + body
+
+
+def points_body(points, dims, byte_order='<'):
+    # К каждой вершине дописываются Z/M, которые читатель должен отбросить
+    values = [value for x, y in points for value in (x, y, 7.0, 9.0)[:dims]]
+    return struct.pack(byte_order + 'I', len(points)) + struct.pack(f'{byte_order}{len(values)}d', *values)
+
+
+def parse(geometry_type, *geometries):
+    builder = FeatureBufferBuilder('layer', geometry_type)
+    for feature_id, data in enumerate(geometries):
+        builder.add_wkb(feature_id, data)
+    return builder.build()
+
+
+class FakePoint:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+    def getX(self):
+        return self.x
+
+    def getY(self):
+        return self.y
+
+
+@pytest.mark.parametrize('code, dims', [
+    (2, 2),                 # LineString
+    (1002, 3),              # ISO LineString Z
+    (2002, 3),              # ISO LineString M
+    (3002, 4),              # ISO LineString ZM
+    (0x80000002, 3),        # EWKB LineString Z
+    (0xC0000002, 4),        # EWKB LineString ZM
+])
+@pytest.mark.parametrize('byte_order', ['<', '>'])
+def test_linestring_dimensions(code, dims, byte_order):
+    line = [(0.0, 1.0), (2.0, 3.0), (4.0, 5.0)]
+    buffer = parse(LINE, wkb(code, points_body(line, dims, byte_order), byte_order))
+    np.testing.assert_array_equal(buffer.coords, line)
+    np.testing.assert_array_equal(buffer.ring_offsets, [0, 3])
+
+
+def test_ewkb_srid_is_skipped():
+    buffer = parse(LINE, wkb(0xA0000002, points_body([(1.0, 2.0), (3.0, 4.0)], 3), srid=4326))
+    np.testing.assert_array_equal(buffer.coords, [(1.0, 2.0), (3.0, 4.0)])
+
+
+def test_multipolygon_layout():
+    polygon = wkb(1003, struct.pack('<I', 2) + points_body(SQUARE, 3) + points_body(HOLE, 3))
+    square = wkb(3, struct.pack('<I', 1) + points_body(SQUARE, 2))
+    buffer = parse(POLYGON, wkb(6, struct.pack('<I', 2) + polygon + square), square)
+    np.testing.assert_array_equal(buffer.feature_offsets, [0, 2, 3])
+    np.testing.assert_array_equal(buffer.part_offsets, [0, 2, 3, 4])
+    np.testing.assert_array_equal(buffer.ring_offsets, [0, 5, 9, 14, 19])
+    np.testing.assert_array_equal(buffer.coords[5:9], HOLE)
+
+
+def test_empty_geometries_are_skipped():
+    empty_point = wkb(1, struct.pack('<2d', np.nan, np.nan))
+    builder = FeatureBufferBuilder('layer', POINT)
+    assert builder.add_wkb(1, empty_point) == 0
+    assert builder.add_wkb(2, wkb(2, struct.pack('<I', 0))) == 0
+    assert builder.add_wkb(3, wkb(1, struct.pack('<2d', 1.0, 2.0))) == 1
+    assert builder.build().feature_ids.tolist() == [3]
+
+
+def test_unsupported_type_is_rejected():
+    with pytest.raises(ValueError):
+        parse(LINE, wkb(7, struct.pack('<I', 0)))
+
+
+@pytest.mark.parametrize('geometry_type, geometries', [
+    (POLYGON, [[[SQUARE, HOLE], [SQUARE]], [[SQUARE]]]),
+    (LINE, [[[SQUARE[:3]], [SQUARE[2:]]], [[HOLE]]]),
+    (POINT, [[[SQUARE[:1]], [SQUARE[1:2]]]]),
+])
+def test_encode_wkb_round_trip(geometry_type, geometries):
+    builder = FeatureBufferBuilder('layer', geometry_type)
+    for feature_id, parts in enumerate(geometries):
+        builder.add_parts(feature_id, [[np.array(ring, dtype=float) for ring in rings] for rings in parts])
+    buffer = builder.build()
+    decoded = parse(geometry_type, *(encode_wkb(buffer, index) for index in range(buffer.feature_count)))
+    for name in ('coords', 'ring_offsets', 'part_offsets', 'feature_offsets'):
+        np.testing.assert_array_equal(getattr(decoded, name), getattr(buffer, name), err_msg=name)
+
+
+def test_point_features_round_trip_closes_polygon_rings():
+    line = parse(LINE, wkb(2, points_body([(0.0, 0.0), (1.0, 1.0)], 2)))
+    polygon = parse(POLYGON, wkb(3, struct.pack('<I', 1) + points_body(SQUARE, 2)))
+    features = to_point_features([polygon, line], FakePoint)
+    assert [len(points) for _, _, _, points in features] == [5, 2]
+    # Ядро вернуло кольцо без замыкающей вершины и слишком короткое кольцо
+    features = [
+        ('layer', 0, True, [FakePoint(x, y) for x, y in SQUARE[:4]]),
+        ('short', 0, True, [FakePoint(x, y) for x, y in SQUARE[:3]]),
+    ]
+    squares = parse(POLYGON, wkb(3, struct.pack('<I', 1) + points_body(SQUARE, 2)))
+    short = FeatureBufferBuilder('short', POLYGON).build()
+    closed, kept = from_point_features(features, [squares, short])
+    np.testing.assert_array_equal(closed.coords, SQUARE)
+    assert kept.vertex_count == 3
+
+
+def lines(*features):
+    # features -- пары (ID, вершины линии)
+    builder = FeatureBufferBuilder('layer', LINE)
+    for feature_id, points in features:
+        builder.add_parts(feature_id, [[np.array(points, dtype=float)]])
+    return builder.build()
+
+
+A = [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)]
+B = [(0.0, 1.0), (1.0, 1.0), (2.0, 1.0)]
+C = [(0.0, 2.0), (2.0, 2.0)]
+
+
+def test_changed_features_in_same_order():
+    before = lines((1, A), (2, B), (3, C))
+    after = lines((1, A), (2, B[::2]), (3, [(0.0, 2.0), (2.0, 2.5)]))
+    assert changed_features(before, after).tolist() == [False, True, True]
+
+
+def test_changed_features_matched_by_id():
+    before = lines((1, A), (2, B), (3, C))
+    # Порядок объектов другой, одного нет, один новый
+    after = lines((3, C), (4, A), (1, A[::2]), (2, B))
+    assert changed_features(before, after).tolist() == [False, True, True, False]
+
+
+def test_changed_features_without_before():
+    after = lines((1, A), (2, B))
+    assert changed_features(None, after).all()
+    assert changed_features(lines(), after).all()
+    assert not len(changed_features(lines((1, A)), lines()))
+
+
+def test_select_features_keeps_layout():
+    buffer = lines((1, A), (2, B), (3, C))
+    selected = select_features(buffer, np.array([True, False, True]))
+    assert selected.feature_ids.tolist() == [1, 3]
+    np.testing.assert_array_equal(selected.coords, A + C)
+    np.testing.assert_array_equal(selected.ring_offsets, [0, 3, 5])
@@ -0,0 +1,57 @@
+import os
+
+from TopoCartGenPlugin.buffers import process_buffer_levels
+from TopoCartGenPlugin.graph_cache import GraphCache, graph_key
+
+from .conftest import assert_buffers_equal
+
+RATIOS = [0.3, 0.7]
+
+
+def test_round_trip_gives_same_result(core, dataset, tmp_path):
+    cache = GraphCache(str(tmp_path))
+    key = graph_key('numpy', dataset)
+    graph = core.Graph()
+    expected = process_buffer_levels(core, graph, dataset, RATIOS)
+    cache.store(key, graph.nodedState())
+
+    noded = cache.load(key)
+    assert noded is not None and cache.hits == 1
+    actual = process_buffer_levels(core, core.Graph(), dataset, RATIOS, noded=noded)
+    for left, right in zip(expected, actual):
+        assert_buffers_equal(left, right)
+
+
+def test_key_depends_on_coordinates_and_frozen(datasets):
+    parcels, roads = datasets['mixed']
+    key = graph_key('numpy', [parcels])
+    assert key == graph_key('numpy', [parcels])
+    assert key != graph_key('numpy', [parcels], [roads])
+    assert key != graph_key('native', [parcels])
+
+
+def test_incomplete_entry_is_a_miss(core, mosaic, tmp_path):
+    cache = GraphCache(str(tmp_path))
+    key = graph_key('numpy', mosaic)
+    graph = core.Graph()
+    graph.processFeatures(mosaic, 0.5)
+    cache.store(key, graph.nodedState())
+    os.remove(os.path.join(cache.path(key), 'ring_closed.npy'))
+
+    assert cache.load(key) is None
+    assert cache.misses == 1
+    # Повреждённая запись удалена и записывается заново
+    assert not os.path.exists(cache.path(key))
+    cache.store(key, graph.nodedState())
+    assert cache.load(key) is not None
+
+
+def test_truncated_array_is_a_miss(core, mosaic, tmp_path):
+    cache = GraphCache(str(tmp_path))
+    key = graph_key('numpy', mosaic)
+    graph = core.Graph()
+    graph.processFeatures(mosaic, 0.5)
+    cache.store(key, graph.nodedState())
+    with open(os.path.join(cache.path(key), 'coords.npy'), 'r+b') as array_file:
+        array_file.truncate(100)
+    assert cache.load(key) is None
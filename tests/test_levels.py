@@ -0,0 +1,31 @@
+import pytest
+
+from .conftest import assert_buffers_equal, extent_of, vertex_total
+
+RATIOS = [0.2, 0.5, 0.9]
+
+
+def test_levels_match_single_runs(core, dataset):
+    levels = core.Graph().processFeatureLevels(dataset, RATIOS)
+    assert len(levels) == len(RATIOS)
+    for ratio, level in zip(RATIOS, levels):
+        assert_buffers_equal(core.Graph().processFeatures(dataset, ratio), level)
+
+
+def test_levels_match_single_runs_with_frozen_and_extent(core, datasets):
+    parcels, roads = datasets['mixed']
+    xmin, ymin, xmax, ymax = extent_of([parcels])
+    extent = (xmin, ymin, (xmin + xmax) / 2, ymax)
+    levels = core.Graph().processFeatureLevels([parcels], RATIOS, [roads], extent)
+    for ratio, level in zip(RATIOS, levels):
+        assert_buffers_equal(core.Graph().processFeatures([parcels], ratio, [roads], extent), level)
+
+
+def test_levels_are_nested(core, dataset):
+    counts = [vertex_total(level) for level in core.Graph().processFeatureLevels(dataset, RATIOS)]
+    assert counts == sorted(counts, reverse=True)
+
+
+@pytest.mark.parametrize('ratio', [0.0, 1.0])
+def test_ratio_bounds(core, dataset, ratio):
+    assert core.Graph().processFeatureLevels(dataset, [ratio])[0][0].feature_count == dataset[0].feature_count
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from .conftest import assert_buffers_equal
+
+
+def noded(core, buffers, strategy):
+    graph = core.Graph()
+    graph.setNodingStrategy(strategy)
+    for buffer in buffers:
+        graph.addFeatures(buffer)
+    graph._build()
+    graph.findAndAddIntersections()
+    return graph
+
+
+def test_sweep_and_batched_give_same_noded_graph(core, dataset):
+    sweep = noded(core, dataset, core.NODING_SWEEP).nodedState()
+    batched = noded(core, dataset, core.NODING_BATCHED).nodedState()
+    assert sweep.keys() == batched.keys()
+    for name in sweep:
+        np.testing.assert_array_equal(sweep[name], batched[name], err_msg=name)
+
+
+@pytest.mark.parametrize('ratio', [0.4, 0.8])
+def test_sweep_and_batched_give_same_result(core, dataset, ratio):
+    results = []
+    for strategy in core.NODING_STRATEGIES:
+        graph = core.Graph()
+        graph.setNodingStrategy(strategy)
+        results.append(graph.processFeatures(dataset, ratio))
+    assert_buffers_equal(*results)
+
+
+def test_unknown_strategy_is_rejected(core):
+    with pytest.raises(ValueError):
+        core.Graph().setNodingStrategy('quadtree')
@@ -0,0 +1,37 @@
+import pytest
+
+from .conftest import assert_buffers_equal, extent_of
+
+
+def simplify(core, buffers, ratios, executor=None, tolerance=None, frozen=(), extent=None):
+    graph = core.Graph()
+    if executor is not None:
+        graph.setExecutor(executor, 4)
+    if tolerance is not None:
+        graph.setStoppingCriteria(tolerance)
+    return graph.processFeatureLevels(buffers, ratios, frozen, extent)
+
+
+@pytest.mark.parametrize('pool', ['thread_pool', 'process_pool'])
+def test_parallel_matches_sequential(core, dataset, pool, request):
+    executor = request.getfixturevalue(pool)
+    expected = simplify(core, dataset, [0.3, 0.8])
+    actual = simplify(core, dataset, [0.3, 0.8], executor)
+    for left, right in zip(expected, actual):
+        assert_buffers_equal(left, right)
+
+
+def test_parallel_matches_sequential_with_tolerance(core, dataset, process_pool):
+    xmin, ymin, xmax, ymax = extent_of(dataset)
+    tolerance = 3e-4 * max(xmax - xmin, ymax - ymin)
+    expected = simplify(core, dataset, [0.9], tolerance=tolerance)
+    actual = simplify(core, dataset, [0.9], process_pool, tolerance)
+    assert_buffers_equal(expected[0], actual[0])
+
+
+def test_parallel_matches_sequential_with_extent(core, dataset, thread_pool):
+    xmin, ymin, xmax, ymax = extent_of(dataset)
+    extent = (xmin, ymin, (xmin + xmax) / 2, (ymin + ymax) / 2)
+    expected = simplify(core, dataset, [0.5], extent=extent)
+    actual = simplify(core, dataset, [0.5], thread_pool, extent=extent)
+    assert_buffers_equal(expected[0], actual[0])
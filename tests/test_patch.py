@@ -0,0 +1,93 @@
+from collections import Counter
+
+import numpy as np
+
+from TopoCartGenPlugin.buffers import FeatureBufferBuilder, LINE, POLYGON, conform_to_targets, select_features
+
+from .conftest import extent_of
+
+# Левый квадрат и правый сосед с общей границей x = 2, на которой лежат три промежуточные вершины
+SHARED = [(2.0, 0.0), (2.0, 0.5), (2.0, 1.0), (2.0, 1.5), (2.0, 2.0)]
+LEFT = [(0.0, 0.0)] + SHARED + [(0.0, 2.0), (0.0, 0.0)]
+RIGHT = SHARED[::-1] + [(4.0, 0.0), (4.0, 2.0), (2.0, 2.0)]
+
+
+def polygons(layer_id, *rings):
+    builder = FeatureBufferBuilder(layer_id, POLYGON)
+    for feature_id, ring in enumerate(rings):
+        builder.add_parts(feature_id, [[np.array(ring, dtype=float)]])
+    return builder.build()
+
+
+def test_shared_vertices_removed_from_target_are_dropped():
+    neighbor = polygons('right', RIGHT)
+    # В целевом слое у соседа на общей границе осталась только средняя вершина
+    target = polygons('right', [(2.0, 2.0), (2.0, 1.0), (2.0, 0.0), (4.0, 0.0), (4.0, 2.0), (2.0, 2.0)])
+    result = conform_to_targets(polygons('left', LEFT), [neighbor], [target])
+    np.testing.assert_array_equal(result.coords, [(0.0, 0.0), (2.0, 0.0), (2.0, 1.0), (2.0, 2.0), (0.0, 2.0), (0.0, 0.0)])
+    np.testing.assert_array_equal(result.ring_offsets, [0, 6])
+
+
+def test_target_only_vertices_are_inserted():
+    neighbor = polygons('right', RIGHT)
+    # Вершина пересечения (2, 0.25), добавленная при упрощении целевого слоя
+    target = polygons('right', [(2.0, 2.0), (2.0, 1.0), (2.0, 0.25), (2.0, 0.0), (4.0, 0.0), (4.0, 2.0), (2.0, 2.0)])
+    result = conform_to_targets(polygons('left', LEFT), [neighbor], [target])
+    np.testing.assert_array_equal(
+        result.coords, [(0.0, 0.0), (2.0, 0.0), (2.0, 0.25), (2.0, 1.0), (2.0, 2.0), (0.0, 2.0), (0.0, 0.0)]
+    )
+
+
+def test_first_vertex_of_polygon_ring_can_be_dropped():
+    neighbor = polygons('right', RIGHT)
+    target = polygons('right', [(2.0, 2.0), (2.0, 0.0), (4.0, 0.0), (4.0, 2.0), (2.0, 2.0)])
+    # Кольцо начинается с общей вершины, которой нет в целевом слое
+    ring = SHARED[1:] + [(0.0, 2.0), (0.0, 0.0), (2.0, 0.0), (2.0, 0.5)]
+    result = conform_to_targets(polygons('left', ring), [neighbor], [target])
+    np.testing.assert_array_equal(result.coords, [(2.0, 2.0), (0.0, 2.0), (0.0, 0.0), (2.0, 0.0), (2.0, 2.0)])
+
+
+def test_degenerate_ring_is_kept():
+    line = FeatureBufferBuilder('line', LINE)
+    line.add_parts(7, [[np.array(SHARED[1:4])]])
+    neighbor = polygons('right', RIGHT)
+    target = polygons('right', [(2.0, 2.0), (2.0, 0.0), (4.0, 0.0), (4.0, 2.0), (2.0, 2.0)])
+    buffer = line.build()
+    result = conform_to_targets(buffer, [neighbor], [target])
+    np.testing.assert_array_equal(result.coords, buffer.coords)
+
+
+def test_without_neighbors_buffer_is_unchanged():
+    buffer = polygons('left', LEFT)
+    assert conform_to_targets(buffer, [], []) is buffer
+
+
+def segment_counts(buffers):
+    counts = Counter()
+    for buffer in buffers:
+        for ring in range(len(buffer.ring_offsets) - 1):
+            coords = buffer.coords[buffer.ring_offsets[ring]:buffer.ring_offsets[ring + 1]]
+            for start, end in zip(map(tuple, coords[:-1]), map(tuple, coords[1:])):
+                counts[tuple(sorted((start, end)))] += 1
+    return counts
+
+
+def test_patched_area_matches_frozen_targets(core, mosaic):
+    # Полигоны в центре мозаики упрощаются заново, соседи берутся из целевого слоя
+    source = mosaic[0]
+    target = core.Graph().processFeatures([source], 0.6)[0]
+    centers = np.array([ring.mean(axis=0) for index in range(source.feature_count) for ring in source.feature_rings(index)])
+    low, high = centers.min(axis=0), centers.max(axis=0)
+    owned = (np.abs(centers - (low + high) / 2) < (high - low) / 5).all(axis=1)
+    neighbors, targets = select_features(source, ~owned), select_features(target, ~owned)
+
+    buffer = conform_to_targets(select_features(source, owned), [neighbors], [targets])
+    patched = core.Graph().processFeatures([buffer], 0.6, [targets])[0]
+
+    xmin, ymin, xmax, ymax = extent_of([source])
+    counts = segment_counts([patched, targets])
+    assert max(counts.values()) == 2
+    for (start, end), count in counts.items():
+        if count == 1:
+            assert any(np.isclose(start[axis], value) and np.isclose(end[axis], value)
+                       for axis, value in ((0, xmin), (0, xmax), (1, ymin), (1, ymax)))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from TopoCartGenPlugin.buffers import LINE
+
+from benchmarks.datasets import _buffer
+
+from .conftest import assert_buffers_equal
+
+
+def random_walk(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Монотонная по x линия без самопересечений: узлы не добавляются
+    coords = np.column_stack([np.arange(count, dtype=float), np.cumsum(rng.normal(size=count))])
+    return [_buffer('walk', LINE, [coords])]
+
+
+def max_displacement(original, simplified):
+    # Наибольшее расстояние от исходной вершины до упрощённой линии
+    points = original[0].coords
+    line = simplified[0].coords
+    start, vector = line[:-1], line[1:] - line[:-1]
+    lengths = np.maximum(np.einsum('ij,ij->i', vector, vector), 1e-300)
+    worst = 0.0
+    for point in points:
+        t = np.clip(np.einsum('ij,ij->i', point - start, vector) / lengths, 0.0, 1.0)
+        worst = max(worst, np.hypot(*(start + t[:, None] * vector - point).T).min())
+    return worst
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 1.0])
+def test_tolerance_bounds_accumulated_displacement(core, tolerance):
+    walk = random_walk(3000)
+    graph = core.Graph()
+    graph.setStoppingCriteria(tolerance)
+    result = graph.processFeatures(walk, 1.0)
+    assert result[0].vertex_count < walk[0].vertex_count
+    assert max_displacement(walk, result) <= tolerance * (1 + 1e-9)
+
+
+def test_without_tolerance_ratio_is_reached(core):
+    walk = random_walk(3000)
+    result = core.Graph().processFeatures(walk, 0.9)
+    assert result[0].vertex_count == pytest.approx(0.1 * walk[0].vertex_count, abs=2)
+
+
+def test_huge_tolerance_does_not_change_result(core, dataset):
+    graph = core.Graph()
+    graph.setStoppingCriteria(1e18)
+    assert_buffers_equal(core.Graph().processFeatures(dataset, 0.6), graph.processFeatures(dataset, 0.6))
+
+
+def test_budget_is_not_overshot_on_shared_arcs(core, dataset):
+    # Вершина общей границы двух полигонов слоя уменьшает слой сразу на две вершины
+    layer = dataset[0]
+    start = int(0.4 * layer.vertex_count)
+    for budget in range(start, start + 6):
+        graph = core.Graph()
+        graph.setStoppingCriteria(budgets={layer.layer_id: budget})
+        count = graph.processFeatures(dataset, 1.0)[0].vertex_count
+        assert budget <= count <= budget + 1
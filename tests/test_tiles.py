@@ -0,0 +1,117 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from TopoCartGenPlugin.buffers import select_features
+from TopoCartGenPlugin.tiles import TileGrid, TileStitcher
+
+from .conftest import extent_of, vertex_total
+
+RATIOS = [0.3, 0.7]
+
+
+def feature_bounds(buffer):
+    starts = buffer.ring_offsets[buffer.part_offsets[buffer.feature_offsets]]
+    return (np.minimum.reduceat(buffer.coords, starts[:-1], axis=0),
+            np.maximum.reduceat(buffer.coords, starts[:-1], axis=0))
+
+
+def run_tiled(core, buffers, tile_size, ratios):
+    # Повторяет обход тайлов processTiles без QGIS: объекты, охват которых задевает тайл,
+    # упрощаются в нём, остальные пересекающие тайл объекты закреплены
+    grid = TileGrid(*extent_of(buffers), tile_size)
+    stitcher = TileStitcher(grid, len(ratios))
+    output = [[] for _ in ratios]
+    for tile in range(grid.count):
+        xmin, ymin, xmax, ymax = rect = grid.rect(tile)
+        owned, frozen = [], []
+        for buffer in buffers:
+            lower, upper = feature_bounds(buffer)
+            hit = (lower[:, 0] <= xmax) & (upper[:, 0] >= xmin) & (lower[:, 1] <= ymax) & (upper[:, 1] >= ymin)
+            covered = np.array([grid.covers(tile, *low, *high) for low, high in zip(lower, upper)], dtype=bool)
+            if (hit & covered).any():
+                owned.append(select_features(buffer, hit & covered))
+            if (hit & ~covered).any():
+                frozen.append(select_features(buffer, hit & ~covered))
+        if owned:
+            levels = core.Graph().processFeatureLevels(owned, ratios, frozen, rect)
+            for result, local in zip(output, stitcher.add(tile, owned, levels)[1]):
+                result.extend(local)
+        for result, stitched in zip(output, stitcher.finish(tile)[1]):
+            result.extend(stitched)
+    for result, stitched in zip(output, stitcher.finish()[1]):
+        result.extend(stitched)
+    return output, stitcher
+
+
+def segment_counts(buffers):
+    counts = Counter()
+    for buffer in buffers:
+        for ring in range(len(buffer.ring_offsets) - 1):
+            coords = buffer.coords[buffer.ring_offsets[ring]:buffer.ring_offsets[ring + 1]]
+            for start, end in zip(map(tuple, coords[:-1]), map(tuple, coords[1:])):
+                counts[tuple(sorted((start, end)))] += 1
+    return counts
+
+
+def crossing_count(core, buffers):
+    graph = core.Graph()
+    for buffer in buffers:
+        graph.addFeatures(buffer)
+    return graph.findAndAddIntersections()
+
+
+@pytest.fixture(scope='module')
+def tiled_mosaic(datasets):
+    from TopoCartGenPlugin import numpy_core
+    mosaic = datasets['polygon_mosaic']
+    xmin, ymin, xmax, ymax = extent_of(mosaic)
+    return run_tiled(numpy_core, mosaic, max(xmax - xmin, ymax - ymin) / 3.3, RATIOS)
+
+
+def test_grid_assigns_boundary_vertices():
+    grid = TileGrid(0.0, 0.0, 10.0, 5.0, 4.0)
+    assert (grid.columns, grid.rows, grid.count) == (3, 2, 6)
+    assert grid.tile_of(4.0, 0.0) == 1
+    assert grid.tile_of(10.0, 5.0) == 5
+    coords = np.array([[0.0, 0.0], [4.0, 4.0], [10.0, 5.0], [-1.0, 7.0]])
+    np.testing.assert_array_equal(grid.tile_indices(coords), [0, 4, 5, 3])
+    assert grid.rect(4) == (4.0, 4.0, 8.0, 8.0)
+    assert grid.covers(4, 1.0, 1.0, 5.0, 4.5)
+    assert not grid.covers(2, 1.0, 1.0, 5.0, 4.5)
+
+
+def test_every_feature_is_written_once(mosaic, tiled_mosaic):
+    output, stitcher = tiled_mosaic
+    assert stitcher.stitched_count > 0
+    assert not stitcher.pending
+    for level in output:
+        ids = np.concatenate([buffer.feature_ids for buffer in level])
+        assert sorted(ids.tolist()) == sorted(mosaic[0].feature_ids.tolist())
+
+
+def test_shared_boundaries_stay_shared(mosaic, tiled_mosaic):
+    output, _ = tiled_mosaic
+    xmin, ymin, xmax, ymax = extent_of(mosaic)
+    for level in output:
+        counts = segment_counts(level)
+        assert max(counts.values()) == 2
+        # Отрезок без соседа допустим только на внешней границе мозаики
+        for (start, end), count in counts.items():
+            if count == 1:
+                assert any(np.isclose(start[axis], value) and np.isclose(end[axis], value)
+                           for axis, value in ((0, xmin), (0, xmax), (1, ymin), (1, ymax)))
+
+
+def test_stitching_adds_no_crossings(core, tiled_mosaic):
+    output, _ = tiled_mosaic
+    for level in output:
+        assert crossing_count(core, level) == 0
+
+
+def test_tiled_ratio_is_close_to_full_run(core, mosaic, tiled_mosaic):
+    output, _ = tiled_mosaic
+    full = core.Graph().processFeatureLevels(mosaic, RATIOS)
+    for tiled_level, full_level in zip(output, full):
+        assert vertex_total(tiled_level) == pytest.approx(vertex_total(full_level), rel=0.1)